@@ -1,38 +1,172 @@
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import asyncio
 import base64
 import hashlib
+import hmac
 import os
-from typing import Optional
+import re
+from typing import List, Optional, Sequence, Tuple, Union
+
+
+Ciphertext = Union[bytes, str]
+
+# формат компактного шифротекста: версия | id ключа | nonce | AES-GCM (данные + тег)
+FORMAT_AES_GCM = 0x01
+NONCE_SIZE = 12
 
 
 class DataEncryption:
-    """Шифрование ПД и хеширование email"""
+    """
+    Шифрование ПД и хеширование email.
+    Новые значения шифруются AES-GCM в компактный бинарный формат (хранится в BYTEA),
+    старые Fernet-токены по-прежнему читаются и перешифровываются app.infra.key_rotation.
+    """
 
     def __init__(self):
         secret_key = os.getenv('ENCRYPTION_KEY', 'stroimagencryptkey')
+        # старые ключи через запятую, от новых к старым: ими только расшифровываем
+        old_keys = [key.strip() for key in os.getenv('ENCRYPTION_OLD_KEYS', '').split(',') if key.strip()]
+        secret_keys = [secret_key, *old_keys]
+
+        self.fernet = MultiFernet([self._make_fernet(key) for key in secret_keys])
+        self.aead_keys = [self._make_aead_key(key) for key in secret_keys]
+        self.primary_key_id, self.primary_aead = self.aead_keys[0]
+        # id ключа - один байт в шифротексте: если два разных ключа получили один id,
+        # needs_rotation не отличит старые значения от новых и ротация их пропустит
+        key_ids = {}
+        for key, (key_id, _) in zip(secret_keys, self.aead_keys):
+            if key_ids.setdefault(key_id, key) != key:
+                raise RuntimeError(
+                    f"Два ключа из ENCRYPTION_KEY и ENCRYPTION_OLD_KEYS получили один id {key_id}, "
+                    "задайте другой ENCRYPTION_KEY"
+                )
+
+        # ключ слепых индексов задается отдельно и не меняется при ротации ENCRYPTION_KEY,
+        # иначе вход, проверка дублей и поиск по email_hash/phone_hash перестанут находить людей
+        blind_index_key = os.getenv('BLIND_INDEX_KEY')
+        if not blind_index_key:
+            raise RuntimeError("Не задан BLIND_INDEX_KEY")
+        self.blind_index_key = hashlib.sha256(b"blind-index:" + blind_index_key.encode()).digest()
+
+    @staticmethod
+    def _make_fernet(secret_key: str) -> Fernet:
         key_bytes = hashlib.sha256(secret_key.encode()).digest()
-        self.fernet = Fernet(base64.urlsafe_b64encode(key_bytes))
+        return Fernet(base64.urlsafe_b64encode(key_bytes))
+
+    @staticmethod
+    def _make_aead_key(secret_key: str) -> Tuple[int, AESGCM]:
+        # отдельный ключ для AES-GCM, чтобы не переиспользовать ключ Fernet
+        key_bytes = hashlib.sha256(b"aes-gcm:" + secret_key.encode()).digest()
+        key_id = hashlib.sha256(b"key-id:" + key_bytes).digest()[0]
+        return key_id, AESGCM(key_bytes)
 
-    def encrypt(self, data: str) -> str:
+    @staticmethod
+    def _as_bytes(encrypted_data: Ciphertext) -> bytes:
+        return encrypted_data.encode() if isinstance(encrypted_data, str) else bytes(encrypted_data)
+
+    def encrypt(self, data: str) -> bytes:
         if data is None:
             return None
-        encrypted = self.fernet.encrypt(data.encode())
-        return encrypted.decode('utf-8')
+        nonce = os.urandom(NONCE_SIZE)
+        header = bytes((FORMAT_AES_GCM, self.primary_key_id))
+        return header + nonce + self.primary_aead.encrypt(nonce, data.encode(), header)
+
+    def _decrypt_strict(self, encrypted_data: Ciphertext) -> str:
+        token = self._as_bytes(encrypted_data)
+        if token[:1] != bytes((FORMAT_AES_GCM,)):
+            return self.fernet.decrypt(token).decode('utf-8')
+
+        header, nonce, payload = token[:2], token[2:2 + NONCE_SIZE], token[2 + NONCE_SIZE:]
+        for key_id, aead in self.aead_keys:
+            if key_id != token[1]:
+                continue
+            try:
+                return aead.decrypt(nonce, payload, header).decode('utf-8')
+            except InvalidTag:
+                continue
+        raise InvalidToken
 
-    def decrypt(self, encrypted_data: str) -> Optional[str]:
+    def decrypt(self, encrypted_data: Optional[Ciphertext]) -> Optional[str]:
         if encrypted_data is None:
             return None
         try:
-            decrypted = self.fernet.decrypt(encrypted_data.encode())
-            return decrypted.decode('utf-8')
+            return self._decrypt_strict(encrypted_data)
         except Exception:
             return None
 
+    def needs_rotation(self, encrypted_data: Optional[Ciphertext]) -> bool:
+        """True для Fernet-токенов и AES-GCM значений, зашифрованных не текущим ключом"""
+        if not encrypted_data:
+            return False
+        token = self._as_bytes(encrypted_data)
+        return token[0] != FORMAT_AES_GCM or token[1] != self.primary_key_id
+
+    def rotate(self, encrypted_data: Optional[Ciphertext]) -> Optional[bytes]:
+        """Перешифровывает значение текущим ключом; InvalidToken, если ни один ключ не подошел"""
+        if encrypted_data is None:
+            return None
+        return self.encrypt(self._decrypt_strict(encrypted_data))
+
+    def decrypt_many(self, encrypted_values: Sequence[Optional[Ciphertext]]) -> List[Optional[str]]:
+        return [self.decrypt(value) if value else None for value in encrypted_values]
+
+    async def decrypt_many_async(
+            self,
+            encrypted_values: Sequence[Optional[Ciphertext]],
+            chunk_size: int = 256
+    ) -> List[Optional[str]]:
+        """
+        Расшифровывает пачку значений в пуле потоков, не блокируя event loop.
+        Значения режутся на чанки, чанки расшифровываются параллельно.
+        """
+        if not encrypted_values:
+            return []
+
+        loop = asyncio.get_running_loop()
+        chunks = [
+            encrypted_values[start:start + chunk_size]
+            for start in range(0, len(encrypted_values), chunk_size)
+        ]
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, self.decrypt_many, chunk) for chunk in chunks)
+        )
+        return [value for chunk in results for value in chunk]
+
+    def blind_index(self, value: str) -> str:
+        """HMAC-SHA256 для точного поиска по зашифрованным полям через B-tree индекс"""
+        return hmac.new(self.blind_index_key, value.encode(), hashlib.sha256).hexdigest()
+
     def hash_email(self, email: str) -> str:
+        if not email:
+            return None
+        normalized_email = email.lower().strip()
+        return self.blind_index(f"email:{normalized_email}")
+
+    @staticmethod
+    def legacy_hash_email(email: str) -> Optional[str]:
+        """Старый хеш email без ключа; нужен, пока не отработал app.infra.blind_index_backfill"""
         if not email:
             return None
         normalized_email = email.lower().strip()
         return hashlib.sha256(normalized_email.encode()).hexdigest()
 
+    @staticmethod
+    def normalize_phone(phone: Optional[str]) -> Optional[str]:
+        if not phone:
+            return None
+        digits = re.sub(r'\D', '', phone)
+        if len(digits) == 10:
+            digits = f"7{digits}"
+        elif len(digits) == 11 and digits.startswith('8'):
+            digits = f"7{digits[1:]}"
+        return digits or None
+
+    def hash_phone(self, phone: Optional[str]) -> Optional[str]:
+        normalized_phone = self.normalize_phone(phone)
+        if not normalized_phone:
+            return None
+        return self.blind_index(f"phone:{normalized_phone}")
 
 encryption_service = DataEncryption()
@@ -1,4 +1,12 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Optional
+from uuid import uuid4
 from jose import jwt
 import bcrypt
 from starlette.responses import Response
@@ -25,14 +33,83 @@ def verify_password(password: str, password_hash: str) -> bool:
         return False
 
 
-def create_access_token(user_id: int, role: str, expires_minutes: int = 120) -> str:
+def create_access_token(user_id: int, role: str, expires_minutes: int | None = None) -> str:
+    if expires_minutes is None:
+        expires_minutes = settings.ACCESS_TOKEN_EXPIRE_MINUTES
     exp = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
-    payload = {"sub": str(user_id), "role": role, "exp": exp}
+    payload = {"sub": str(user_id), "role": role, "exp": exp, "jti": uuid4().hex}
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
 
+class DecodedTokenCache:
+    """
+    LRU-кеш проверенных JWT: токен -> claims до момента exp.
+    Повторные запросы с тем же cookie не проверяют подпись и не парсят JSON заново.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        item = self._items.get(token)
+        if item is None:
+            return None
+        exp, claims = item
+        if exp <= time.time():
+            self._items.pop(token, None)
+            return None
+        self._items.move_to_end(token)
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        exp = claims.get("exp")
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)):
+            return
+        self._items[token] = (exp, claims)
+        self._items.move_to_end(token)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+decoded_token_cache = DecodedTokenCache(settings.JWT_CACHE_SIZE)
+
+
 def decode_access_token(token: str) -> dict:
-    return jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+    claims = decoded_token_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        decoded_token_cache.put(token, claims)
+    return dict(claims)
+
+
+def generate_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+_refresh_successor_key = hashlib.sha256(b"refresh-successor:" + settings.JWT_SECRET.encode("utf-8")).digest()
+
+
+def successor_refresh_token(token: str) -> str:
+    """
+    Токен, который заменяет token при ротации. Он выводится из старого, а не
+    генерируется заново: параллельный запрос со старым токеном получит того же
+    преемника (в БД хранятся только хеши, отдать сохраненный нельзя).
+    """
+    digest = hmac.new(_refresh_successor_key, token.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def hash_refresh_token(token: str) -> str:
+    # refresh-токен случайный (256 бит), поэтому медленный хеш не нужен:
+    # в БД хранится только sha256, поиск идет по индексу
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
 
 def set_auth_cookie(resp: Response, token: str) -> None:
@@ -40,6 +117,18 @@ def set_auth_cookie(resp: Response, token: str) -> None:
         key=settings.AUTH_COOKIE_NAME,
         value=token,
         httponly=True,
+        max_age=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        samesite="lax",
+        path="/",
+    )
+
+
+def set_refresh_cookie(resp: Response, token: str) -> None:
+    resp.set_cookie(
+        key=settings.REFRESH_COOKIE_NAME,
+        value=token,
+        httponly=True,
+        max_age=settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
         samesite="lax",
         path="/",
     )
@@ -47,3 +136,4 @@ def set_auth_cookie(resp: Response, token: str) -> None:
 
 def clear_auth_cookie(resp: Response) -> None:
     resp.delete_cookie(settings.AUTH_COOKIE_NAME, path="/")
+    resp.delete_cookie(settings.REFRESH_COOKIE_NAME, path="/")
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,14 +12,50 @@ class Settings(BaseSettings):
 
     # DB
     DATABASE_URL: str
+    MIGRATION_BATCH_SIZE: int = 5000
+    # пул соединений одного процесса; у N воркеров до N * (size + overflow) соединений
+    DB_POOL_SIZE: int = 5
+    DB_POOL_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    # always - SELECT 1 при каждой выдаче, idle - только после простоя, never - без проверки
+    DB_POOL_PRE_PING: Literal["always", "idle", "never"] = "idle"
+    DB_POOL_PRE_PING_IDLE_SECONDS: float = 30.0
+    # токен для /internal/metrics; без него эндпоинт выключен
+    METRICS_TOKEN: str | None = None
 
     # Auth
     JWT_SECRET: str
     JWT_ALGORITHM: str
     AUTH_COOKIE_NAME: str = "access_token"
+    REFRESH_COOKIE_NAME: str = "refresh_token"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 120
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # сколько секунд после ротации старый refresh-токен еще отдает уже выданного преемника
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS: int = 30
+    JWT_CACHE_SIZE: int = 4096
+    REVOCATION_SYNC_SECONDS: float = 5.0
 
     # Encryption
     ENCRYPTION_KEY: str
+    ENCRYPTION_OLD_KEYS: str = ""
+    BLIND_INDEX_KEY: str
+    KEY_ROTATION_BATCH_SIZE: int = 500
+    KEY_ROTATION_ROWS_PER_SECOND: int = 2000
+
+    # Cart
+    GUEST_CART_COOKIE_NAME: str = "guest_cart"
+    GUEST_CART_MAX_AGE_DAYS: int = 14
+    GUEST_CART_MAX_ITEMS: int = 100
+    RESERVATION_TTL_MINUTES: int = 30
+    RESERVATION_SWEEP_SECONDS: float = 60.0
+    RESERVATION_SWEEP_BATCH_SIZE: int = 1000
+
+    # Orders
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+    ORDER_HISTORY_PAGE_SIZE: int = 20
+    STAFF_ORDERS_PAGE_SIZE: int = 50
 
     # Paths
     MEDIA_ROOT: str = "media"
@@ -30,6 +68,15 @@ class Settings(BaseSettings):
     SMTP_USER: str | None = None
     SMTP_PASSWORD: str | None = None
     SMTP_FROM: str = "no-reply@example.com"
+    SMTP_STARTTLS: bool = True
+    SMTP_TIMEOUT_SECONDS: float = 30.0
+
+    # Outbox
+    OUTBOX_POLL_SECONDS: float = 5.0
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BASE_SECONDS: int = 30
+    OUTBOX_RETRY_MAX_SECONDS: int = 3600
 
 
 settings = Settings()
\ No newline at end of file
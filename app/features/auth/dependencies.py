@@ -1,34 +1,76 @@
 from typing import Optional
-from fastapi import Depends, HTTPException, status, Cookie
+from fastapi import Depends, HTTPException, status, Cookie, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from jose import JWTError
-from app.core.security import decode_access_token
+from jose import JWTError, ExpiredSignatureError
+from app.core.security import decode_access_token, create_access_token
+from app.core.settings import settings
+from app.features.auth.revocation import revocation_list
+from app.features.auth.service import auth_service
 from app.models.user import User, UserRole
 from app.infra.db import get_db
 
 
+async def refresh_session(
+        request: Optional[Request],
+        refresh_token: Optional[str],
+        db: AsyncSession
+) -> Optional[User]:
+    """
+    Тихо перевыпускает access-токен по refresh-cookie.
+    Новые токены кладутся в request.state, cookie выставляет middleware в app.main.
+    """
+    if not refresh_token:
+        return None
+
+    if request is not None:
+        refreshed_user = getattr(request.state, "refreshed_user", None)
+        if refreshed_user is not None:
+            return refreshed_user
+
+    rotated = await auth_service.rotate_refresh_token(db, refresh_token)
+    if not rotated:
+        return None
+
+    user, new_refresh_token = rotated
+    if request is not None:
+        request.state.refreshed_user = user
+        request.state.reissued_tokens = (
+            create_access_token(user_id=user.user_id, role=user.role.value),
+            new_refresh_token
+        )
+    return user
+
+
 async def get_current_user(
         access_token: Optional[str] = Cookie(None, alias="access_token"),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_db),
+        refresh_token: Optional[str] = Cookie(None, alias=settings.REFRESH_COOKIE_NAME),
+        request: Request = None
 ) -> User:
-    if not access_token:
+    if access_token:
+        try:
+            payload = decode_access_token(access_token)
+            user_id = payload.get("sub")
+            if not user_id or revocation_list.is_revoked(payload.get("jti")):
+                raise HTTPException(status_code=401, detail="Неверный токен")
+            result = await db.execute(select(User).where(User.user_id == int(user_id)))
+            user = result.scalar_one_or_none()
+            if not user:
+                raise HTTPException(status_code=401, detail="Пользователь не найден")
+            return user
+        except ExpiredSignatureError:
+            pass
+        except (JWTError, ValueError, AttributeError):
+            raise HTTPException(status_code=401, detail="Неверный токен")
+
+    user = await refresh_session(request, refresh_token, db)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Необходима авторизация",
         )
-    try:
-        payload = decode_access_token(access_token)
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Неверный токен")
-        result = await db.execute(select(User).where(User.user_id == int(user_id)))
-        user = result.scalar_one_or_none()
-        if not user:
-            raise HTTPException(status_code=401, detail="Пользователь не найден")
-        return user
-    except (JWTError, ValueError, AttributeError):
-        raise HTTPException(status_code=401, detail="Неверный токен")
+    return user
 
 
 async def get_current_active_user(
@@ -57,16 +99,21 @@ get_current_staff = require_role(UserRole.STAFF)
 
 async def get_optional_user(
         access_token: Optional[str] = Cookie(None, alias="access_token"),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_db),
+        refresh_token: Optional[str] = Cookie(None, alias=settings.REFRESH_COOKIE_NAME),
+        request: Request = None
 ) -> Optional[User]:
-    if not access_token:
-        return None
-    try:
-        payload = decode_access_token(access_token)
-        user_id = payload.get("sub")
-        if not user_id:
+    if access_token:
+        try:
+            payload = decode_access_token(access_token)
+            user_id = payload.get("sub")
+            if not user_id or revocation_list.is_revoked(payload.get("jti")):
+                return None
+            result = await db.execute(select(User).where(User.user_id == int(user_id)))
+            return result.scalar_one_or_none()
+        except ExpiredSignatureError:
+            pass
+        except (JWTError, ValueError, AttributeError):
             return None
-        result = await db.execute(select(User).where(User.user_id == int(user_id)))
-        return result.scalar_one_or_none()
-    except (JWTError, ValueError, AttributeError):
-        return None
+
+    return await refresh_session(request, refresh_token, db)
@@ -3,7 +3,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import HTMLResponse, RedirectResponse
 from app.infra.templates import templates
 from app.infra.db import get_db
-from app.core.security import create_access_token
+from app.core.security import create_access_token, set_auth_cookie, set_refresh_cookie
+from app.features.auth.service import auth_service
+from app.features.cart.router import merge_guest_cart
 
 router = APIRouter(prefix="/auth", tags=["authentication-forms"])
 
@@ -48,21 +50,16 @@ async def register_redirect(
 
         access_token = create_access_token(
             user_id=user_profile.user_id,
-            role=user_profile.role,
-            expires_minutes=120
+            role=user_profile.role
         )
 
         response = RedirectResponse(
             url="/products/catalog",
             status_code=303
         )
-        response.set_cookie(
-            key="access_token",
-            value=access_token,
-            httponly=True,
-            max_age=120 * 60,
-            samesite="lax"
-        )
+        set_auth_cookie(response, access_token)
+        set_refresh_cookie(response, await auth_service.issue_refresh_token(db, user_profile.user_id))
+        await merge_guest_cart(request, response, db, user_profile.user_id)
         return response
 
     except Exception as e:
@@ -80,6 +77,7 @@ async def register_redirect(
 
 @router.post("/login/redirect", response_class=RedirectResponse)
 async def login_redirect(
+        request: Request,
         email: str = Form(),
         password: str = Form(),
         db: AsyncSession = Depends(get_db)
@@ -95,14 +93,9 @@ async def login_redirect(
             url="/products/catalog",
             status_code=303
         )
-        response.set_cookie(
-            key="access_token",
-            value=token_data.access_token,
-            httponly=True,
-            max_age=120 * 60,
-            samesite="lax",
-            path="/"
-        )
+        set_auth_cookie(response, token_data.access_token)
+        set_refresh_cookie(response, await auth_service.issue_refresh_token(db, token_data.user_id))
+        await merge_guest_cart(request, response, db, token_data.user_id)
         return response
 
     except Exception as e:
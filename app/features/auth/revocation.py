@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.models.revoked_token import RevokedToken
+
+log = logging.getLogger(__name__)
+
+# запас на транзакции, закоммиченные позже чем стоит их revoked_at
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class TokenRevocationList:
+    """
+    Список отозванных access-токенов (jti).
+    Хранится в таблице revoked_tokens, каждый воркер держит копию в памяти
+    и догружает только новые записи, поэтому проверка на запросе - поиск в dict без SQL.
+    """
+
+    def __init__(self):
+        self._revoked: dict[str, float] = {}
+        self._synced_until: Optional[datetime] = None
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._revoked
+
+    async def revoke(self, db: AsyncSession, jti: str, expires_at: datetime) -> None:
+        stmt = (
+            insert(RevokedToken)
+            .values(jti=jti, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+        )
+        await db.execute(stmt)
+        await db.commit()
+        self._revoked[jti] = expires_at.timestamp()
+
+    async def sync(self, db: AsyncSession) -> int:
+        """Догружает записи, отозванные с прошлой синхронизации (в первый раз - все активные)"""
+        stmt = select(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at).where(
+            RevokedToken.expires_at > func.now()
+        )
+        if self._synced_until is not None:
+            stmt = stmt.where(RevokedToken.revoked_at > self._synced_until - SYNC_OVERLAP)
+
+        rows = (await db.execute(stmt)).all()
+        for jti, expires_at, revoked_at in rows:
+            self._revoked[jti] = expires_at.timestamp()
+            if self._synced_until is None or revoked_at > self._synced_until:
+                self._synced_until = revoked_at
+
+        self._prune()
+        return len(rows)
+
+    async def purge_expired(self, db: AsyncSession) -> None:
+        """Истекшие токены и так невалидны, хранить их не нужно"""
+        await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= func.now()))
+        await db.commit()
+
+    async def run(self, session_factory: async_sessionmaker, interval: float) -> None:
+        async with session_factory() as db:
+            try:
+                await self.purge_expired(db)
+            except Exception:
+                log.exception("Не удалось очистить revoked_tokens")
+
+        while True:
+            try:
+                async with session_factory() as db:
+                    await self.sync(db)
+            except Exception:
+                log.exception("Ошибка синхронизации списка отозванных токенов")
+            await asyncio.sleep(interval)
+
+    def clear(self) -> None:
+        self._revoked.clear()
+        self._synced_until = None
+
+    def _prune(self) -> None:
+        now = datetime.now(timezone.utc).timestamp()
+        expired = [jti for jti, exp in self._revoked.items() if exp <= now]
+        for jti in expired:
+            del self._revoked[jti]
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+revocation_list = TokenRevocationList()
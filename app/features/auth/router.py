@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status, Cookie, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import exists, literal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from pydantic import ValidationError
 
-from app.core.security import create_access_token, hash_password
+from app.core.security import create_access_token, hash_password, set_auth_cookie, set_refresh_cookie
+from app.core.encryption import encryption_service
+from app.core.settings import settings
 from app.features.auth.service import auth_service
 from app.features.auth.schemas import Token, UserLogin
 from app.features.users.schemas import UserCreate, UserProfile
@@ -63,13 +69,6 @@ async def register(
         user_data: UserCreate,
         db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(User).where(User.email == user_data.email))
-    if result.scalar_one_or_none():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Пользователь с таким email уже существует"
-        )
-
     hashed_password = hash_password(user_data.password)
 
     user = User.create_with_encryption(
@@ -82,11 +81,33 @@ async def register(
         role=UserRole(user_data.role)
     )
 
+    # проверка дубликата и вставка - один INSERT ... SELECT ... ON CONFLICT по уникальному
+    # email_hash, без отдельного SELECT и без гонки между параллельными регистрациями.
+    # ON CONFLICT видит только новый хеш, поэтому NOT EXISTS дополнительно ищет
+    # пользователей со старым хешем без ключа, еще не пересчитанных blind_index_backfill
+    columns = [
+        column for column in User.__table__.columns
+        if getattr(user, column.key) is not None
+    ]
+    email_hashes = [user.email_hash, encryption_service.legacy_hash_email(user_data.email)]
+    stmt = (
+        insert(User)
+        .from_select(
+            [column.key for column in columns],
+            select(*[literal(getattr(user, column.key), column.type) for column in columns])
+            .where(~exists().where(User.email_hash.in_(email_hashes)))
+        )
+        .on_conflict_do_nothing(index_elements=[User.email_hash])
+        .returning(User)
+    )
+
     try:
-        db.add(user)
-        await db.commit()
-        await db.refresh(user)
-        return UserProfile.model_validate(user)
+        result = await db.execute(stmt)
+        created_user = result.scalar_one_or_none()
+        if created_user is None:
+            await db.rollback()
+        else:
+            await db.commit()
     except IntegrityError:
         await db.rollback()
         raise HTTPException(
@@ -101,6 +122,14 @@ async def register(
             detail="Ошибка при регистрации"
         )
 
+    if created_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Пользователь с таким email уже существует"
+        )
+
+    return UserProfile.model_validate(created_user)
+
 
 @router.post("/register/form-data", response_model=UserProfile)
 async def register_from_form_data(
@@ -209,7 +238,10 @@ async def login_json(
 async def verify_token(token: str = Depends(oauth2_scheme)):
     try:
         from app.core.security import decode_access_token
+        from app.features.auth.revocation import revocation_list
         payload = decode_access_token(token)
+        if revocation_list.is_revoked(payload.get("jti")):
+            return {"valid": False}
         return {
             "valid": True,
             "user_id": int(payload.get("sub")),
@@ -221,46 +253,34 @@ async def verify_token(token: str = Depends(oauth2_scheme)):
 
 @router.post("/refresh-token", response_model=Token)
 async def refresh_token(
-        token: str,
+        response: Response,
+        refresh_token: Optional[str] = Cookie(None, alias=settings.REFRESH_COOKIE_NAME),
         db: AsyncSession = Depends(get_db)
 ):
-    try:
-        from app.core.security import decode_access_token
-        payload = decode_access_token(token)
-        user_id = int(payload.get("sub"))
-        role = payload.get("role")
-
-        if not user_id or not role:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Неверный токен"
-            )
-
-        result = await db.execute(
-            select(User).where(User.user_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Пользователь не найден"
-            )
-
-        access_token = create_access_token(
-            user_id=user.user_id,
-            role=user.role.value,
-            expires_minutes=120
+    if not refresh_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Неверный или истекший токен"
         )
 
-        return Token(
-            access_token=access_token,
-            token_type="bearer",
-            user_id=user.user_id,
-            role=user.role.value
-        )
-    except Exception:
+    rotated = await auth_service.rotate_refresh_token(db, refresh_token)
+    if not rotated:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный или истекший токен"
         )
+
+    user, new_refresh_token = rotated
+    access_token = create_access_token(
+        user_id=user.user_id,
+        role=user.role.value
+    )
+    set_auth_cookie(response, access_token)
+    set_refresh_cookie(response, new_refresh_token)
+
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user_id=user.user_id,
+        role=user.role.value
+    )
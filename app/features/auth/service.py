@@ -1,8 +1,19 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import func, update
+from sqlalchemy.orm import aliased
 from fastapi import HTTPException, status
-from app.core.security import verify_password
+from jose import JWTError
+from app.core.security import (
+    verify_password, generate_refresh_token, hash_refresh_token, decode_access_token, successor_refresh_token
+)
 from app.core.encryption import encryption_service
+from app.core.settings import settings
+from app.features.auth.revocation import revocation_list
+from app.models.refresh_token import RefreshToken
 from app.models.user import User
 
 class AuthService:
@@ -13,7 +24,10 @@ class AuthService:
             password: str
     ):
         email_hash = encryption_service.hash_email(email)
-        result = await db.execute(select(User).where(User.email_hash == email_hash))
+        legacy_email_hash = encryption_service.legacy_hash_email(email)
+        result = await db.execute(
+            select(User).where(User.email_hash.in_([email_hash, legacy_email_hash])).limit(1)
+        )
         user = result.scalar_one_or_none()
 
         if not user:
@@ -28,6 +42,99 @@ class AuthService:
                 detail="Неверный email или пароль"
             )
 
+        if user.email_hash != email_hash:
+            # запись еще не пересчитана app.infra.blind_index_backfill
+            user.email_hash = email_hash
+            user.phone_hash = encryption_service.hash_phone(user.phone)
+            await db.commit()
+
         return user
 
+    async def issue_refresh_token(self, db: AsyncSession, user_id: int, token: Optional[str] = None) -> str:
+        """Создает refresh-токен (или сохраняет переданный); в БД сохраняется только его хеш"""
+        token = token or generate_refresh_token()
+        db.add(RefreshToken(
+            user_id=user_id,
+            token_hash=hash_refresh_token(token),
+            expires_at=datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        ))
+        await db.commit()
+        return token
+
+    async def rotate_refresh_token(
+            self,
+            db: AsyncSession,
+            token: str
+    ) -> Optional[Tuple[User, str]]:
+        """
+        Гасит refresh-токен и выдает новый.
+        Погашение и загрузка пользователя - один UPDATE ... FROM users RETURNING
+        по индексу token_hash, без проверки пароля.
+
+        Страница после истечения access-токена шлет несколько запросов с одним
+        и тем же refresh-cookie. Параллельный UPDATE ждет коммита первого на
+        блокировке строки и ничего не находит; тогда, если токен погашен не
+        раньше REFRESH_TOKEN_REUSE_GRACE_SECONDS назад и его преемник еще
+        действует, запрос получает того же преемника, а не выход из аккаунта.
+        """
+        token_hash = hash_refresh_token(token)
+        new_token = successor_refresh_token(token)
+        stmt = (
+            update(RefreshToken)
+            .where(
+                RefreshToken.token_hash == token_hash,
+                RefreshToken.revoked_at.is_(None),
+                RefreshToken.expires_at > func.now(),
+                RefreshToken.user_id == User.user_id
+            )
+            .values(revoked_at=func.now())
+            .returning(User)
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.execute(select(User).from_statement(stmt))
+        user = result.scalar_one_or_none()
+        if user:
+            return user, await self.issue_refresh_token(db, user.user_id, new_token)
+
+        successor = aliased(RefreshToken)
+        result = await db.execute(
+            select(User)
+            .join(RefreshToken, RefreshToken.user_id == User.user_id)
+            .join(successor, successor.user_id == User.user_id)
+            .where(
+                RefreshToken.token_hash == token_hash,
+                RefreshToken.revoked_at > func.now() - timedelta(seconds=settings.REFRESH_TOKEN_REUSE_GRACE_SECONDS),
+                successor.token_hash == hash_refresh_token(new_token),
+                successor.revoked_at.is_(None),
+                successor.expires_at > func.now(),
+            )
+        )
+        user = result.scalar_one_or_none()
+        if not user:
+            return None
+        return user, new_token
+
+    async def revoke_refresh_token(self, db: AsyncSession, token: str) -> None:
+        await db.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.token_hash == hash_refresh_token(token),
+                RefreshToken.revoked_at.is_(None)
+            )
+            .values(revoked_at=func.now())
+        )
+        await db.commit()
+
+    async def revoke_access_token(self, db: AsyncSession, token: str) -> None:
+        try:
+            payload = decode_access_token(token)
+        except JWTError:
+            return
+
+        jti = payload.get("jti")
+        if not jti:
+            return
+        expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+        await revocation_list.revoke(db, jti, expires_at)
+
 auth_service = AuthService()
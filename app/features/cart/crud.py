@@ -1,10 +1,14 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Integer, Row, column, delete, func, literal, select, true, update, values
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 from app.models.cart import Cart
 from app.models.cart_item import CartItem
-from app.features.cart.schemas import CartItemCreate, CartItemUpdate
+from app.models.product import Product
+from app.features.cart.reservations import stock_reservations
+from app.features.cart.schemas import CartBatchOperation, CartItemCreate, CartItemUpdate
 
 
 class CartCRUD:
@@ -19,97 +23,274 @@ class CartCRUD:
             await db.commit()
         return cart
 
+    @staticmethod
+    def _user_cart_id(user_id: int):
+        return select(Cart.cart_id).where(Cart.user_id == user_id).scalar_subquery()
+
     @staticmethod
     async def get_cart_items(db: AsyncSession, user_id: int) -> List[CartItem]:
-        cart = await CartCRUD.get_or_create_cart(db, user_id)
         stmt = select(CartItem).where(
-            CartItem.cart_id == cart.cart_id
+            CartItem.cart_id == CartCRUD._user_cart_id(user_id)
         ).options(selectinload(CartItem.product))
         result = await db.execute(stmt)
         return result.scalars().all()
 
     @staticmethod
-    async def add_to_cart(db: AsyncSession, user_id: int, item_data: CartItemCreate) -> CartItem:
-        cart = await CartCRUD.get_or_create_cart(db, user_id)
-        stmt = select(CartItem).where(
-            CartItem.cart_id == cart.cart_id,
-            CartItem.product_id == item_data.product_id
+    async def get_cart_summary(db: AsyncSession, user_id: int) -> Tuple[Sequence[Row], Decimal]:
+        """
+        Возвращает строки корзины и общую сумму одним запросом.
+
+        Стоимость строк и итог считаются в БД (итог — оконной функцией по
+        тем же строкам). Корзина при чтении не создаётся: у пользователя без
+        корзины просто нет строк.
+        """
+        line_total = (Product.price * CartItem.quantity).label("total")
+        stmt = (
+            select(
+                CartItem.cart_item_id,
+                Product.product_id,
+                Product.name,
+                Product.price,
+                CartItem.quantity,
+                line_total,
+                func.sum(Product.price * CartItem.quantity).over().label("total_price"),
+            )
+            .join(Product, Product.product_id == CartItem.product_id)
+            .join(Cart, Cart.cart_id == CartItem.cart_id)
+            .where(Cart.user_id == user_id)
+            .order_by(CartItem.cart_item_id)
         )
-        result = await db.execute(stmt)
-        existing_item = result.scalar_one_or_none()
-
-        if existing_item:
-            existing_item.quantity += item_data.quantity
-            db_item = existing_item
-        else:
-            db_item = CartItem(
-                cart_id=cart.cart_id,
-                product_id=item_data.product_id,
-                quantity=item_data.quantity
+        rows = (await db.execute(stmt)).all()
+        total_price = rows[0].total_price if rows else Decimal("0")
+        return rows, total_price
+
+    @staticmethod
+    async def add_to_cart(db: AsyncSession, user_id: int, item_data: CartItemCreate) -> Optional[Row]:
+        """
+        Добавляет товар в корзину и резервирует его.
+
+        Корзина создаётся через INSERT ... ON CONFLICT, позиция — через
+        INSERT ... ON CONFLICT (cart_id, product_id) DO UPDATE с прибавлением
+        количества, поэтому двойной клик не теряет обновления. Вторым
+        запросом резерв доводится до нового количества в корзине. Если товара
+        нет или свободного остатка не хватает, транзакция откатывается и
+        возвращается None.
+        """
+        cart = (
+            insert(Cart)
+            .values(user_id=user_id)
+            .on_conflict_do_update(index_elements=[Cart.user_id], set_={"updated_at": func.now()})
+            .returning(Cart.cart_id)
+            .cte("cart")
+        )
+        source = (
+            select(cart.c.cart_id, Product.product_id, literal(item_data.quantity))
+            .join_from(cart, Product, true())
+            .where(Product.product_id == item_data.product_id)
+        )
+        upsert = insert(CartItem).from_select(["cart_id", "product_id", "quantity"], source)
+        item = (
+            upsert.on_conflict_do_update(
+                index_elements=[CartItem.cart_id, CartItem.product_id],
+                set_={"quantity": CartItem.quantity + upsert.excluded.quantity},
             )
-            db.add(db_item)
+            .returning(CartItem.cart_item_id, CartItem.product_id, CartItem.quantity)
+            .cte("item")
+        )
+        stmt = select(
+            item.c.cart_item_id,
+            item.c.product_id,
+            item.c.quantity,
+            Product.name,
+            Product.price,
+        ).join_from(item, Product, Product.product_id == item.c.product_id)
 
+        result = await db.execute(stmt)
+        row = result.one_or_none()
+        if row is None or row.product_id not in await stock_reservations.hold(db, user_id, {row.product_id: row.quantity}):
+            await db.rollback()
+            return None
         await db.commit()
-        return db_item
+        return row
 
     @staticmethod
     async def get_cart_item(db: AsyncSession, user_id: int, cart_item_id: int) -> Optional[CartItem]:
-        cart = await CartCRUD.get_or_create_cart(db, user_id)
         stmt = select(CartItem).where(
             CartItem.cart_item_id == cart_item_id,
-            CartItem.cart_id == cart.cart_id
+            CartItem.cart_id == CartCRUD._user_cart_id(user_id)
         ).options(selectinload(CartItem.product))
         result = await db.execute(stmt)
         return result.scalar_one_or_none()
 
     @staticmethod
-    async def update_cart_item(db: AsyncSession, user_id: int, cart_item_id: int, quantity: int) -> Optional[CartItem]:
-        cart = await CartCRUD.get_or_create_cart(db, user_id)
-        stmt = select(CartItem).where(
-            CartItem.cart_item_id == cart_item_id,
-            CartItem.cart_id == cart.cart_id
-        )
-        result = await db.execute(stmt)
-        item = result.scalar_one_or_none()
-
-        if not item:
-            return None
+    async def update_cart_item(db: AsyncSession, user_id: int, cart_item_id: int, quantity: int) -> Optional[Row]:
+        """
+        Меняет количество позиции одним UPDATE ... FROM products RETURNING
+        и доводит резерв до нового количества.
 
+        Обновление проходит только для позиции из корзины пользователя и
+        только если свободного остатка хватает; иначе транзакция откатывается
+        и возвращается None. При quantity <= 0 позиция удаляется.
+        """
         if quantity <= 0:
-            await db.delete(item)
-            await db.commit()
+            await CartCRUD.remove_from_cart(db, user_id, cart_item_id)
             return None
 
-        item.quantity = quantity
+        stmt = (
+            update(CartItem)
+            .where(
+                CartItem.cart_item_id == cart_item_id,
+                CartItem.cart_id == CartCRUD._user_cart_id(user_id),
+                Product.product_id == CartItem.product_id,
+            )
+            .values(quantity=quantity)
+            .returning(CartItem.cart_item_id, CartItem.product_id, CartItem.quantity, Product.price)
+        )
+        result = await db.execute(stmt)
+        row = result.one_or_none()
+        if row is None or row.product_id not in await stock_reservations.hold(db, user_id, {row.product_id: quantity}):
+            await db.rollback()
+            return None
         await db.commit()
-        return item
+        return row
 
     @staticmethod
     async def remove_from_cart(db: AsyncSession, user_id: int, cart_item_id: int) -> bool:
-        cart = await CartCRUD.get_or_create_cart(db, user_id)
-        stmt = select(CartItem).where(
-            CartItem.cart_item_id == cart_item_id,
-            CartItem.cart_id == cart.cart_id
+        stmt = (
+            delete(CartItem)
+            .where(
+                CartItem.cart_item_id == cart_item_id,
+                CartItem.cart_id == CartCRUD._user_cart_id(user_id),
+            )
+            .returning(CartItem.product_id)
         )
         result = await db.execute(stmt)
-        item = result.scalar_one_or_none()
-
-        if not item:
-            return False
-
-        await db.delete(item)
+        product_id = result.scalar_one_or_none()
+        if product_id is not None:
+            await stock_reservations.hold(db, user_id, {product_id: 0})
         await db.commit()
-        return True
+        return product_id is not None
 
     @staticmethod
     async def clear_cart(db: AsyncSession, user_id: int) -> bool:
-        cart = await CartCRUD.get_or_create_cart(db, user_id)
-        stmt = select(CartItem).where(CartItem.cart_id == cart.cart_id)
+        stmt = (
+            delete(CartItem)
+            .where(CartItem.cart_id == CartCRUD._user_cart_id(user_id))
+            .returning(CartItem.product_id)
+        )
         result = await db.execute(stmt)
-        items = result.scalars().all()
+        await stock_reservations.hold(db, user_id, {product_id: 0 for product_id in result.scalars()})
+        await db.commit()
+        return True
+
+    @staticmethod
+    def plan_batch(operations: Iterable[CartBatchOperation]) -> Dict[int, tuple]:
+        """
+        Сворачивает операции пакета в итоговое действие по каждому товару.
+
+        Возвращает {product_id: (действие, количество)}, где действие —
+        "add" (прибавить к текущему количеству), "set" или "remove".
+        Операции применяются по порядку: add после set даёт set с суммой,
+        set с нулевым количеством равносилен remove.
+        """
+        plan: Dict[int, tuple] = {}
+        for operation in operations:
+            action, quantity = plan.get(operation.product_id, (None, 0))
+            if operation.op == "remove" or (operation.op == "set" and operation.quantity <= 0):
+                plan[operation.product_id] = ("remove", 0)
+            elif operation.op == "set":
+                plan[operation.product_id] = ("set", operation.quantity)
+            elif action == "remove":
+                plan[operation.product_id] = ("set", operation.quantity)
+            else:
+                plan[operation.product_id] = (action or "add", quantity + operation.quantity)
+        return plan
 
-        for item in items:
-            await db.delete(item)
+    @staticmethod
+    async def apply_batch(db: AsyncSession, user_id: int, plan: Dict[int, tuple]) -> bool:
+        """
+        Применяет план пакета в одной транзакции.
+
+        Прибавления и установки количества выполняются двумя многострочными
+        INSERT ... ON CONFLICT, удаления — одним DELETE, резерв — одним
+        запросом, независимо от числа строк в пакете. Если зарезервировать
+        удалось не всё, транзакция откатывается и возвращается False.
+        """
+        adds = [(product_id, quantity) for product_id, (action, quantity) in plan.items() if action == "add"]
+        sets = [(product_id, quantity) for product_id, (action, quantity) in plan.items() if action == "set"]
+        removes = [product_id for product_id, (action, _) in plan.items() if action == "remove"]
+
+        cart_stmt = (
+            insert(Cart)
+            .values(user_id=user_id)
+            .on_conflict_do_update(index_elements=[Cart.user_id], set_={"updated_at": func.now()})
+            .returning(Cart.cart_id)
+        )
+        cart_id = (await db.execute(cart_stmt)).scalar_one()
+        reserve = {product_id: 0 for product_id in removes}
+
+        try:
+            for rows, increment in ((adds, True), (sets, False)):
+                if not rows:
+                    continue
+                stmt = insert(CartItem).values([
+                    {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+                    for product_id, quantity in rows
+                ])
+                new_quantity = CartItem.quantity + stmt.excluded.quantity if increment else stmt.excluded.quantity
+                result = await db.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[CartItem.cart_id, CartItem.product_id],
+                        set_={"quantity": new_quantity},
+                    ).returning(CartItem.product_id, CartItem.quantity)
+                )
+                reserve.update(result.all())
+            if removes:
+                await db.execute(delete(CartItem).where(
+                    CartItem.cart_id == cart_id,
+                    CartItem.product_id.in_(removes),
+                ))
+            if len(await stock_reservations.hold(db, user_id, reserve)) < len(reserve):
+                await db.rollback()
+                return False
+            await db.commit()
+            return True
+        except Exception:
+            await db.rollback()
+            raise
 
+    @staticmethod
+    async def merge_items(db: AsyncSession, user_id: int, items: Dict[int, int]) -> None:
+        """
+        Переносит гостевую корзину в корзину пользователя одним запросом.
+
+        Количества прибавляются к уже лежащим в корзине; товары, которых
+        больше нет в каталоге, отбрасываются соединением с products. Резерв
+        ставится на то, что удалось; нехватка остатка вход не блокирует и
+        проверяется при оформлении заказа.
+        """
+        if not items:
+            return
+        cart = (
+            insert(Cart)
+            .values(user_id=user_id)
+            .on_conflict_do_update(index_elements=[Cart.user_id], set_={"updated_at": func.now()})
+            .returning(Cart.cart_id)
+            .cte("cart")
+        )
+        guest = values(
+            column("product_id", Integer), column("quantity", Integer), name="guest"
+        ).data(list(items.items()))
+        source = (
+            select(cart.c.cart_id, guest.c.product_id, guest.c.quantity)
+            .join_from(cart, guest, true())
+            .join(Product, Product.product_id == guest.c.product_id)
+        )
+        stmt = insert(CartItem).from_select(["cart_id", "product_id", "quantity"], source)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.product_id],
+            set_={"quantity": CartItem.quantity + stmt.excluded.quantity},
+        ).returning(CartItem.product_id, CartItem.quantity)
+        result = await db.execute(stmt)
+        await stock_reservations.hold(db, user_id, dict(result.all()))
         await db.commit()
-        return True
@@ -0,0 +1,83 @@
+"""
+Гостевая корзина в подписанной cookie.
+
+Анонимный посетитель не получает строку в carts: содержимое корзины
+хранится у него в cookie в виде "product_id:quantity,..." после zlib,
+с усечённой HMAC-SHA256 подписью. Сервер при этом только читает товары,
+а при входе корзина переносится в БД одним upsert (CartCRUD.merge_items).
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import zlib
+from typing import Dict, Optional
+
+from fastapi import Response
+
+from app.core.settings import settings
+
+SIGNATURE_SIZE = 16
+
+_signing_key = hashlib.sha256(b"guest-cart:" + settings.JWT_SECRET.encode("utf-8")).digest()
+
+
+def _sign(data: bytes) -> bytes:
+    return hmac.new(_signing_key, data, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+
+def encode_guest_cart(items: Dict[int, int]) -> str:
+    payload = ",".join(f"{product_id}:{quantity}" for product_id, quantity in items.items())
+    compressed = zlib.compress(payload.encode("ascii"), 9)
+    return base64.urlsafe_b64encode(_sign(compressed) + compressed).rstrip(b"=").decode("ascii")
+
+
+def decode_guest_cart(value: Optional[str]) -> Dict[int, int]:
+    """Возвращает пустую корзину для отсутствующей, подделанной или битой cookie."""
+    if not value:
+        return {}
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        signature, compressed = raw[:SIGNATURE_SIZE], raw[SIGNATURE_SIZE:]
+        if not hmac.compare_digest(signature, _sign(compressed)):
+            return {}
+        payload = zlib.decompress(compressed).decode("ascii")
+        items = {}
+        for entry in filter(None, payload.split(",")):
+            product_id, quantity = entry.split(":")
+            if int(quantity) > 0:
+                items[int(product_id)] = int(quantity)
+        return items
+    except (binascii.Error, zlib.error, UnicodeDecodeError, ValueError):
+        return {}
+
+
+def set_guest_cart_cookie(resp: Response, items: Dict[int, int]) -> None:
+    if not items:
+        clear_guest_cart_cookie(resp)
+        return
+    resp.set_cookie(
+        key=settings.GUEST_CART_COOKIE_NAME,
+        value=encode_guest_cart(items),
+        httponly=True,
+        max_age=settings.GUEST_CART_MAX_AGE_DAYS * 24 * 60 * 60,
+        samesite="lax",
+        path="/",
+    )
+
+
+def clear_guest_cart_cookie(resp: Response) -> None:
+    resp.delete_cookie(settings.GUEST_CART_COOKIE_NAME, path="/")
+
+
+def apply_plan(items: Dict[int, int], plan: Dict[int, tuple]) -> Dict[int, int]:
+    """Применяет план пакета (CartCRUD.plan_batch) к гостевой корзине."""
+    result = dict(items)
+    for product_id, (action, quantity) in plan.items():
+        if action == "remove":
+            result.pop(product_id, None)
+        elif action == "set":
+            result[product_id] = quantity
+        else:
+            result[product_id] = result.get(product_id, 0) + quantity
+    return result
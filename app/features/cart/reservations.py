@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List, Set, Union
+
+from sqlalchemy import CompoundSelect, Integer, Select, and_, column, delete, func, literal, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.settings import settings
+from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+
+log = logging.getLogger(__name__)
+
+
+async def lock_products(
+        db: AsyncSession, product_ids: Union[Iterable[int], Select, CompoundSelect], skip_locked: bool = False
+) -> List[int]:
+    """
+    Блокирует строки products (FOR UPDATE) в порядке product_id и возвращает
+    заблокированные id.
+
+    Многострочный UPDATE products ... FROM блокирует строки в порядке плана,
+    и две транзакции с пересекающимися наборами товаров могут взять их
+    встречно - Postgres обрывает одну из них с deadlock. Все, кто меняет
+    остатки или резерв нескольких товаров, сначала вызывают lock_products.
+    """
+    if not isinstance(product_ids, (Select, CompoundSelect)):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return []
+    stmt = (
+        select(Product.product_id)
+        .where(Product.product_id.in_(product_ids))
+        .order_by(Product.product_id)
+        .with_for_update(skip_locked=skip_locked)
+    )
+    return list((await db.execute(stmt)).scalars().all())
+
+
+class StockReservations:
+    """
+    Временный резерв товара под корзину.
+
+    На каждую пару (пользователь, товар) хранится одна запись с количеством
+    и сроком действия, а сумма активных резервов поддерживается в
+    products.quantity_reserved. Свободный остаток поэтому читается без
+    агрегации: quantity_available - quantity_reserved.
+
+    Методы не коммитят: резерв меняется в той же транзакции, что и корзина.
+    Каждый метод сначала блокирует затронутые строки products через
+    lock_products - в порядке product_id - и только потом меняет
+    stock_reservations и quantity_reserved. Поэтому параллельные изменения
+    резерва по одним и тем же товарам (разные пользователи, оформление
+    заказа, чистка истекших резервов) выстраиваются в очередь, а не
+    блокируют друг друга встречно.
+    """
+
+    async def hold(self, db: AsyncSession, user_id: int, quantities: Dict[int, int]) -> Set[int]:
+        """
+        Устанавливает резерв пользователя на заданные количества: блокировка
+        товаров и один запрос, который меняет резерв.
+
+        Для каждого товара считается разница с текущим резервом; увеличение
+        проходит только если свободного остатка хватает. Нулевое количество
+        снимает резерв. Возвращает товары, для которых резерв установлен, -
+        если какого-то товара нет в ответе, вызывающий код откатывает транзакцию.
+        Срок резерва продлевается на RESERVATION_TTL_MINUTES.
+        """
+        if not quantities:
+            return set()
+
+        # разница считается от текущего резерва: пока товары заблокированы, expire()
+        # и другие транзакции не могут поменять резерв по ним между чтением и записью
+        await lock_products(db, quantities)
+
+        targets = values(
+            column("product_id", Integer), column("quantity", Integer), name="targets"
+        ).data(list(quantities.items()))
+        delta = (
+            select(
+                targets.c.product_id,
+                targets.c.quantity.label("target"),
+                (targets.c.quantity - func.coalesce(StockReservation.quantity, 0)).label("delta"),
+            )
+            .select_from(targets)
+            .outerjoin(StockReservation, and_(
+                StockReservation.user_id == user_id,
+                StockReservation.product_id == targets.c.product_id,
+            ))
+            .cte("delta")
+        )
+        adjusted = (
+            update(Product)
+            .where(
+                Product.product_id == delta.c.product_id,
+                or_(delta.c.delta <= 0, Product.quantity_available - Product.quantity_reserved >= delta.c.delta),
+            )
+            .values(quantity_reserved=Product.quantity_reserved + delta.c.delta)
+            .returning(Product.product_id, delta.c.target)
+            .cte("adjusted")
+        )
+        upsert = insert(StockReservation).from_select(
+            ["user_id", "product_id", "quantity", "expires_at"],
+            select(
+                literal(user_id),
+                adjusted.c.product_id,
+                adjusted.c.target,
+                func.now() + timedelta(minutes=settings.RESERVATION_TTL_MINUTES),
+            ).where(adjusted.c.target > 0),
+        )
+        held = (
+            upsert.on_conflict_do_update(
+                index_elements=[StockReservation.user_id, StockReservation.product_id],
+                set_={"quantity": upsert.excluded.quantity, "expires_at": upsert.excluded.expires_at},
+            )
+            .returning(StockReservation.product_id)
+            .cte("held")
+        )
+        released = (
+            delete(StockReservation)
+            .where(
+                StockReservation.user_id == user_id,
+                StockReservation.product_id.in_(select(adjusted.c.product_id).where(adjusted.c.target <= 0)),
+            )
+            .returning(StockReservation.product_id)
+            .cte("released")
+        )
+        stmt = select(adjusted.c.product_id).add_cte(held, released)
+
+        result = await db.execute(stmt)
+        return set(result.scalars().all())
+
+    async def held(self, db: AsyncSession, user_id: int, product_ids: Iterable[int]) -> Dict[int, int]:
+        """Текущий резерв пользователя по товарам: {product_id: quantity}"""
+        result = await db.execute(
+            select(StockReservation.product_id, StockReservation.quantity)
+            .where(StockReservation.user_id == user_id, StockReservation.product_id.in_(list(product_ids)))
+        )
+        return dict(result.all())
+
+    async def release_all(self, db: AsyncSession, user_id: int) -> None:
+        """Снимает все резервы пользователя (например, перед списанием на оформлении заказа)"""
+        await lock_products(
+            db, select(StockReservation.product_id).where(StockReservation.user_id == user_id)
+        )
+        released = (
+            delete(StockReservation)
+            .where(StockReservation.user_id == user_id)
+            .returning(StockReservation.product_id, StockReservation.quantity)
+            .cte("released")
+        )
+        await db.execute(
+            update(Product)
+            .where(Product.product_id == released.c.product_id)
+            .values(quantity_reserved=Product.quantity_reserved - released.c.quantity)
+        )
+
+    async def expire(self, db: AsyncSession, batch_size: int) -> int:
+        """
+        Снимает до batch_size истекших резервов и возвращает их число.
+
+        Товары истекших резервов блокируются с SKIP LOCKED: резервы по товарам,
+        которые сейчас меняет корзина, оформление или другой воркер, пропускаются
+        до следующего прохода, поэтому чистка никого не ждет и не мешает корзинам.
+        """
+        expired_products = (
+            select(StockReservation.product_id)
+            .where(StockReservation.expires_at <= func.now())
+            .order_by(StockReservation.expires_at)
+            .limit(batch_size)
+        )
+        locked = await lock_products(db, expired_products, skip_locked=True)
+        if not locked:
+            await db.commit()
+            return 0
+
+        # срок перепроверяется: пока товар не был заблокирован, корзина могла продлить резерв
+        batch = (
+            select(StockReservation.reservation_id)
+            .where(StockReservation.expires_at <= func.now(), StockReservation.product_id.in_(locked))
+            .order_by(StockReservation.expires_at)
+            .limit(batch_size)
+        )
+        expired = (
+            delete(StockReservation)
+            .where(StockReservation.reservation_id.in_(batch.scalar_subquery()))
+            .returning(StockReservation.product_id, StockReservation.quantity)
+            .cte("expired")
+        )
+        totals = (
+            select(expired.c.product_id, func.sum(expired.c.quantity).label("quantity"))
+            .group_by(expired.c.product_id)
+            .cte("totals")
+        )
+        adjusted = (
+            update(Product)
+            .where(Product.product_id == totals.c.product_id)
+            .values(quantity_reserved=Product.quantity_reserved - totals.c.quantity)
+            .cte("adjusted")
+        )
+        stmt = select(func.count()).select_from(expired).add_cte(adjusted)
+
+        count = (await db.execute(stmt)).scalar_one()
+        await db.commit()
+        return count
+
+    async def sweep(self, session_factory: async_sessionmaker, batch_size: int) -> int:
+        """Снимает все истекшие резервы пачками, каждая в своей короткой транзакции"""
+        total = 0
+        while True:
+            async with session_factory() as db:
+                count = await self.expire(db, batch_size)
+            total += count
+            if count < batch_size:
+                return total
+
+    async def run(self, session_factory: async_sessionmaker, interval: float, batch_size: int) -> None:
+        while True:
+            try:
+                expired = await self.sweep(session_factory, batch_size)
+                if expired:
+                    log.info("Снято истекших резервов: %s", expired)
+            except Exception:
+                log.exception("Ошибка при снятии истекших резервов")
+            await asyncio.sleep(interval)
+
+
+stock_reservations = StockReservations()
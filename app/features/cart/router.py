@@ -1,11 +1,15 @@
-﻿from fastapi import APIRouter, Request, Depends, HTTPException
+﻿from typing import Optional
+from fastapi import APIRouter, Request, Depends, HTTPException, Cookie, Response
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.settings import settings
 from app.infra.db import get_db
 from app.features.cart import crud as cart_crud
-from app.features.cart.schemas import CartItemCreate, CartItemUpdate
+from app.features.cart import guest as guest_cart
+from app.features.cart.reservations import stock_reservations
+from app.features.cart.schemas import CartBatchRequest, CartItemCreate, CartItemUpdate
 from app.features.products import crud as product_crud
-from app.features.auth.dependencies import get_current_user, get_optional_user
+from app.features.auth.dependencies import get_optional_user
 from app.infra.templates import templates
 from app.models.user import User
 
@@ -16,7 +20,7 @@ async def check_product_availability(db: AsyncSession, product_id: int, required
     product = await product_crud.get_product(db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Товар не найден")
-    if product.quantity_available < required_quantity:
+    if product.quantity_free < required_quantity:
         raise HTTPException(status_code=400, detail="Недостаточно товара на складе")
     return product
 
@@ -26,60 +30,156 @@ async def cart_page(req: Request, user: User | None = Depends(get_optional_user)
     return templates.TemplateResponse("cart/view.html", {"request": req, "user": user})
 
 
+async def cart_view(db: AsyncSession, user_id: int) -> dict:
+    rows, total_price = await cart_crud.CartCRUD.get_cart_summary(db, user_id)
+    items = [{
+        "cart_item_id": row.cart_item_id,
+        "product_id": row.product_id,
+        "name": row.name,
+        "price": row.price,
+        "quantity": row.quantity,
+        "total": row.total
+    } for row in rows]
+    return {"items": items, "total_price": total_price}
+
+
+async def guest_cart_view(db: AsyncSession, items: dict) -> dict:
+    # у гостевых позиций нет cart_item_id, их идентификатором служит product_id
+    products = await product_crud.get_products_by_ids(db, list(items))
+    lines = [{
+        "cart_item_id": product.product_id,
+        "product_id": product.product_id,
+        "name": product.name,
+        "price": product.price,
+        "quantity": items[product.product_id],
+        "total": product.price * items[product.product_id]
+    } for product in sorted(products, key=lambda product: product.product_id)]
+    return {"items": lines, "total_price": sum((line["total"] for line in lines), 0)}
+
+
+def check_guest_cart_size(items: dict):
+    if len(items) > settings.GUEST_CART_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail="Гостевая корзина переполнена, войдите в аккаунт")
+
+
 @router.get("/api")
-async def get_cart(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
-    items = await cart_crud.CartCRUD.get_cart_items(db, current_user.user_id)
-    if not items:
-        return {"items": [], "total_price": 0}
-    data = []
-    total_price = 0
-    for item in items:
-        if item.product:
-            item_total = item.product.price * item.quantity
-            data.append({
-                "cart_item_id": item.cart_item_id,
-                "product_id": item.product.product_id,
-                "name": item.product.name,
-                "price": item.product.price,
-                "quantity": item.quantity,
-                "total": item_total
-            })
-            total_price += item_total
-
-    return {"items": data, "total_price": total_price}
+async def get_cart(db: AsyncSession = Depends(get_db), current_user: Optional[User] = Depends(get_optional_user),
+                   guest_cookie: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE_NAME)):
+    if current_user is None:
+        return await guest_cart_view(db, guest_cart.decode_guest_cart(guest_cookie))
+    return await cart_view(db, current_user.user_id)
 
 
 @router.post("/items/")
-async def add_item(item_data: CartItemCreate, db: AsyncSession = Depends(get_db),
-                   current_user: User = Depends(get_current_user)):
-    await check_product_availability(db, item_data.product_id, item_data.quantity)
+async def add_item(item_data: CartItemCreate, response: Response, db: AsyncSession = Depends(get_db),
+                   current_user: Optional[User] = Depends(get_optional_user),
+                   guest_cookie: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE_NAME)):
+    if current_user is None:
+        items = guest_cart.decode_guest_cart(guest_cookie)
+        quantity = items.get(item_data.product_id, 0) + item_data.quantity
+        product = await check_product_availability(db, item_data.product_id, quantity)
+        items[product.product_id] = quantity
+        check_guest_cart_size(items)
+        guest_cart.set_guest_cart_cookie(response, items)
+        return {"cart_item_id": product.product_id, "product_id": product.product_id,
+                "name": product.name, "price": product.price,
+                "quantity": quantity, "total": product.price * quantity}
+
     cart_item = await cart_crud.CartCRUD.add_to_cart(db, current_user.user_id, item_data)
-    cart_item_with_product = await cart_crud.CartCRUD.get_cart_item(db, current_user.user_id, cart_item.cart_item_id)
-    price_rub = cart_item_with_product.product.price / 100
-    return {"cart_item_id": cart_item_with_product.cart_item_id,
-            "product_id": cart_item_with_product.product.product_id,
-            "name": cart_item_with_product.product.name, "price": price_rub,
-            "quantity": cart_item_with_product.quantity, "total": price_rub * cart_item_with_product.quantity}
+    if cart_item is None:
+        await check_product_availability(db, item_data.product_id, item_data.quantity)
+        raise HTTPException(status_code=400, detail="Недостаточно товара на складе")
+    return {"cart_item_id": cart_item.cart_item_id,
+            "product_id": cart_item.product_id,
+            "name": cart_item.name, "price": cart_item.price,
+            "quantity": cart_item.quantity, "total": cart_item.price * cart_item.quantity}
+
+
+@router.post("/items/batch")
+async def batch_update_items(batch: CartBatchRequest, response: Response, db: AsyncSession = Depends(get_db),
+                             current_user: Optional[User] = Depends(get_optional_user),
+                             guest_cookie: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE_NAME)):
+    plan = cart_crud.CartCRUD.plan_batch(batch.operations)
+    required = {product_id: quantity for product_id, (action, quantity) in plan.items() if action != "remove"}
+
+    products = await product_crud.get_products_by_ids(db, list(required))
+    found = {product.product_id: product for product in products}
+    missing = sorted(set(required) - set(found))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Товары не найдены: {', '.join(map(str, missing))}")
+
+    # проверяется итоговое количество (для add - вместе с уже лежащим в корзине)
+    # против свободного остатка; собственный резерв пользователя в нем уже вычтен,
+    # поэтому прибавляется обратно
+    if current_user is None:
+        current, own = guest_cart.decode_guest_cart(guest_cookie), {}
+    else:
+        current = own = await stock_reservations.held(db, current_user.user_id, required)
+    items = guest_cart.apply_plan(current, plan)
+    short = [found[product_id].name for product_id in required
+             if found[product_id].quantity_free + own.get(product_id, 0) < items[product_id]]
+    if short:
+        raise HTTPException(status_code=400, detail=f"Недостаточно товара на складе: {', '.join(short)}")
+
+    if current_user is None:
+        check_guest_cart_size(items)
+        guest_cart.set_guest_cart_cookie(response, items)
+        return await guest_cart_view(db, items)
+
+    if not await cart_crud.CartCRUD.apply_batch(db, current_user.user_id, plan):
+        raise HTTPException(status_code=400, detail="Недостаточно товара на складе")
+    return await cart_view(db, current_user.user_id)
 
 
 @router.put("/items/{item_id}")
-async def update_cart_item(item_id: int, update: CartItemUpdate, db: AsyncSession = Depends(get_db),
-                           current_user: User = Depends(get_current_user)):
-    cart_item = await cart_crud.CartCRUD.get_cart_item(db, current_user.user_id, item_id)
-    if not cart_item:
-        raise HTTPException(status_code=404, detail="Товар не найден в корзине")
-    product = await check_product_availability(db, cart_item.product_id, update.quantity)
-    updated_item = await cart_crud.CartCRUD.update_cart_item(db, current_user.user_id, item_id, update.quantity)
+async def update_cart_item(item_id: int, update: CartItemUpdate, response: Response,
+                           db: AsyncSession = Depends(get_db),
+                           current_user: Optional[User] = Depends(get_optional_user),
+                           guest_cookie: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE_NAME)):
+    if current_user is None:
+        items = guest_cart.decode_guest_cart(guest_cookie)
+        if item_id not in items:
+            raise HTTPException(status_code=404, detail="Товар не найден в корзине")
+        if update.quantity <= 0:
+            del items[item_id]
+            guest_cart.set_guest_cart_cookie(response, items)
+            return {"deleted": item_id}
+        product = await check_product_availability(db, item_id, update.quantity)
+        items[item_id] = update.quantity
+        guest_cart.set_guest_cart_cookie(response, items)
+        return {"cart_item_id": item_id, "product_id": item_id,
+                "quantity": update.quantity, "total": product.price * update.quantity}
+
+    # неудачное обновление откатывает транзакцию и expire-ит current_user
+    user_id = current_user.user_id
+    if update.quantity <= 0:
+        if not await cart_crud.CartCRUD.remove_from_cart(db, user_id, item_id):
+            raise HTTPException(status_code=404, detail="Товар не найден в корзине")
+        return {"deleted": item_id}
 
+    updated_item = await cart_crud.CartCRUD.update_cart_item(db, user_id, item_id, update.quantity)
     if not updated_item:
-        return {"deleted": item_id}
+        cart_item = await cart_crud.CartCRUD.get_cart_item(db, user_id, item_id)
+        if not cart_item:
+            raise HTTPException(status_code=404, detail="Товар не найден в корзине")
+        await check_product_availability(db, cart_item.product_id, update.quantity)
+        raise HTTPException(status_code=400, detail="Недостаточно товара на складе")
 
-    return {"cart_item_id": item_id, "product_id": product.product_id,
-            "quantity": update.quantity, "total": product.price * update.quantity / 100}
+    return {"cart_item_id": item_id, "product_id": updated_item.product_id,
+            "quantity": updated_item.quantity, "total": updated_item.price * updated_item.quantity}
 
 
 @router.delete("/items/{item_id}")
-async def remove_item(item_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def remove_item(item_id: int, response: Response, db: AsyncSession = Depends(get_db),
+                      current_user: Optional[User] = Depends(get_optional_user),
+                      guest_cookie: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE_NAME)):
+    if current_user is None:
+        items = guest_cart.decode_guest_cart(guest_cookie)
+        if items.pop(item_id, None) is None:
+            raise HTTPException(status_code=404, detail="Товар не найден в корзине")
+        guest_cart.set_guest_cart_cookie(response, items)
+        return {"deleted": item_id}
+
     success = await cart_crud.CartCRUD.remove_from_cart(db, current_user.user_id, item_id)
     if not success:
         raise HTTPException(status_code=404, detail="Товар не найден в корзине")
@@ -87,8 +187,22 @@ async def remove_item(item_id: int, db: AsyncSession = Depends(get_db), current_
 
 
 @router.post("/clear")
-async def clear_cart(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def clear_cart(response: Response, db: AsyncSession = Depends(get_db),
+                     current_user: Optional[User] = Depends(get_optional_user)):
+    if current_user is None:
+        guest_cart.clear_guest_cart_cookie(response)
+        return {"cleared": True}
+
     success = await cart_crud.CartCRUD.clear_cart(db, current_user.user_id)
     if not success:
         raise HTTPException(status_code=404, detail="Корзина не найдена")
     return {"cleared": True}
+
+
+async def merge_guest_cart(request: Request, response: Response, db: AsyncSession, user_id: int) -> None:
+    """Переносит гостевую корзину в БД после входа и удаляет cookie."""
+    items = guest_cart.decode_guest_cart(request.cookies.get(settings.GUEST_CART_COOKIE_NAME))
+    if items:
+        await cart_crud.CartCRUD.merge_items(db, user_id, items)
+    if settings.GUEST_CART_COOKIE_NAME in request.cookies:
+        guest_cart.clear_guest_cart_cookie(response)
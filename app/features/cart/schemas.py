@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, field_validator, model_validator
+from typing import List, Literal, Optional
 from decimal import Decimal
 
 
@@ -12,6 +12,31 @@ class CartItemUpdate(BaseModel):
     quantity: int
 
 
+class CartBatchOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: int
+    quantity: int = 1
+
+    @model_validator(mode='after')
+    def validate_quantity(self):
+        if self.op == "add" and self.quantity <= 0:
+            raise ValueError('Количество для добавления должно быть больше нуля')
+        return self
+
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartBatchOperation]
+
+    @field_validator('operations')
+    @classmethod
+    def validate_operations(cls, v):
+        if not v:
+            raise ValueError('Список операций не может быть пустым')
+        if len(v) > 500:
+            raise ValueError('Не более 500 операций за один запрос')
+        return v
+
+
 class CartItemRead(BaseModel):
     cart_item_id: int
     product_id: int
@@ -1,9 +1,11 @@
-﻿from fastapi import APIRouter, Request, Depends, Form
+﻿from fastapi import APIRouter, Request, Depends, Form, Header
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.infra.templates import templates
 from app.infra.db import get_db
+from app.features.orders.idempotency import MAX_KEY_LENGTH, generate_idempotency_key, idempotency_keys
 from app.features.orders.service import create_simple_order
+from app.infra.outbox import outbox_dispatcher
 from app.models.user import User
 from app.features.auth.dependencies import get_optional_user
 from typing import Optional
@@ -18,14 +20,31 @@ router = APIRouter(prefix="/orders", tags=["orders"])
 @router.get("/checkout", response_class=HTMLResponse)
 async def checkout_page(request: Request, user: User | None = Depends(get_optional_user),
                         db: AsyncSession = Depends(get_db)):
-    return templates.TemplateResponse("cart/confirmation.html", {"request": request, "user": user})
+    return templates.TemplateResponse("cart/confirmation.html", {"request": request, "user": user,
+                                                                 "idempotency_key": generate_idempotency_key()})
 
 
 @router.post("/checkout", response_class=RedirectResponse)
 async def checkout_form(order_email: str = Form(), phone: str = Form(None), address: str = Form(),
+                        idempotency_key: Optional[str] = Form(None),
+                        idempotency_header: Optional[str] = Header(None, alias="Idempotency-Key"),
                         db: AsyncSession = Depends(get_db), user: User | None = Depends(get_optional_user)):
+    # форма передает ключ скрытым полем, JSON-клиенты - заголовком Idempotency-Key
+    key = idempotency_key or idempotency_header
+    if key and len(key) > MAX_KEY_LENGTH:
+        return RedirectResponse(url="/orders/checkout?error=Некорректный ключ запроса", status_code=303)
+
+    user_id = user.user_id if user else None
+    if key and user_id is not None:
+        order_id = idempotency_keys.get(user_id, key)
+        if order_id is not None:
+            return RedirectResponse(url=f"/orders/success/{order_id}", status_code=303)
+
     try:
-        order = await create_simple_order(db, order_email, phone, address, user)
+        order = await create_simple_order(db, order_email, phone, address, user, idempotency_key=key)
+        if key:
+            idempotency_keys.remember(user_id, key, order.order_id)
+        outbox_dispatcher.notify()
         return RedirectResponse(url=f"/orders/success/{order.order_id}", status_code=303)
     except Exception as error:
         import logging
@@ -0,0 +1,92 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.encrypted import decrypt_instances
+from app.models.order import Order
+from app.models.order_item import OrderItem
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Разбирает курсор страницы; на мусор поднимает ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Некорректный курсор")
+
+
+async def list_user_orders(
+        db: AsyncSession,
+        user_id: int,
+        cursor: Optional[Cursor],
+        limit: int,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Страница истории заказов пользователя, от новых к старым.
+
+    Пагинация по ключу (created_at, order_id): следующая страница начинается
+    строго после последней строки предыдущей, поэтому стоимость не растет с
+    номером страницы, как у OFFSET, а заказы, созданные между запросами, не
+    сдвигают выдачу. Запрос идет по индексу ix_orders_user_id_created_at;
+    число позиций и штук считается подзапросами только для строк страницы.
+    Возвращает строки и курсор следующей страницы (None на последней).
+    """
+    items_count = (
+        select(func.count())
+        .where(OrderItem.order_id == Order.order_id)
+        .correlate(Order)
+        .scalar_subquery()
+    )
+    items_quantity = (
+        select(func.coalesce(func.sum(OrderItem.quantity), 0))
+        .where(OrderItem.order_id == Order.order_id)
+        .correlate(Order)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(Order, items_count.label("items_count"), items_quantity.label("items_quantity"))
+        .where(Order.user_id == user_id)
+        .order_by(Order.created_at.desc(), Order.order_id.desc())
+        # лишняя строка только показывает, есть ли следующая страница
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Order.created_at, Order.order_id) < tuple_(*cursor))
+
+    rows = (await db.execute(stmt)).all()
+    page = rows[:limit]
+    # ПД расшифровываются только для видимой страницы
+    await decrypt_instances([order for order, _, _ in page])
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1].Order
+        next_cursor = encode_cursor(last.created_at, last.order_id)
+
+    orders = [
+        {
+            "order_id": order.order_id,
+            "created_at": order.created_at,
+            "total_price": order.total_price,
+            "status": order.status,
+            "items_count": count,
+            "items_quantity": quantity,
+            "order_email": order.order_email,
+            "address": order.address,
+        }
+        for order, count, quantity in page
+    ]
+    return orders, next_cursor
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import secrets
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.settings import settings
+from app.models.idempotency_key import IdempotencyKey
+from app.models.order import Order
+
+log = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 64
+
+
+def generate_idempotency_key() -> str:
+    return secrets.token_urlsafe(24)
+
+
+class IdempotencyKeys:
+    """
+    Ключи идемпотентности оформления заказа.
+
+    Источник истины - таблица idempotency_keys: ключ вставляется первым
+    запросом в транзакции заказа, поэтому параллельный повтор ждет ее
+    завершения на уникальном индексе (user_id, key) и потом находит
+    готовый заказ. Поверх таблицы каждый воркер держит ограниченный
+    LRU-кеш (user_id, key) -> order_id, чтобы повтор уже завершенной
+    отправки сразу получал редирект без обращения к БД.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._orders: OrderedDict[tuple[int, str], int] = OrderedDict()
+
+    def get(self, user_id: int, key: str) -> Optional[int]:
+        order_id = self._orders.get((user_id, key))
+        if order_id is not None:
+            self._orders.move_to_end((user_id, key))
+        return order_id
+
+    def remember(self, user_id: int, key: str, order_id: int) -> None:
+        if self.maxsize <= 0:
+            return
+        self._orders[(user_id, key)] = order_id
+        self._orders.move_to_end((user_id, key))
+        while len(self._orders) > self.maxsize:
+            self._orders.popitem(last=False)
+
+    async def claim(self, db: AsyncSession, user_id: int, key: str) -> Optional[int]:
+        """
+        Занимает ключ в текущей транзакции и возвращает id записи.
+        None означает, что ключ уже использован закоммиченным заказом.
+        """
+        stmt = (
+            insert(IdempotencyKey)
+            .values(user_id=user_id, key=key)
+            .on_conflict_do_nothing(index_elements=[IdempotencyKey.user_id, IdempotencyKey.key])
+            .returning(IdempotencyKey.idempotency_key_id)
+        )
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def find_order(self, db: AsyncSession, user_id: int, key: str) -> Optional[Order]:
+        stmt = (
+            select(Order)
+            .join(IdempotencyKey, IdempotencyKey.order_id == Order.order_id)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        )
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def purge_expired(self, db: AsyncSession) -> int:
+        """Повторная отправка формы через сутки уже не повтор, ключи можно удалять"""
+        result = await db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.created_at < func.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS))
+            .returning(IdempotencyKey.idempotency_key_id)
+        )
+        await db.commit()
+        return len(result.all())
+
+    async def run(self, session_factory: async_sessionmaker, interval: float) -> None:
+        while True:
+            try:
+                async with session_factory() as db:
+                    await self.purge_expired(db)
+            except Exception:
+                log.exception("Не удалось очистить idempotency_keys")
+            await asyncio.sleep(interval)
+
+    def clear(self) -> None:
+        self._orders.clear()
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+
+idempotency_keys = IdempotencyKeys(settings.IDEMPOTENCY_CACHE_SIZE)
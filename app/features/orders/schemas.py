@@ -1,5 +1,27 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
 from pydantic import BaseModel
 
+from app.models.order import OrderStatus
+
 
 class OrderCreate(BaseModel):
     email: str
+
+
+class OrderHistoryItem(BaseModel):
+    order_id: int
+    created_at: datetime
+    total_price: Decimal
+    status: OrderStatus
+    items_count: int
+    items_quantity: int
+    order_email: str
+    address: str
+
+
+class OrderHistoryPage(BaseModel):
+    orders: List[OrderHistoryItem]
+    next_cursor: Optional[str] = None
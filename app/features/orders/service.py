@@ -1,6 +1,6 @@
 ﻿from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import delete, func, literal, select, union, update
+from sqlalchemy.dialects.postgresql import insert
 from decimal import Decimal
 import logging
 
@@ -10,68 +10,147 @@ from app.models.user import User
 from app.models.cart import Cart
 from app.models.cart_item import CartItem
 from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+from app.features.cart.reservations import lock_products, stock_reservations
+from app.features.orders.idempotency import idempotency_keys
+from app.models.idempotency_key import IdempotencyKey
+from app.models.outbox_message import OutboxMessage
+from app.infra.outbox import ORDER_CONFIRMATION
 
 log = logging.getLogger(__name__)
 
 
-async def create_simple_order(db: AsyncSession, order_email: str, phone: str, address: str, user: User | None) -> Order:
-    if not user:
-        raise ValueError("Не авторизован")
+def _cart_lines(user_id: int):
+    return (
+        select(CartItem.product_id, CartItem.quantity)
+        .join(Cart, Cart.cart_id == CartItem.cart_id)
+        .where(Cart.user_id == user_id)
+    )
 
-    user_id = user.user_id
-    cart_stmt = (
-        select(Cart).options(selectinload(Cart.items).selectinload(CartItem.product)).where(Cart.user_id == user_id))
-    cart_res = await db.execute(cart_stmt)
-    cart = cart_res.scalar_one_or_none()
 
-    if not cart:
-        raise ValueError("Корзина не найдена")
+async def decrement_stock(db: AsyncSession, user_id: int) -> list:
+    """
+    Превращает резерв пользователя в списание остатков по всей корзине.
 
-    if not cart.items:
-        raise ValueError("Корзина пуста")
+    Сначала одним запросом блокируются все затронутые товары (корзина и
+    резерв) в порядке product_id: параллельные оформления с пересекающимися
+    корзинами ждут друг друга, а не ловят deadlock. Затем снимается резерв,
+    и UPDATE products ... FROM cart_items списывает товар только если
+    свободного остатка хватает. Возвращает строки корзины (product_id, name,
+    decremented) - если хоть одна не списана, вызывающий код должен откатить
+    транзакцию.
+    """
+    await lock_products(db, union(
+        _cart_lines(user_id).with_only_columns(CartItem.product_id),
+        select(StockReservation.product_id).where(StockReservation.user_id == user_id),
+    ))
+    # резерв пользователя превращается в списание: снимаем его до проверки остатков
+    await stock_reservations.release_all(db, user_id)
 
-    total_price = Decimal('0.0')
-    order_items = []
+    lines = _cart_lines(user_id).cte("lines")
+    decremented = (
+        update(Product)
+        .where(
+            Product.product_id == lines.c.product_id,
+            Product.quantity_available - Product.quantity_reserved >= lines.c.quantity,
+        )
+        .values(quantity_available=Product.quantity_available - lines.c.quantity)
+        .returning(Product.product_id)
+        .cte("decremented")
+    )
+    stmt = (
+        select(lines.c.product_id, Product.name, decremented.c.product_id.is_not(None).label("decremented"))
+        .join(Product, Product.product_id == lines.c.product_id)
+        .outerjoin(decremented, decremented.c.product_id == lines.c.product_id)
+    )
+    result = await db.execute(stmt)
+    return result.all()
 
-    for cart_item in cart.items:
-        product = cart_item.product
-        required_quantity = cart_item.quantity
 
-        if hasattr(product, 'quantity_available'):
-            if product.quantity_available >= required_quantity:
-                product.quantity_available -= required_quantity
-            else:
-                raise ValueError(f"Недостаточно товара '{product.name}'.")
+async def create_simple_order(db: AsyncSession, order_email: str, phone: str, address: str, user: User | None,
+                              idempotency_key: str | None = None) -> Order:
+    """
+    Оформляет заказ из корзины пользователя.
 
-        total_price += product.price * Decimal(required_quantity)
+    Число запросов не зависит от числа строк: блокировка товаров, снятие
+    резерва, списание остатков, INSERT заказа с суммой, посчитанной в БД, и один запрос,
+    который переносит строки (INSERT INTO order_items ... SELECT FROM
+    cart_items JOIN products) и удаляет корзину (строки уходят каскадом).
 
-        order_item = OrderItem(product_id=product.product_id, quantity=required_quantity,
-                               price_per_unit=product.price, total=product.price * Decimal(required_quantity))
-        order_items.append(order_item)
+    С idempotency_key первым запросом занимается ключ; если он уже
+    использован, возвращается ранее оформленный заказ без повторного списания.
+    """
+    if not user:
+        raise ValueError("Не авторизован")
 
+    user_id = user.user_id
     try:
+        claimed_key_id = None
+        if idempotency_key:
+            claimed_key_id = await idempotency_keys.claim(db, user_id, idempotency_key)
+            if claimed_key_id is None:
+                existing = await idempotency_keys.find_order(db, user_id, idempotency_key)
+                if existing is None:
+                    raise ValueError("Заказ уже оформляется")
+                return existing
+
+        lines = await decrement_stock(db, user_id)
+        if not lines:
+            raise ValueError("Корзина пуста")
+        short = [line.name for line in lines if not line.decremented]
+        if short:
+            raise ValueError(f"Недостаточно товара '{', '.join(short)}'.")
+
+        priced_lines = _cart_lines(user_id).add_columns(Product.price).join(
+            Product, Product.product_id == CartItem.product_id
+        ).subquery()
+        total_price = select(func.sum(priced_lines.c.price * priced_lines.c.quantity)).scalar_subquery()
+
         order = Order.create_with_encryption(
             user_id=user_id,
             order_email=order_email,
-            total_price=total_price,
+            total_price=0,
             address=address
         )
-        db.add(order)
-        await db.flush()
-        for order_item in order_items:
-            order_item.order_id = order.order_id
-            db.add(order_item)
-        for cart_item in cart.items:
-            await db.delete(cart_item)
-        await db.delete(cart)
+        order_values = {
+            column.key: getattr(order, column.key)
+            for column in Order.__table__.columns
+            if getattr(order, column.key) is not None
+        }
+        order_values["total_price"] = total_price
+        order = (await db.execute(insert(Order).values(**order_values).returning(Order))).scalar_one()
+
+        items = insert(OrderItem).from_select(
+            ["order_id", "product_id", "quantity", "price_per_unit", "total"],
+            select(
+                literal(order.order_id),
+                priced_lines.c.product_id,
+                priced_lines.c.quantity,
+                priced_lines.c.price,
+                priced_lines.c.price * priced_lines.c.quantity,
+            ),
+        ).cte("items")
+        # письмо ставится в outbox той же транзакцией: уйдет только закоммиченный заказ
+        notification = insert(OutboxMessage).values(
+            kind=ORDER_CONFIRMATION, order_id=order.order_id, attempts=0
+        ).cte("notification")
+        teardown = delete(Cart).where(Cart.user_id == user_id).add_cte(items, notification)
+        if claimed_key_id is not None:
+            teardown = teardown.add_cte(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.idempotency_key_id == claimed_key_id)
+                .values(order_id=order.order_id)
+                .cte("claimed_key")
+            )
+        await db.execute(teardown)
         await db.commit()
-        await db.refresh(order)
-        print(f"Заказ создан успешно! ID: {order.order_id}")
+        log.info("Заказ создан успешно! ID: %s", order.order_id)
         return order
 
+    except ValueError:
+        await db.rollback()
+        raise
     except Exception as e:
-        print(f"Ошибка при создании заказа: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Ошибка при создании заказа: %s", e)
         await db.rollback()
         raise
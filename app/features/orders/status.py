@@ -0,0 +1,101 @@
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Integer, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.order import Order, OrderStatus
+from app.models.order_item import OrderItem
+from app.models.order_status_change import OrderStatusChange
+from app.models.product import Product
+
+STATUS_LABELS: Dict[OrderStatus, str] = {
+    OrderStatus.NEW: "Новый",
+    OrderStatus.PAID: "Оплачен",
+    OrderStatus.SHIPPED: "Отгружен",
+    OrderStatus.DELIVERED: "Доставлен",
+    OrderStatus.CANCELLED: "Отменен",
+}
+
+# разрешенные переходы: статус -> куда из него можно перейти
+TRANSITIONS: Dict[OrderStatus, FrozenSet[OrderStatus]] = {
+    OrderStatus.NEW: frozenset({OrderStatus.PAID, OrderStatus.CANCELLED}),
+    OrderStatus.PAID: frozenset({OrderStatus.SHIPPED, OrderStatus.CANCELLED}),
+    OrderStatus.SHIPPED: frozenset({OrderStatus.DELIVERED}),
+    OrderStatus.DELIVERED: frozenset(),
+    OrderStatus.CANCELLED: frozenset(),
+}
+
+
+def can_transition(from_status: OrderStatus, to_status: OrderStatus) -> bool:
+    return to_status in TRANSITIONS[from_status]
+
+
+def sources_of(to_status: OrderStatus) -> List[OrderStatus]:
+    """Статусы, из которых разрешен переход в to_status"""
+    return [status for status, targets in TRANSITIONS.items() if to_status in targets]
+
+
+async def transition_orders(
+        db: AsyncSession,
+        order_ids: Sequence[int],
+        to_status: OrderStatus,
+        changed_by: Optional[int],
+) -> Tuple[List[int], List[int]]:
+    """
+    Переводит заказы в to_status одним запросом и коммитит.
+
+    Переход проверяется в самом UPDATE (status IN допустимые источники),
+    поэтому два сотрудника, двигающие один заказ одновременно, не обойдут
+    автомат: второй UPDATE перечитает строку после блокировки и пропустит
+    ее. Тем же запросом пишется история, а при отмене товар возвращается
+    на склад. Возвращает (переведенные, отклоненные) id заказов.
+    """
+    requested = sorted(set(order_ids))
+    sources = sources_of(to_status)
+    if not requested or not sources:
+        return [], requested
+
+    current = (
+        select(Order.order_id, Order.status)
+        .where(Order.order_id.in_(requested), Order.status.in_(sources))
+        .with_for_update()
+        .cte("current")
+    )
+    moved = (
+        update(Order)
+        .where(Order.order_id == current.c.order_id)
+        .values(status=to_status, updated_at=func.now())
+        .returning(Order.order_id, current.c.status.label("from_status"))
+        .cte("moved")
+    )
+    history = insert(OrderStatusChange).from_select(
+        ["order_id", "from_status", "to_status", "changed_by"],
+        select(
+            moved.c.order_id,
+            moved.c.from_status,
+            literal(to_status, Order.status.type),
+            literal(changed_by, Integer),
+        ),
+    ).cte("history")
+    stmt = select(moved.c.order_id).add_cte(history)
+
+    if to_status == OrderStatus.CANCELLED:
+        returned = (
+            select(OrderItem.product_id, func.sum(OrderItem.quantity).label("quantity"))
+            .where(OrderItem.order_id.in_(select(moved.c.order_id)))
+            .group_by(OrderItem.product_id)
+            .cte("returned")
+        )
+        restocked = (
+            update(Product)
+            .where(Product.product_id == returned.c.product_id)
+            .values(quantity_available=Product.quantity_available + returned.c.quantity)
+            .cte("restocked")
+        )
+        stmt = stmt.add_cte(restocked)
+
+    moved_ids = sorted((await db.execute(stmt)).scalars().all())
+    await db.commit()
+    moved_set = set(moved_ids)
+    return moved_ids, [order_id for order_id in requested if order_id not in moved_set]
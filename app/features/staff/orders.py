@@ -0,0 +1,140 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.core.encryption import encryption_service
+from app.features.orders.history import Cursor, encode_cursor
+from app.models.encrypted import decrypt_instances
+from app.models.order import Order, OrderStatus
+from app.models.order_item import OrderItem
+from app.models.user import User
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+async def find_customer_ids(db: AsyncSession, email: Optional[str], phone: Optional[str]) -> Optional[List[int]]:
+    """
+    id клиентов по слепым индексам email/телефона; None, если фильтр не задан.
+
+    Клиенты ищутся отдельным запросом, а не подзапросом IN: с константой
+    user_id Postgres читает заказы из ix_orders_user_id_created_at уже
+    отсортированными и останавливается на странице, а через соединение с
+    users сортирует все заказы клиента (у подрядчика их тысячи).
+    """
+    conditions = []
+    if email:
+        conditions.append(User.email_hash == encryption_service.hash_email(email))
+    phone_hash = encryption_service.hash_phone(phone)
+    if phone_hash:
+        conditions.append(User.phone_hash == phone_hash)
+    if not conditions:
+        return None
+    result = await db.execute(select(User.user_id).where(or_(*conditions)))
+    return list(result.scalars().all())
+
+
+async def list_orders(
+        db: AsyncSession,
+        *,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        customer_email: Optional[str] = None,
+        customer_phone: Optional[str] = None,
+        status: Optional[OrderStatus] = None,
+        cursor: Optional[Cursor] = None,
+        limit: int,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Страница списка заказов для сотрудников, от новых к старым.
+
+    Выбираются только нужные списку колонки, без загрузки сущностей и
+    связей; число позиций считается подзапросом для строк страницы.
+    Пагинация по ключу (created_at, order_id), как в истории заказов
+    клиента: без фильтра по клиенту запрос идет по ix_orders_created_at,
+    с фильтром - по ix_orders_user_id_created_at, с фильтром по активному
+    статусу - по частичному ix_orders_active_status. Даты - границы суток
+    по UTC, date_to включительно. Email расшифровывается только для страницы.
+    """
+    items_count = (
+        select(func.count())
+        .where(OrderItem.order_id == Order.order_id)
+        .correlate(Order)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            Order.order_id,
+            Order.user_id,
+            Order.created_at,
+            Order.total_price,
+            Order.status,
+            Order.encrypted_order_email,
+            items_count.label("items_count"),
+        )
+        .order_by(Order.created_at.desc(), Order.order_id.desc())
+        .limit(limit + 1)
+    )
+    if date_from is not None:
+        stmt = stmt.where(Order.created_at >= _day_start(date_from))
+    if date_to is not None:
+        stmt = stmt.where(Order.created_at < _day_start(date_to + timedelta(days=1)))
+    if status is not None:
+        stmt = stmt.where(Order.status == status)
+    customer_ids = await find_customer_ids(db, customer_email, customer_phone)
+    if customer_ids is not None:
+        if not customer_ids:
+            return [], None
+        if len(customer_ids) == 1:
+            stmt = stmt.where(Order.user_id == customer_ids[0])
+        else:
+            stmt = stmt.where(Order.user_id.in_(customer_ids))
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Order.created_at, Order.order_id) < tuple_(*cursor))
+
+    rows = (await db.execute(stmt)).all()
+    page = rows[:limit]
+    emails = await encryption_service.decrypt_many_async([row.encrypted_order_email for row in page])
+
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].order_id)
+
+    orders = [
+        {
+            "order_id": row.order_id,
+            "user_id": row.user_id,
+            "created_at": row.created_at,
+            "total_price": row.total_price,
+            "status": row.status,
+            "items_count": row.items_count,
+            "order_email": email,
+        }
+        for row, email in zip(page, emails)
+    ]
+    return orders, next_cursor
+
+
+async def get_order_detail(db: AsyncSession, order_id: int) -> Optional[Order]:
+    """
+    Заказ с клиентом, позициями, товарами и историей статусов за четыре
+    запроса независимо от числа позиций: клиент подтягивается JOIN,
+    остальное - через selectinload одним IN-запросом на уровень.
+    """
+    stmt = (
+        select(Order)
+        .where(Order.order_id == order_id)
+        .options(
+            joinedload(Order.user),
+            selectinload(Order.items).selectinload(OrderItem.product),
+            selectinload(Order.status_history),
+        )
+    )
+    order = (await db.execute(stmt)).unique().scalar_one_or_none()
+    if order is not None:
+        await decrypt_instances([order, order.user])
+    return order
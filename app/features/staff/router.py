@@ -1,3 +1,230 @@
-from fastapi import APIRouter
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request, status
+from fastapi.responses import HTMLResponse, RedirectResponse
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.encryption import encryption_service
+from app.core.settings import settings
+from app.features.auth.dependencies import get_current_staff
+from app.features.orders.history import decode_cursor
+from app.features.orders.status import STATUS_LABELS, TRANSITIONS, transition_orders
+from app.features.staff.orders import get_order_detail, list_orders
+from app.features.staff.schemas import (
+    OrderStatusBulkRequest,
+    OrderStatusBulkResult,
+    StaffOrderDetail,
+    StaffOrderItem,
+    StaffOrderPage,
+    StaffOrderStatusChange,
+)
+from app.features.users.schemas import UserPublic
+from app.infra.db import get_db
+from app.infra.templates import templates
+from app.models.encrypted import decrypt_instances
+from app.models.order import Order, OrderStatus
+from app.models.user import User
 
 router = APIRouter(prefix="/staff", tags=["staff"])
+
+
+@router.get("/customers/search", response_model=List[UserPublic])
+async def search_customers(
+        email: Optional[str] = Query(None),
+        phone: Optional[str] = Query(None),
+        db: AsyncSession = Depends(get_db),
+        staff: User = Depends(get_current_staff)
+):
+    """Точный поиск клиента по email и/или телефону через слепые индексы, один запрос"""
+    conditions = []
+    if email:
+        conditions.append(User.email_hash == encryption_service.hash_email(email))
+    phone_hash = encryption_service.hash_phone(phone)
+    if phone_hash:
+        conditions.append(User.phone_hash == phone_hash)
+
+    if not conditions:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите email или телефон"
+        )
+
+    result = await db.execute(select(User).where(or_(*conditions)).order_by(User.user_id))
+    users = result.scalars().all()
+    await decrypt_instances(users)
+    return users
+
+
+async def _orders_page(
+        db: AsyncSession,
+        date_from: Optional[date],
+        date_to: Optional[date],
+        email: Optional[str],
+        phone: Optional[str],
+        order_status: Optional[OrderStatus],
+        cursor: Optional[str],
+        limit: int,
+):
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await list_orders(
+        db,
+        date_from=date_from,
+        date_to=date_to,
+        customer_email=email,
+        customer_phone=phone,
+        status=order_status,
+        cursor=position,
+        limit=limit,
+    )
+
+
+def _order_detail(order: Order) -> StaffOrderDetail:
+    customer = order.user
+    return StaffOrderDetail(
+        order_id=order.order_id,
+        user_id=order.user_id,
+        created_at=order.created_at,
+        total_price=order.total_price,
+        status=order.status,
+        allowed_statuses=[target for target in OrderStatus if target in TRANSITIONS[order.status]],
+        order_email=order.order_email,
+        address=order.address,
+        customer_name=" ".join(filter(None, (customer.last_name, customer.first_name, customer.patronymic))),
+        customer_phone=customer.phone,
+        items=[
+            StaffOrderItem(
+                product_id=item.product_id,
+                name=item.product.name,
+                quantity=item.quantity,
+                price_per_unit=item.price_per_unit,
+                total=item.total,
+            )
+            for item in order.items
+        ],
+        status_history=[StaffOrderStatusChange.model_validate(change) for change in order.status_history],
+    )
+
+
+async def _load_order_detail(db: AsyncSession, order_id: int) -> StaffOrderDetail:
+    order = await get_order_detail(db, order_id)
+    if order is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Заказ не найден")
+    return _order_detail(order)
+
+
+@router.get("/orders", response_class=HTMLResponse)
+async def orders_page(
+        request: Request,
+        date_from: Optional[date] = Query(None),
+        date_to: Optional[date] = Query(None),
+        email: Optional[str] = Query(None),
+        phone: Optional[str] = Query(None),
+        order_status: Optional[OrderStatus] = Query(None, alias="status"),
+        cursor: Optional[str] = Query(None),
+        db: AsyncSession = Depends(get_db),
+        staff: User = Depends(get_current_staff)
+):
+    orders, next_cursor = await _orders_page(
+        db, date_from, date_to, email, phone, order_status, cursor, settings.STAFF_ORDERS_PAGE_SIZE
+    )
+    filters = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "email": email,
+        "phone": phone,
+        "status": order_status.value if order_status else None,
+    }
+    return templates.TemplateResponse(
+        "staff/orders.html",
+        {
+            "request": request,
+            "user": staff,
+            "orders": orders,
+            "filters": filters,
+            "status_labels": STATUS_LABELS,
+            "next_cursor": next_cursor,
+            "next_query": {key: value for key, value in filters.items() if value} | {"cursor": next_cursor},
+        }
+    )
+
+
+@router.get("/orders/api", response_model=StaffOrderPage)
+async def orders_api(
+        date_from: Optional[date] = Query(None),
+        date_to: Optional[date] = Query(None),
+        email: Optional[str] = Query(None),
+        phone: Optional[str] = Query(None),
+        order_status: Optional[OrderStatus] = Query(None, alias="status"),
+        cursor: Optional[str] = Query(None),
+        limit: int = Query(settings.STAFF_ORDERS_PAGE_SIZE, ge=1, le=200),
+        db: AsyncSession = Depends(get_db),
+        staff: User = Depends(get_current_staff)
+):
+    orders, next_cursor = await _orders_page(db, date_from, date_to, email, phone, order_status, cursor, limit)
+    return StaffOrderPage(orders=orders, next_cursor=next_cursor)
+
+
+@router.post("/orders/status/bulk", response_model=OrderStatusBulkResult)
+async def bulk_transition(
+        payload: OrderStatusBulkRequest,
+        db: AsyncSession = Depends(get_db),
+        staff: User = Depends(get_current_staff)
+):
+    """Переводит пачку заказов склада одним UPDATE; недопустимые переходы возвращаются в rejected"""
+    updated, rejected = await transition_orders(db, payload.order_ids, payload.status, staff.user_id)
+    return OrderStatusBulkResult(updated=updated, rejected=rejected)
+
+
+@router.get("/orders/{order_id}", response_class=HTMLResponse)
+async def order_detail_page(
+        request: Request,
+        order_id: int,
+        error: Optional[str] = None,
+        message: Optional[str] = None,
+        db: AsyncSession = Depends(get_db),
+        staff: User = Depends(get_current_staff)
+):
+    order = await _load_order_detail(db, order_id)
+    return templates.TemplateResponse(
+        "staff/order_detail.html",
+        {
+            "request": request,
+            "user": staff,
+            "order": order,
+            "status_labels": STATUS_LABELS,
+            "error": error,
+            "message": message
+        }
+    )
+
+
+@router.post("/orders/{order_id}/status", response_class=RedirectResponse)
+async def change_order_status(
+        order_id: int,
+        new_status: OrderStatus = Form(alias="status"),
+        db: AsyncSession = Depends(get_db),
+        staff: User = Depends(get_current_staff)
+):
+    staff_id = staff.user_id
+    updated, _ = await transition_orders(db, [order_id], new_status, staff_id)
+    if not updated:
+        return RedirectResponse(
+            url=f"/staff/orders/{order_id}?error=Недопустимая смена статуса", status_code=303
+        )
+    return RedirectResponse(
+        url=f"/staff/orders/{order_id}?message=Статус изменен: {STATUS_LABELS[new_status]}", status_code=303
+    )
+
+
+@router.get("/orders/{order_id}/api", response_model=StaffOrderDetail)
+async def order_detail_api(
+        order_id: int,
+        db: AsyncSession = Depends(get_db),
+        staff: User = Depends(get_current_staff)
+):
+    return await _load_order_detail(db, order_id)
@@ -0,0 +1,66 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.models.order import OrderStatus
+
+
+class StaffOrderRow(BaseModel):
+    order_id: int
+    user_id: int
+    created_at: datetime
+    total_price: Decimal
+    status: OrderStatus
+    items_count: int
+    order_email: str
+
+
+class StaffOrderPage(BaseModel):
+    orders: List[StaffOrderRow]
+    next_cursor: Optional[str] = None
+
+
+class StaffOrderItem(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    product_id: int
+    name: str
+    quantity: int
+    price_per_unit: Decimal
+    total: Decimal
+
+
+class StaffOrderStatusChange(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    from_status: OrderStatus
+    to_status: OrderStatus
+    changed_by: Optional[int] = None
+    changed_at: datetime
+
+
+class StaffOrderDetail(BaseModel):
+    order_id: int
+    user_id: int
+    created_at: datetime
+    total_price: Decimal
+    status: OrderStatus
+    allowed_statuses: List[OrderStatus]
+    order_email: str
+    address: str
+    customer_name: str
+    customer_phone: Optional[str] = None
+    items: List[StaffOrderItem]
+    status_history: List[StaffOrderStatusChange]
+
+
+class OrderStatusBulkRequest(BaseModel):
+    order_ids: List[int] = Field(min_length=1, max_length=1000)
+    status: OrderStatus
+
+
+class OrderStatusBulkResult(BaseModel):
+    updated: List[int]
+    rejected: List[int]
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Form, Cookie
 from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -20,7 +20,13 @@ from app.features.users.schemas import (
     UserCreate
 )
 from app.core.security import hash_password, verify_password
+from app.core.settings import settings
+from app.features.auth.service import auth_service
+from app.features.orders.history import decode_cursor, list_user_orders
+from app.features.orders.schemas import OrderHistoryPage
+from app.features.orders.status import STATUS_LABELS
 from app.infra.db import get_db
+from app.models.encrypted import decrypt_instances
 from app.models.user import User, UserRole
 
 router = APIRouter(prefix="/profile", tags=["profile"])
@@ -167,6 +173,46 @@ async def change_my_password(
             )
 
 
+async def _order_history_page(db: AsyncSession, user: User, cursor: Optional[str], limit: int):
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await list_user_orders(db, user.user_id, position, limit)
+
+
+@router.get("/orders", response_class=HTMLResponse)
+async def orders_page(
+        request: Request,
+        cursor: Optional[str] = None,
+        current_user: User = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_db)
+):
+    orders, next_cursor = await _order_history_page(db, current_user, cursor, settings.ORDER_HISTORY_PAGE_SIZE)
+    return templates.TemplateResponse(
+        "users/orders.html",
+        {
+            "request": request,
+            "user": current_user,
+            "orders": orders,
+            "status_labels": STATUS_LABELS,
+            "next_cursor": next_cursor,
+            "first_page": cursor is None
+        }
+    )
+
+
+@router.get("/orders/api", response_model=OrderHistoryPage)
+async def get_my_orders_api(
+        cursor: Optional[str] = None,
+        limit: int = Query(settings.ORDER_HISTORY_PAGE_SIZE, ge=1, le=100),
+        current_user: User = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_db)
+):
+    orders, next_cursor = await _order_history_page(db, current_user, cursor, limit)
+    return OrderHistoryPage(orders=orders, next_cursor=next_cursor)
+
+
 @router.get("/me/api", response_model=UserProfile)
 async def get_my_profile_api(
         current_user: User = Depends(get_current_active_user)
@@ -262,16 +308,25 @@ async def get_all_users(
         .order_by(User.created_at.desc())
     )
     users = result.scalars().all()
+    await decrypt_instances(users)
     return users
 
 
 @router.get("/logout", response_class=HTMLResponse)
 async def logout(
         request: Request,
-        response: RedirectResponse
+        response: RedirectResponse,
+        access_token: Optional[str] = Cookie(None, alias="access_token"),
+        refresh_token: Optional[str] = Cookie(None, alias=settings.REFRESH_COOKIE_NAME),
+        db: AsyncSession = Depends(get_db)
 ):
+    if access_token:
+        await auth_service.revoke_access_token(db, access_token)
+    if refresh_token:
+        await auth_service.revoke_refresh_token(db, refresh_token)
     response = RedirectResponse(url="/auth/login", status_code=303)
     response.delete_cookie(key="access_token")
+    response.delete_cookie(key=settings.REFRESH_COOKIE_NAME)
     response.delete_cookie(key="token_type")
     return response
 
@@ -279,10 +334,18 @@ async def logout(
 @router.post("/logout", response_class=HTMLResponse)
 async def logout_post(
         request: Request,
-        response: RedirectResponse
+        response: RedirectResponse,
+        access_token: Optional[str] = Cookie(None, alias="access_token"),
+        refresh_token: Optional[str] = Cookie(None, alias=settings.REFRESH_COOKIE_NAME),
+        db: AsyncSession = Depends(get_db)
 ):
+    if access_token:
+        await auth_service.revoke_access_token(db, access_token)
+    if refresh_token:
+        await auth_service.revoke_refresh_token(db, refresh_token)
     response = RedirectResponse(url="/auth/login", status_code=303)
     response.delete_cookie(key="access_token")
+    response.delete_cookie(key=settings.REFRESH_COOKIE_NAME)
     response.delete_cookie(key="token_type")
     return response
 
@@ -125,7 +125,7 @@ class UserPublic(BaseModel):
     user_id: int
     email: EmailStr
     first_name: str
-    patronymic: str
+    patronymic: Optional[str] = None
     last_name: str
     phone: str
     role: str
@@ -0,0 +1,98 @@
+"""
+Пересчет слепых индексов users.email_hash и users.phone_hash.
+
+Нужен после перехода с SHA-256 без ключа на HMAC и после смены BLIND_INDEX_KEY.
+Проходит users пачками по user_id, расшифровывает email и телефон и обновляет
+только расходящиеся индексы одним UPDATE ... FROM (VALUES ...) на пачку.
+Уже пересчитанные записи пропускаются, поэтому задачу можно перезапускать.
+
+Запуск:
+    python -m app.infra.blind_index_backfill
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import String, and_, column, select, update, values
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core import encryption
+from app.core.settings import settings
+from app.models.user import User
+
+log = logging.getLogger(__name__)
+
+
+async def backfill_blind_indexes(
+        session_factory: Optional[async_sessionmaker] = None,
+        batch_size: Optional[int] = None,
+        rows_per_second: Optional[int] = None
+) -> int:
+    if session_factory is None:
+        from app.infra.db import SessionLocal
+        session_factory = SessionLocal
+    batch_size = batch_size or settings.KEY_ROTATION_BATCH_SIZE
+    if rows_per_second is None:
+        rows_per_second = settings.KEY_ROTATION_ROWS_PER_SECOND
+
+    service = encryption.encryption_service
+    last_id = 0
+    scanned = 0
+    updated = 0
+    started = time.monotonic()
+
+    while True:
+        async with session_factory() as db:
+            rows = (await db.execute(
+                select(User.user_id, User.encrypted_email, User.encrypted_phone, User.email_hash, User.phone_hash)
+                .where(User.user_id > last_id)
+                .order_by(User.user_id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                break
+
+            changed = []
+            for user_id, encrypted_email, encrypted_phone, email_hash, phone_hash in rows:
+                new_email_hash = service.hash_email(service.decrypt(encrypted_email))
+                new_phone_hash = service.hash_phone(service.decrypt(encrypted_phone))
+                if new_email_hash and (new_email_hash, new_phone_hash) != (email_hash, phone_hash):
+                    changed.append((user_id, encrypted_email, new_email_hash, new_phone_hash))
+
+            if changed:
+                batch = values(
+                    column("user_id", User.user_id.type),
+                    column("encrypted_email", User.encrypted_email.type),
+                    column("email_hash", String),
+                    column("phone_hash", String),
+                    name="batch",
+                ).data(changed)
+                result = await db.execute(
+                    update(User.__table__)
+                    .where(and_(
+                        User.user_id == batch.c.user_id,
+                        # email успели поменять - индекс уже посчитан update_encrypted_data
+                        User.encrypted_email == batch.c.encrypted_email
+                    ))
+                    .values(email_hash=batch.c.email_hash, phone_hash=batch.c.phone_hash)
+                    .returning(User.user_id)
+                )
+                updated += len(result.all())
+                await db.commit()
+
+        last_id = rows[-1][0]
+        scanned += len(rows)
+        log.info("Слепые индексы: просмотрено %s, обновлено %s", scanned, updated)
+
+        if rows_per_second > 0:
+            delay = scanned / rows_per_second - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(backfill_blind_indexes())
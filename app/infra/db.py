@@ -4,8 +4,20 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from app.core.settings import settings
+from app.infra.db_pool import InstrumentedPool, install_idle_pre_ping
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=False,
+    poolclass=InstrumentedPool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING == "always",
+)
+if settings.DB_POOL_PRE_PING == "idle":
+    install_idle_pre_ping(engine, settings.DB_POOL_PRE_PING_IDLE_SECONDS)
 SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -15,13 +27,7 @@ async def get_db():
 
 
 async def init_models() -> None:
-    from app.models.base import Base
-    from app.models.user import User
-    from app.models.product import Product
-    from app.models.cart import Cart
-    from app.models.cart_item import CartItem
-    from app.models.order import Order
-    from app.models.order_item import OrderItem
+    """Приводит схему БД к текущей версии миграциями из app.infra.migrations"""
+    from app.infra.migrations import upgrade
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await upgrade(engine)
@@ -0,0 +1,130 @@
+"""
+Пул соединений с БД: стратегии проверки соединений и метрики.
+
+Каждый процесс (воркер uvicorn) держит свой пул, поэтому метрики тоже
+свои у каждого процесса и помечены меткой pid. Для подбора размера пула
+смотрят на db_pool_checkout_wait_seconds: если заметная доля выдач ждет
+дольше миллисекунд, соединений не хватает; если db_pool_idle почти всегда
+равен размеру пула, его можно уменьшить.
+"""
+import bisect
+import os
+import time
+from typing import List, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# границы корзин гистограммы ожидания соединения, секунды
+WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = WAIT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """Накопленные счетчики по корзинам, последний - +Inf"""
+        result, total = [], 0
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkout_wait = Histogram()
+        self.checkout_timeouts = 0
+        self.pings = 0
+        self.ping_failures = 0
+
+    def render(self, pool: AsyncAdaptedQueuePool) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        labels = f'pid="{os.getpid()}"'
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, value) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{{{labels}}} {value}")
+
+        metric("db_pool_size", "gauge", "Постоянный размер пула", pool.size())
+        metric("db_pool_checked_out", "gauge", "Соединения, выданные запросам", pool.checkedout())
+        metric("db_pool_idle", "gauge", "Открытые соединения, ждущие в пуле", pool.checkedin())
+        metric("db_pool_checkout_timeouts_total", "counter",
+               "Запросы, не дождавшиеся соединения за DB_POOL_TIMEOUT", self.checkout_timeouts)
+        metric("db_pool_pings_total", "counter", "Проверки простаивавших соединений перед выдачей", self.pings)
+        metric("db_pool_ping_failures_total", "counter", "Соединения, не прошедшие проверку", self.ping_failures)
+
+        name = "db_pool_checkout_wait_seconds"
+        wait = self.checkout_wait
+        lines.append(f"# HELP {name} Время получения соединения из пула")
+        lines.append(f"# TYPE {name} histogram")
+        bounds = [repr(bound) for bound in wait.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, wait.cumulative()):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {wait.sum}")
+        lines.append(f"{name}_count{{{labels}}} {wait.count}")
+        return "\n".join(lines) + "\n"
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул, который замеряет время выдачи соединения: ожидание свободного
+    соединения, открытие нового и проверку перед выдачей.
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            pool_metrics.checkout_timeouts += 1
+            raise
+        finally:
+            pool_metrics.checkout_wait.observe(time.perf_counter() - started)
+
+
+def install_idle_pre_ping(engine: AsyncEngine, idle_seconds: float) -> None:
+    """
+    Проверка соединения только после простоя дольше idle_seconds.
+
+    pool_pre_ping=True делает SELECT 1 при каждой выдаче, то есть лишний
+    круг до БД на каждый запрос. Обрывы (рестарт Postgres, таймауты
+    балансировщика) случаются с простаивающими соединениями, поэтому
+    свежевозвращенные в пул выдаются без проверки. Не прошедшее проверку
+    соединение пул закрывает и выдает новое.
+    """
+    # слушатели на движке, а не на пуле: переживают пересоздание пула в dispose()
+    target = engine.sync_engine
+    dialect = target.dialect
+
+    @event.listens_for(target, "checkin")
+    def remember_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(target, "checkout")
+    def ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        pool_metrics.pings += 1
+        try:
+            dialect.do_ping(dbapi_connection)
+        except Exception as exc:
+            pool_metrics.ping_failures += 1
+            raise DisconnectionError("Соединение из пула не отвечает") from exc
@@ -1,27 +1,74 @@
 import logging
-import smtplib
 from email.message import EmailMessage
+from typing import Optional
+
+import aiosmtplib
 
 from app.core.settings import settings
 
 log = logging.getLogger(__name__)
 
 
-def send_order_confirmation(to_email: str, order_id: int) -> None:
-    # SMTP не настроен, только логирование для запуска проекта
-    if not settings.SMTP_HOST:
-        log.info("SMTP не настроен: to_email=%s order_id=%s", to_email, order_id)
-        return
-
+def build_order_confirmation(to_email: str, order_id: int) -> EmailMessage:
     message = EmailMessage()
     message["Subject"] = f"Подтверждение заказа №{order_id}"
     message["From"] = settings.SMTP_FROM
     message["To"] = to_email
     # можно что-то добавить в сообщение
     message.set_content(f"Спасибо за заказ! Номер заказа: {order_id}")
+    return message
+
+
+class EmailSender:
+    """
+    Асинхронная отправка писем через одно SMTP-соединение.
+
+    Соединение (с STARTTLS и логином) открывается при первой отправке и
+    переиспользуется для следующих писем и пачек; при ошибке связи оно
+    закрывается и открывается заново на следующей попытке.
+    """
+
+    def __init__(self):
+        self._client: Optional[aiosmtplib.SMTP] = None
 
-    with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as s:
-        s.starttls()
+    @property
+    def configured(self) -> bool:
+        return bool(settings.SMTP_HOST)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        if self._client is not None and self._client.is_connected:
+            return self._client
+        client = aiosmtplib.SMTP(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            start_tls=settings.SMTP_STARTTLS,
+            timeout=settings.SMTP_TIMEOUT_SECONDS,
+        )
+        await client.connect()
         if settings.SMTP_USER and settings.SMTP_PASSWORD:
-            s.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-        s.send_message(message)
+            await client.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        self._client = client
+        return client
+
+    async def send(self, message: EmailMessage) -> None:
+        # SMTP не настроен, только логирование для запуска проекта
+        if not self.configured:
+            log.info("SMTP не настроен: to_email=%s subject=%s", message["To"], message["Subject"])
+            return
+        client = await self._connect()
+        try:
+            await client.send_message(message)
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, OSError):
+            await self.close()
+            raise
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        if client is not None and client.is_connected:
+            try:
+                await client.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                client.close()
+
+
+email_sender = EmailSender()
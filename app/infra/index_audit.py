@@ -0,0 +1,102 @@
+"""
+Аудит индексов текущей схемы.
+
+Показывает внешние ключи без индекса (Postgres не создает его сам, и без
+него каскадные удаления и проверки RESTRICT просматривают таблицу целиком)
+и таблицы, которые чаще читаются последовательным сканированием, чем по
+индексу, по статистике pg_stat_user_tables с последнего сброса.
+
+Запуск:
+    python -m app.infra.index_audit [--min-rows 10000]
+
+Код возврата 1, если найден внешний ключ без индекса, - команду можно
+ставить в CI после миграций.
+"""
+import argparse
+import asyncio
+import sys
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# индекс покрывает внешний ключ, если колонки ключа - его первые колонки
+# (в любом порядке); частичные индексы не считаются: проверке нужны все строки
+UNINDEXED_FOREIGN_KEYS = text("""
+    SELECT c.conrelid::regclass::text AS table_name,
+           c.conname AS constraint_name,
+           array_agg(a.attname::text ORDER BY k.n) AS columns
+    FROM pg_constraint c
+    CROSS JOIN LATERAL unnest(c.conkey) WITH ORDINALITY AS k(attnum, n)
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+    WHERE c.contype = 'f'
+      AND c.connamespace = current_schema()::regnamespace
+      AND NOT EXISTS (
+          SELECT 1
+          FROM pg_index i
+          WHERE i.indrelid = c.conrelid
+            AND i.indpred IS NULL
+            AND (string_to_array(i.indkey::text, ' ')::int2[])[1:cardinality(c.conkey)] @> c.conkey
+            AND (string_to_array(i.indkey::text, ' ')::int2[])[1:cardinality(c.conkey)] <@ c.conkey
+      )
+    GROUP BY c.conrelid, c.conname
+    ORDER BY 1, 2
+""")
+
+SEQ_SCAN_HEAVY_TABLES = text("""
+    SELECT relname AS table_name,
+           n_live_tup AS live_rows,
+           seq_scan,
+           seq_tup_read,
+           coalesce(idx_scan, 0) AS idx_scan
+    FROM pg_stat_user_tables
+    WHERE schemaname = current_schema()
+      AND n_live_tup >= :min_rows
+      AND seq_scan > coalesce(idx_scan, 0)
+    ORDER BY seq_tup_read DESC
+""")
+
+
+async def find_unindexed_foreign_keys(conn: AsyncConnection) -> List[Row]:
+    return list((await conn.execute(UNINDEXED_FOREIGN_KEYS)).all())
+
+
+async def find_seq_scan_heavy_tables(conn: AsyncConnection, min_rows: int) -> List[Row]:
+    """Таблицы не меньше min_rows живых строк, где seq_scan обгоняет idx_scan"""
+    return list((await conn.execute(SEQ_SCAN_HEAVY_TABLES, {"min_rows": min_rows})).all())
+
+
+async def audit(min_rows: int) -> int:
+    from app.infra.db import engine
+
+    try:
+        async with engine.connect() as conn:
+            foreign_keys = await find_unindexed_foreign_keys(conn)
+            tables = await find_seq_scan_heavy_tables(conn, min_rows)
+    finally:
+        await engine.dispose()
+
+    print("Внешние ключи без индекса:")
+    for row in foreign_keys:
+        print(f"  {row.table_name} ({', '.join(row.columns)})  {row.constraint_name}")
+    if not foreign_keys:
+        print("  нет")
+
+    print(f"Таблицы от {min_rows} строк, читаемые в основном последовательно:")
+    for row in tables:
+        print(
+            f"  {row.table_name}: строк {row.live_rows}, seq_scan {row.seq_scan} "
+            f"(прочитано {row.seq_tup_read}), idx_scan {row.idx_scan}"
+        )
+    if not tables:
+        print("  нет")
+    return 1 if foreign_keys else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Аудит индексов БД")
+    parser.add_argument("--min-rows", type=int, default=10_000, help="не показывать таблицы меньше этого размера")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(audit(args.min_rows)))
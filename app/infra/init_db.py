@@ -1,5 +1,8 @@
 import asyncio
+import logging
+
 from app.infra.db import init_models
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(init_models())
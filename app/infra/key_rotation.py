@@ -0,0 +1,212 @@
+"""
+Фоновая перешифровка ПД после смены ENCRYPTION_KEY.
+
+Старый ключ переносится в ENCRYPTION_OLD_KEYS, приложение продолжает читать
+старые шифротексты через MultiFernet, а эта задача проходит users и orders
+пачками по первичному ключу и перешифровывает устаревшие значения текущим ключом.
+Каждая пачка - короткая транзакция с построчными блокировками, скорость
+ограничена KEY_ROTATION_ROWS_PER_SECOND, позиция сохраняется в
+encryption_rotation_checkpoints, поэтому задачу можно прервать и запустить снова.
+После полного прохода позиция удаляется: следующая смена ключа начнет с начала.
+
+Запуск:
+    python -m app.infra.key_rotation [--restart]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import and_, cast, column, delete, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import encryption
+from app.core.settings import settings
+from app.models.encryption_rotation import EncryptionRotationCheckpoint
+from app.models.order import Order
+from app.models.user import User
+
+log = logging.getLogger(__name__)
+
+ROTATION_MODELS = (User, Order)
+
+
+@dataclass
+class RotationProgress:
+    table_name: str
+    last_id: int = 0
+    rows_scanned: int = 0
+    rows_updated: int = 0
+
+
+async def _load_checkpoint(db: AsyncSession, table_name: str) -> RotationProgress:
+    checkpoint = await db.get(EncryptionRotationCheckpoint, table_name)
+    if not checkpoint:
+        return RotationProgress(table_name=table_name)
+    return RotationProgress(
+        table_name=table_name,
+        last_id=checkpoint.last_id,
+        rows_scanned=checkpoint.rows_scanned,
+        rows_updated=checkpoint.rows_updated,
+    )
+
+
+def _checkpoint_stmt(progress: RotationProgress):
+    values = {
+        "table_name": progress.table_name,
+        "last_id": progress.last_id,
+        "rows_scanned": progress.rows_scanned,
+        "rows_updated": progress.rows_updated,
+    }
+    stmt = insert(EncryptionRotationCheckpoint).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=[EncryptionRotationCheckpoint.table_name],
+        set_={key: stmt.excluded[key] for key in values if key != "table_name"},
+    )
+
+
+def _rotate_row(row, columns) -> Optional[dict]:
+    service = encryption.encryption_service
+    changes = {}
+    for name in columns:
+        value = getattr(row, name)
+        if not service.needs_rotation(value):
+            continue
+        try:
+            changes[name] = service.rotate(value)
+        except InvalidToken:
+            log.warning("Не удалось расшифровать %s у записи %s", name, row[0])
+    return changes or None
+
+
+def _update_stmt(table, columns, rows: list[dict]):
+    """
+    Один UPDATE ... FROM (VALUES ...) на пачку. Старые шифротексты сверяются:
+    если запись успели изменить после чтения пачки, она просто не обновится.
+    """
+    pk = table.primary_key.columns[0]
+    batch = values(
+        column("pk", pk.type),
+        *(column(f"old_{name}", table.c[name].type) for name in columns),
+        *(column(f"new_{name}", table.c[name].type) for name in columns),
+        name="batch",
+    ).data([
+        (row["pk"], *(row["old"][name] for name in columns), *(row["new"][name] for name in columns))
+        for row in rows
+    ])
+    # колонка VALUES из одних NULL получает тип text, поэтому приводим явно
+    conditions = [pk == batch.c.pk]
+    conditions += [
+        table.c[name].is_not_distinct_from(cast(batch.c[f"old_{name}"], table.c[name].type))
+        for name in columns
+    ]
+    return (
+        update(table)
+        .where(and_(*conditions))
+        .values({name: cast(batch.c[f"new_{name}"], table.c[name].type) for name in columns})
+        .returning(pk)
+    )
+
+
+async def rotate_table(
+        session_factory: async_sessionmaker,
+        model,
+        batch_size: int,
+        rows_per_second: int,
+        restart: bool = False,
+        on_progress: Optional[Callable[[RotationProgress], None]] = None
+) -> RotationProgress:
+    table = model.__table__
+    pk = table.primary_key.columns[0]
+    columns = model.__encrypted_columns__
+
+    async with session_factory() as db:
+        progress = RotationProgress(table_name=table.name) if restart else await _load_checkpoint(db, table.name)
+
+    started = time.monotonic()
+    scanned_in_run = 0
+
+    while True:
+        async with session_factory() as db:
+            rows = (await db.execute(
+                select(pk, *(table.c[name] for name in columns))
+                .where(pk > progress.last_id)
+                .order_by(pk)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                # проход завершен; старая позиция не должна пропустить строки при следующей ротации
+                await db.execute(
+                    delete(EncryptionRotationCheckpoint)
+                    .where(EncryptionRotationCheckpoint.table_name == progress.table_name)
+                )
+                await db.commit()
+                break
+
+            stale = []
+            for row in rows:
+                changes = _rotate_row(row, columns)
+                if changes:
+                    old = {name: row._mapping[name] for name in columns}
+                    stale.append({"pk": row[0], "old": old, "new": {**old, **changes}})
+
+            if stale:
+                result = await db.execute(_update_stmt(table, columns, stale))
+                progress.rows_updated += len(result.all())
+
+            progress.last_id = rows[-1][0]
+            progress.rows_scanned += len(rows)
+            await db.execute(_checkpoint_stmt(progress))
+            await db.commit()
+
+        scanned_in_run += len(rows)
+        if on_progress:
+            on_progress(progress)
+        log.info(
+            "Перешифровка %s: просмотрено %s, обновлено %s, id <= %s",
+            progress.table_name, progress.rows_scanned, progress.rows_updated, progress.last_id
+        )
+
+        if rows_per_second > 0:
+            delay = scanned_in_run / rows_per_second - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    return progress
+
+
+async def rotate_encryption_keys(
+        session_factory: Optional[async_sessionmaker] = None,
+        batch_size: Optional[int] = None,
+        rows_per_second: Optional[int] = None,
+        restart: bool = False,
+        on_progress: Optional[Callable[[RotationProgress], None]] = None
+) -> list[RotationProgress]:
+    if session_factory is None:
+        from app.infra.db import SessionLocal
+        session_factory = SessionLocal
+
+    return [
+        await rotate_table(
+            session_factory,
+            model,
+            batch_size=batch_size or settings.KEY_ROTATION_BATCH_SIZE,
+            rows_per_second=settings.KEY_ROTATION_ROWS_PER_SECOND if rows_per_second is None else rows_per_second,
+            restart=restart,
+            on_progress=on_progress,
+        )
+        for model in ROTATION_MODELS
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перешифровка ПД текущим ключом")
+    parser.add_argument("--restart", action="store_true", help="начать с начала, игнорируя сохраненную позицию")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(rotate_encryption_keys(restart=args.restart))
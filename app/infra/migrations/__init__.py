@@ -0,0 +1,31 @@
+"""
+Миграции схемы БД.
+
+Каждая миграция - модуль в пакете versions с объектом migration; версии
+применяются по порядку, примененные записываются в schema_migrations.
+Индексы на существующих таблицах добавляются шагом CreateIndex (CREATE
+INDEX CONCURRENTLY), массовые обновления - шагом Backfill пачками с
+продолжением после сбоя.
+
+Запуск:
+    python -m app.infra.migrations upgrade [--dry-run]
+    python -m app.infra.migrations status
+
+--dry-run ничего не меняет и печатает шаги ожидающих миграций с уровнем
+блокировки таблиц, который возьмет каждый шаг.
+"""
+from app.infra.migrations.base import Backfill, Callback, CreateIndex, Migration, Sql, Step
+from app.infra.migrations.runner import describe_plan, load_migrations, pending_migrations, upgrade
+
+__all__ = [
+    "Backfill",
+    "Callback",
+    "CreateIndex",
+    "Migration",
+    "Sql",
+    "Step",
+    "describe_plan",
+    "load_migrations",
+    "pending_migrations",
+    "upgrade",
+]
@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import logging
+
+from app.infra.migrations.runner import describe_plan, load_migrations, pending_migrations, upgrade
+
+
+async def main(command: str, dry_run: bool) -> None:
+    from app.infra.db import engine
+
+    try:
+        if command == "upgrade" and dry_run:
+            pending = await pending_migrations(engine)
+            for line in describe_plan(pending) or ["Нет ожидающих миграций"]:
+                print(line)
+        elif command == "upgrade":
+            applied = await upgrade(engine)
+            print(f"Применено миграций: {len(applied)}")
+        else:
+            pending = {migration.version for migration in await pending_migrations(engine)}
+            for migration in load_migrations():
+                state = "ожидает" if migration.version in pending else "применена"
+                print(f"{migration.version}  {state:<9}  {migration.description}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("command", nargs="?", choices=["upgrade", "status"], default="upgrade")
+    parser.add_argument("--dry-run", action="store_true", help="только показать шаги и их блокировки")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.command, args.dry_run))
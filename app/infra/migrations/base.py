@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Tuple, Union
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# уровни блокировки таблиц Postgres, от слабых к сильным (по используемым здесь)
+ROW_EXCLUSIVE = "ROW EXCLUSIVE"
+SHARE_UPDATE_EXCLUSIVE = "SHARE UPDATE EXCLUSIVE"
+SHARE = "SHARE"
+ACCESS_EXCLUSIVE = "ACCESS EXCLUSIVE"
+
+# блокировка, которую берет выражение, по его началу; первое совпадение
+_STATEMENT_LOCKS = (
+    ("CREATE INDEX CONCURRENTLY", SHARE_UPDATE_EXCLUSIVE),
+    ("CREATE UNIQUE INDEX CONCURRENTLY", SHARE_UPDATE_EXCLUSIVE),
+    ("CREATE INDEX", SHARE),
+    ("CREATE UNIQUE INDEX", SHARE),
+    ("UPDATE", ROW_EXCLUSIVE),
+    ("INSERT", ROW_EXCLUSIVE),
+    ("DELETE", ROW_EXCLUSIVE),
+    ("CREATE TYPE", None),
+    ("DO ", None),
+)
+
+
+def _one_line(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+@dataclass(frozen=True)
+class Sql:
+    """
+    Шаг из одного SQL-выражения; выполняется как есть, без bind-параметров,
+    в общей транзакции миграции. Уровень блокировки определяется по началу
+    выражения (ALTER TABLE, CREATE TABLE и прочее - ACCESS EXCLUSIVE) или
+    задается явно.
+    """
+    statement: str
+    lock: Optional[str] = None
+
+    transactional = True
+
+    @property
+    def description(self) -> str:
+        return _one_line(self.statement)
+
+    @property
+    def lock_level(self) -> Optional[str]:
+        if self.lock is not None:
+            return self.lock
+        statement = self.description.upper()
+        for prefix, lock in _STATEMENT_LOCKS:
+            if statement.startswith(prefix):
+                return lock
+        return ACCESS_EXCLUSIVE
+
+
+@dataclass(frozen=True)
+class Callback:
+    """Шаг, которому мало одного выражения: функция получает соединение миграции"""
+    description: str
+    func: Callable[[AsyncConnection], Awaitable[Any]]
+    lock: Optional[str] = ACCESS_EXCLUSIVE
+
+    transactional = True
+
+    @property
+    def lock_level(self) -> Optional[str]:
+        return self.lock
+
+
+@dataclass(frozen=True)
+class CreateIndex:
+    """
+    Индекс на существующей таблице.
+
+    По умолчанию строится через CREATE INDEX CONCURRENTLY: таблица берется
+    под SHARE UPDATE EXCLUSIVE, чтение и запись не останавливаются. Такое
+    выражение нельзя выполнить в транзакции, поэтому шаг идет отдельно от
+    остальных шагов миграции. Недостроенный (INVALID) индекс после сбоя
+    удаляется и строится заново.
+    """
+    name: str
+    table: str
+    columns: str
+    where: Optional[str] = None
+    unique: bool = False
+    concurrently: bool = True
+
+    @property
+    def transactional(self) -> bool:
+        return not self.concurrently
+
+    @property
+    def statement(self) -> str:
+        parts = ["CREATE"]
+        if self.unique:
+            parts.append("UNIQUE")
+        parts.append("INDEX")
+        if self.concurrently:
+            parts.append("CONCURRENTLY")
+        parts.append(f"IF NOT EXISTS {self.name} ON {self.table} ({self.columns})")
+        if self.where:
+            parts.append(f"WHERE {self.where}")
+        return " ".join(parts)
+
+    @property
+    def description(self) -> str:
+        return self.statement
+
+    @property
+    def lock_level(self) -> str:
+        return SHARE_UPDATE_EXCLUSIVE if self.concurrently else SHARE
+
+
+@dataclass(frozen=True)
+class Backfill:
+    """
+    Массовый UPDATE пачками по возрастанию ключа key (уникальная
+    целочисленная колонка с индексом, обычно первичный ключ; значения от 1).
+
+    Каждая пачка - отдельная транзакция вместе с отметкой о прогрессе в
+    schema_migration_checkpoints, поэтому строки блокируются ненадолго, а
+    прерванный шаг при следующем запуске продолжается с последней пачки.
+    set_clause и where - фрагменты SQL для UPDATE table SET ... WHERE ...;
+    batch_size по умолчанию - settings.MIGRATION_BATCH_SIZE.
+    """
+    table: str
+    key: str
+    set_clause: str
+    where: Optional[str] = None
+    batch_size: Optional[int] = None
+
+    transactional = False
+
+    @property
+    def description(self) -> str:
+        statement = f"UPDATE {self.table} SET {_one_line(self.set_clause)}"
+        if self.where:
+            statement += f" WHERE {_one_line(self.where)}"
+        return f"{statement} (пачками по {self.key})"
+
+    @property
+    def lock_level(self) -> str:
+        return ROW_EXCLUSIVE
+
+
+Step = Union[Sql, Callback, CreateIndex, Backfill]
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: str
+    description: str
+    steps: Tuple[Step, ...]
@@ -0,0 +1,218 @@
+import importlib
+import logging
+import pkgutil
+from typing import List, Optional, Sequence, Set
+
+from sqlalchemy import column, insert, select, table, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.settings import settings
+from app.infra.migrations import versions
+from app.infra.migrations.base import Backfill, Callback, CreateIndex, Migration, Sql, Step
+
+log = logging.getLogger(__name__)
+
+# ключ pg_advisory_lock: два процесса (например, несколько реплик web при
+# старте) не должны применять миграции одновременно
+LOCK_KEY = 482_901_137
+
+schema_migrations = table("schema_migrations", column("version"), column("description"))
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(32) PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+)
+"""
+
+CREATE_CHECKPOINTS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migration_checkpoints (
+    version VARCHAR(32) NOT NULL,
+    step INTEGER NOT NULL,
+    last_key BIGINT NOT NULL,
+    rows_updated BIGINT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (version, step)
+)
+"""
+
+
+def load_migrations() -> List[Migration]:
+    """Все миграции из пакета versions, по возрастанию версии"""
+    migrations = []
+    for info in pkgutil.iter_modules(versions.__path__):
+        module = importlib.import_module(f"{versions.__name__}.{info.name}")
+        migrations.append(module.migration)
+    migrations.sort(key=lambda migration: migration.version)
+    for previous, current in zip(migrations, migrations[1:]):
+        if previous.version == current.version:
+            raise RuntimeError(f"Повторяется версия миграции {current.version}")
+    return migrations
+
+
+def describe_plan(migrations: Sequence[Migration]) -> List[str]:
+    """Строки для пробного запуска: шаги миграций с уровнем блокировки"""
+    lines = []
+    for migration in migrations:
+        lines.append(f"{migration.version}  {migration.description}")
+        for step in migration.steps:
+            lock = step.lock_level or "без блокировки таблиц"
+            mode = "в транзакции" if step.transactional else "без общей транзакции"
+            lines.append(f"  [{lock}; {mode}] {step.description}")
+    return lines
+
+
+async def _applied_versions(conn: AsyncConnection) -> Set[str]:
+    """Примененные версии; таблицу не создает, чтобы status и --dry-run ничего не меняли"""
+    exists = (await conn.execute(text("SELECT to_regclass('schema_migrations') IS NOT NULL"))).scalar()
+    found = set()
+    if exists:
+        found = set((await conn.execute(select(schema_migrations.c.version))).scalars().all())
+    await conn.commit()
+    return found
+
+
+async def _run_step(conn: AsyncConnection, step: Step) -> None:
+    if isinstance(step, (Sql, CreateIndex)):
+        await conn.exec_driver_sql(step.statement)
+    elif isinstance(step, Callback):
+        await step.func(conn)
+    else:
+        raise TypeError(f"Неизвестный шаг миграции: {step!r}")
+
+
+async def _create_index_concurrently(online: AsyncConnection, step: CreateIndex) -> None:
+    # после сбоя CONCURRENTLY оставляет индекс INVALID, и IF NOT EXISTS его бы пропустил
+    invalid = (await online.execute(
+        text(
+            "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND c.relnamespace = current_schema()::regnamespace"
+        ),
+        {"name": step.name},
+    )).scalar()
+    if invalid:
+        log.warning("Индекс %s недостроен, строится заново", step.name)
+        await online.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {step.name}")
+    await online.exec_driver_sql(step.statement)
+
+
+async def _backfill(conn: AsyncConnection, version: str, index: int, step: Backfill) -> int:
+    """Одно выражение на пачку: UPDATE и отметка о прогрессе в одной транзакции"""
+    where = f" AND ({step.where})" if step.where else ""
+    batch_stmt = text(f"""
+        WITH batch AS (
+            SELECT {step.key} FROM {step.table}
+            WHERE {step.key} > :last_key
+            ORDER BY {step.key}
+            LIMIT :batch_size
+        ), updated AS (
+            UPDATE {step.table} SET {step.set_clause}
+            WHERE {step.key} IN (SELECT {step.key} FROM batch){where}
+            RETURNING 1
+        ), progress AS (
+            INSERT INTO schema_migration_checkpoints (version, step, last_key, rows_updated)
+            SELECT :version, :step, max(batch.{step.key}), (SELECT count(*) FROM updated)
+            FROM batch
+            HAVING count(*) > 0
+            ON CONFLICT (version, step) DO UPDATE SET
+                last_key = EXCLUDED.last_key,
+                rows_updated = schema_migration_checkpoints.rows_updated + EXCLUDED.rows_updated,
+                updated_at = now()
+            RETURNING last_key, rows_updated
+        )
+        SELECT last_key, rows_updated FROM progress
+    """)
+    params = {"version": version, "step": index, "batch_size": step.batch_size or settings.MIGRATION_BATCH_SIZE}
+
+    last_key = (await conn.execute(
+        text("SELECT last_key FROM schema_migration_checkpoints WHERE version = :version AND step = :step"),
+        {"version": version, "step": index},
+    )).scalar()
+    await conn.commit()
+    if last_key is not None:
+        log.info("Миграция %s, шаг %s: продолжение после %s = %s", version, index, step.key, last_key)
+
+    rows_updated = 0
+    while True:
+        async with conn.begin():
+            progress = (await conn.execute(batch_stmt, {**params, "last_key": last_key or 0})).first()
+        if progress is None:
+            return rows_updated
+        last_key, rows_updated = progress
+        log.info(
+            "Миграция %s, шаг %s: %s = %s, обновлено строк %s", version, index, step.key, last_key, rows_updated
+        )
+
+
+async def _apply(conn: AsyncConnection, online: AsyncConnection, migration: Migration) -> None:
+    """
+    Подряд идущие транзакционные шаги выполняются в одной транзакции;
+    CREATE INDEX CONCURRENTLY и пачки Backfill - вне ее. Версия
+    записывается последней транзакцией, поэтому миграция, прерванная
+    между шагами, при следующем запуске выполняется заново - ее шаги
+    должны быть повторяемыми (IF NOT EXISTS и т.п.), Backfill продолжает
+    с сохраненной пачки.
+    """
+    group: List[Step] = []
+    for index, step in enumerate(migration.steps):
+        if step.transactional:
+            group.append(step)
+            continue
+        if group:
+            async with conn.begin():
+                for grouped in group:
+                    await _run_step(conn, grouped)
+            group = []
+        if isinstance(step, CreateIndex):
+            await _create_index_concurrently(online, step)
+        elif isinstance(step, Backfill):
+            await _backfill(conn, migration.version, index, step)
+        else:
+            raise TypeError(f"Неизвестный шаг миграции: {step!r}")
+
+    async with conn.begin():
+        for grouped in group:
+            await _run_step(conn, grouped)
+        await conn.execute(
+            insert(schema_migrations).values(version=migration.version, description=migration.description)
+        )
+
+
+async def pending_migrations(engine: AsyncEngine, migrations: Optional[Sequence[Migration]] = None) -> List[Migration]:
+    migrations = load_migrations() if migrations is None else migrations
+    async with engine.connect() as conn:
+        applied = await _applied_versions(conn)
+    return [migration for migration in migrations if migration.version not in applied]
+
+
+async def upgrade(engine: AsyncEngine, migrations: Optional[Sequence[Migration]] = None) -> List[str]:
+    """
+    Применяет непримененные миграции и возвращает их версии.
+
+    Миграция из одних транзакционных шагов выполняется в одной транзакции
+    вместе с записью в schema_migrations и при ошибке откатывается целиком.
+    """
+    migrations = load_migrations() if migrations is None else migrations
+    applied_now = []
+    async with engine.connect() as conn, engine.connect() as online:
+        # отдельное соединение в autocommit для CREATE INDEX CONCURRENTLY
+        await online.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        await conn.commit()
+        try:
+            await conn.exec_driver_sql(CREATE_MIGRATIONS_TABLE)
+            await conn.exec_driver_sql(CREATE_CHECKPOINTS_TABLE)
+            await conn.commit()
+            applied = await _applied_versions(conn)
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                await _apply(conn, online, migration)
+                log.info("Применена миграция %s: %s", migration.version, migration.description)
+                applied_now.append(migration.version)
+        finally:
+            await conn.rollback()
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+            await conn.commit()
+    return applied_now
@@ -0,0 +1,229 @@
+"""
+Базовая схема: все таблицы, как их создавал Base.metadata.create_all.
+
+Выражения идемпотентны (IF NOT EXISTS), поэтому миграция применяется и к
+пустой БД, и к БД, созданной прежним init_db. Для старых БД она же
+доводит схему до текущей: добавляет колонки, появившиеся после первого
+create_all, и переводит колонки с ПД в bytea. Новая колонка
+users.phone_hash заполняется отдельно: python -m app.infra.blind_index_backfill.
+Индексы строятся CONCURRENTLY: в старой БД таблицы уже заполнены, и
+обычный CREATE INDEX остановил бы запись в них на время построения.
+"""
+from app.infra.migrations.base import Callback, CreateIndex, Migration, Sql
+from app.infra.pii_binary_migration import convert_pii_columns
+
+
+def _enum(name: str, *labels: str) -> Sql:
+    values = ", ".join(f"'{label}'" for label in labels)
+    return Sql(
+        f"DO $$ BEGIN CREATE TYPE {name} AS ENUM ({values}); "
+        f"EXCEPTION WHEN duplicate_object THEN NULL; END $$"
+    )
+
+
+migration = Migration(
+    version="0001",
+    description="Базовая схема",
+    steps=(
+        _enum("user_role", "CLIENT", "STAFF"),
+        _enum("order_status", "NEW", "PAID", "SHIPPED", "DELIVERED", "CANCELLED"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS encryption_rotation_checkpoints (
+                table_name VARCHAR(64) NOT NULL,
+                last_id INTEGER NOT NULL,
+                rows_scanned BIGINT NOT NULL,
+                rows_updated BIGINT NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (table_name)
+            )
+        """),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS products (
+                product_id SERIAL NOT NULL,
+                manufacturer VARCHAR(255) NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                dimensions VARCHAR(255),
+                unit VARCHAR(32) NOT NULL,
+                price NUMERIC(12, 2) NOT NULL,
+                quantity_available INTEGER NOT NULL,
+                quantity_reserved INTEGER DEFAULT '0' NOT NULL,
+                image_path VARCHAR(500),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (product_id)
+            )
+        """),
+        Sql("ALTER TABLE products ADD COLUMN IF NOT EXISTS quantity_reserved INTEGER DEFAULT '0' NOT NULL"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                revoked_token_id SERIAL NOT NULL,
+                jti VARCHAR(64) NOT NULL,
+                expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                revoked_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (revoked_token_id)
+            )
+        """),
+        CreateIndex("ix_revoked_tokens_jti", "revoked_tokens", "jti", unique=True),
+        CreateIndex("ix_revoked_tokens_revoked_at", "revoked_tokens", "revoked_at"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id SERIAL NOT NULL,
+                role user_role NOT NULL,
+                encrypted_first_name BYTEA NOT NULL,
+                encrypted_patronymic BYTEA,
+                encrypted_last_name BYTEA NOT NULL,
+                encrypted_phone BYTEA NOT NULL,
+                encrypted_email BYTEA NOT NULL,
+                email_hash VARCHAR(64) NOT NULL,
+                phone_hash VARCHAR(64),
+                password_hash VARCHAR(255) NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (user_id),
+                UNIQUE (encrypted_email)
+            )
+        """),
+        Sql("ALTER TABLE users ADD COLUMN IF NOT EXISTS phone_hash VARCHAR(64)"),
+        CreateIndex("ix_users_email_hash", "users", "email_hash", unique=True),
+        CreateIndex("ix_users_phone_hash", "users", "phone_hash"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS carts (
+                cart_id SERIAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (cart_id),
+                UNIQUE (user_id),
+                FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        """),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS orders (
+                order_id SERIAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                encrypted_order_email BYTEA NOT NULL,
+                total_price NUMERIC(12, 2) NOT NULL,
+                status order_status DEFAULT 'NEW' NOT NULL,
+                encrypted_address BYTEA NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (order_id),
+                FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE RESTRICT
+            )
+        """),
+        # заказы, оформленные до появления статусов, уже выполнены: существующие строки
+        # получают DELIVERED (без перезаписи таблицы, значение хранится в каталоге),
+        # новые - NEW. Если колонка уже есть, ADD COLUMN ничего не делает
+        Sql("ALTER TABLE orders ADD COLUMN IF NOT EXISTS status order_status DEFAULT 'DELIVERED' NOT NULL"),
+        Sql("ALTER TABLE orders ALTER COLUMN status SET DEFAULT 'NEW'"),
+        CreateIndex(
+            "ix_orders_active_status", "orders", "status, created_at DESC, order_id DESC",
+            where="status IN ('NEW', 'PAID', 'SHIPPED')",
+        ),
+        CreateIndex("ix_orders_created_at", "orders", "created_at DESC, order_id DESC"),
+        CreateIndex("ix_orders_user_id_created_at", "orders", "user_id, created_at DESC, order_id DESC"),
+        Callback("перевод колонок с ПД в bytea", convert_pii_columns),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS refresh_tokens (
+                refresh_token_id SERIAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                token_hash VARCHAR(64) NOT NULL,
+                expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                revoked_at TIMESTAMP WITH TIME ZONE,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (refresh_token_id),
+                FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        """),
+        CreateIndex("ix_refresh_tokens_token_hash", "refresh_tokens", "token_hash", unique=True),
+        CreateIndex("ix_refresh_tokens_user_id", "refresh_tokens", "user_id"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS stock_reservations (
+                reservation_id SERIAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (reservation_id),
+                UNIQUE (user_id, product_id),
+                FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+                FOREIGN KEY(product_id) REFERENCES products (product_id) ON DELETE CASCADE
+            )
+        """),
+        CreateIndex("ix_stock_reservations_expires_at", "stock_reservations", "expires_at"),
+        CreateIndex("ix_stock_reservations_product_id", "stock_reservations", "product_id"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS cart_items (
+                cart_item_id SERIAL NOT NULL,
+                cart_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (cart_item_id),
+                UNIQUE (cart_id, product_id),
+                FOREIGN KEY(cart_id) REFERENCES carts (cart_id) ON DELETE CASCADE,
+                FOREIGN KEY(product_id) REFERENCES products (product_id) ON DELETE RESTRICT
+            )
+        """),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idempotency_key_id SERIAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                key VARCHAR(64) NOT NULL,
+                order_id INTEGER,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (idempotency_key_id),
+                UNIQUE (user_id, key),
+                FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+                FOREIGN KEY(order_id) REFERENCES orders (order_id) ON DELETE CASCADE
+            )
+        """),
+        CreateIndex("ix_idempotency_keys_created_at", "idempotency_keys", "created_at"),
+        CreateIndex("ix_idempotency_keys_order_id", "idempotency_keys", "order_id"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS order_items (
+                order_item_id SERIAL NOT NULL,
+                order_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                price_per_unit NUMERIC(12, 2) NOT NULL,
+                total NUMERIC(12, 2) NOT NULL,
+                PRIMARY KEY (order_item_id),
+                FOREIGN KEY(order_id) REFERENCES orders (order_id) ON DELETE CASCADE,
+                FOREIGN KEY(product_id) REFERENCES products (product_id) ON DELETE RESTRICT
+            )
+        """),
+        CreateIndex("ix_order_items_order_id", "order_items", "order_id"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS order_status_history (
+                order_status_change_id SERIAL NOT NULL,
+                order_id INTEGER NOT NULL,
+                from_status order_status NOT NULL,
+                to_status order_status NOT NULL,
+                changed_by INTEGER,
+                changed_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (order_status_change_id),
+                FOREIGN KEY(order_id) REFERENCES orders (order_id) ON DELETE CASCADE,
+                FOREIGN KEY(changed_by) REFERENCES users (user_id) ON DELETE SET NULL
+            )
+        """),
+        CreateIndex("ix_order_status_history_changed_by", "order_status_history", "changed_by"),
+        CreateIndex("ix_order_status_history_order_id", "order_status_history", "order_id"),
+        Sql("""
+            CREATE TABLE IF NOT EXISTS outbox_messages (
+                outbox_message_id SERIAL NOT NULL,
+                kind VARCHAR(32) NOT NULL,
+                order_id INTEGER NOT NULL,
+                attempts INTEGER DEFAULT '0' NOT NULL,
+                next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                last_error TEXT,
+                sent_at TIMESTAMP WITH TIME ZONE,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+                PRIMARY KEY (outbox_message_id),
+                FOREIGN KEY(order_id) REFERENCES orders (order_id) ON DELETE CASCADE
+            )
+        """),
+        CreateIndex("ix_outbox_messages_order_id", "outbox_messages", "order_id"),
+        CreateIndex("ix_outbox_messages_pending", "outbox_messages", "next_attempt_at", where="sent_at IS NULL"),
+    ),
+)
@@ -0,0 +1,18 @@
+"""
+Индексы по внешним ключам на products.
+
+Без них удаление товара (ON DELETE RESTRICT) и выборки позиций по товару
+просматривают order_items и cart_items целиком. orders.user_id и
+order_items.order_id уже покрыты индексами базовой схемы. Индексы строятся
+CONCURRENTLY, без остановки записи в таблицы.
+"""
+from app.infra.migrations.base import CreateIndex, Migration
+
+migration = Migration(
+    version="0002",
+    description="Индексы по order_items.product_id и cart_items.product_id",
+    steps=(
+        CreateIndex("ix_order_items_product_id", "order_items", "product_id"),
+        CreateIndex("ix_cart_items_product_id", "cart_items", "product_id"),
+    ),
+)
@@ -0,0 +1,149 @@
+"""
+Транзакционный outbox для писем.
+
+Оформление заказа в той же транзакции пишет строку в outbox_messages,
+поэтому письмо не теряется при падении после коммита и не уходит, если
+заказ откатился. Отправкой занимается фоновый диспетчер: берет пачку
+готовых сообщений (FOR UPDATE SKIP LOCKED, можно запускать в нескольких
+воркерах), шлет их через одно SMTP-соединение и повторяет неудачные с
+экспоненциальной задержкой.
+"""
+import asyncio
+import contextlib
+import logging
+from typing import Callable, Dict
+
+from sqlalchemy import Integer, Text, column, func, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import encryption
+from app.core.settings import settings
+from app.infra.email import EmailSender, build_order_confirmation, email_sender
+from app.models.order import Order
+from app.models.outbox_message import OutboxMessage
+
+log = logging.getLogger(__name__)
+
+ORDER_CONFIRMATION = "order_confirmation"
+
+BUILDERS: Dict[str, Callable] = {
+    ORDER_CONFIRMATION: build_order_confirmation,
+}
+
+
+def _retry_at(attempts):
+    """now() + min(base * 2^(attempts - 1), max) секунд"""
+    delay = func.least(
+        settings.OUTBOX_RETRY_BASE_SECONDS * func.power(2, attempts - 1),
+        settings.OUTBOX_RETRY_MAX_SECONDS,
+    )
+    return func.now() + func.make_interval(0, 0, 0, 0, 0, 0, delay)
+
+
+class OutboxDispatcher:
+    def __init__(self, sender: EmailSender):
+        self.sender = sender
+        self._wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """Будит диспетчер сразу после коммита заказа, не дожидаясь интервала опроса"""
+        self._wakeup.set()
+
+    async def claim_batch(self, db: AsyncSession, limit: int) -> list:
+        """
+        Забирает до limit готовых сообщений одним запросом.
+
+        Попытка засчитывается и следующая назначается сразу при захвате:
+        если воркер упадет посреди отправки, сообщение вернется в работу
+        после задержки, а не зависнет.
+        """
+        pending = (
+            select(OutboxMessage.outbox_message_id)
+            .where(
+                OutboxMessage.sent_at.is_(None),
+                OutboxMessage.next_attempt_at <= func.now(),
+                OutboxMessage.attempts < settings.OUTBOX_MAX_ATTEMPTS,
+            )
+            .order_by(OutboxMessage.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        claimed = (
+            update(OutboxMessage)
+            .where(OutboxMessage.outbox_message_id.in_(pending.scalar_subquery()))
+            .values(
+                attempts=OutboxMessage.attempts + 1,
+                next_attempt_at=_retry_at(OutboxMessage.attempts + 1),
+            )
+            .returning(OutboxMessage.outbox_message_id, OutboxMessage.kind, OutboxMessage.order_id)
+            .cte("claimed")
+        )
+        stmt = (
+            select(claimed.c.outbox_message_id, claimed.c.kind, claimed.c.order_id, Order.encrypted_order_email)
+            .join(Order, Order.order_id == claimed.c.order_id)
+            .order_by(claimed.c.outbox_message_id)
+        )
+        rows = (await db.execute(stmt)).all()
+        await db.commit()
+        return rows
+
+    async def dispatch_batch(self, session_factory: async_sessionmaker) -> int:
+        """Отправляет одну пачку и возвращает число взятых в работу сообщений"""
+        async with session_factory() as db:
+            rows = await self.claim_batch(db, settings.OUTBOX_BATCH_SIZE)
+            if not rows:
+                return 0
+
+            emails = await encryption.encryption_service.decrypt_many_async([row.encrypted_order_email for row in rows])
+            sent, failed = [], {}
+            for row, email in zip(rows, emails):
+                try:
+                    await self.sender.send(BUILDERS[row.kind](email, row.order_id))
+                    sent.append(row.outbox_message_id)
+                except Exception as e:
+                    log.warning("Не удалось отправить сообщение %s: %s", row.outbox_message_id, e)
+                    failed[row.outbox_message_id] = str(e)[:1000]
+
+            if sent:
+                await db.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.outbox_message_id.in_(sent))
+                    .values(sent_at=func.now(), last_error=None)
+                )
+            if failed:
+                errors = values(
+                    column("outbox_message_id", Integer), column("error", Text), name="errors"
+                ).data(list(failed.items()))
+                await db.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.outbox_message_id == errors.c.outbox_message_id)
+                    .values(last_error=errors.c.error)
+                )
+            await db.commit()
+            return len(rows)
+
+    async def dispatch_pending(self, session_factory: async_sessionmaker) -> int:
+        total = 0
+        while True:
+            count = await self.dispatch_batch(session_factory)
+            total += count
+            if count < settings.OUTBOX_BATCH_SIZE:
+                return total
+
+    async def run(self, session_factory: async_sessionmaker, interval: float) -> None:
+        # Event привязывается к loop при первом ожидании; у каждого запуска приложения свой loop
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await self.dispatch_pending(session_factory)
+                except Exception:
+                    log.exception("Ошибка диспетчера outbox")
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+                self._wakeup.clear()
+        finally:
+            await self.sender.close()
+
+
+outbox_dispatcher = OutboxDispatcher(email_sender)
@@ -0,0 +1,64 @@
+"""
+Перевод колонок с ПД из Text/String (base64 Fernet) в BYTEA.
+
+1) python -m app.infra.pii_binary_migration
+   меняет тип колонок; старые токены сохраняются как есть (байты ASCII)
+   и продолжают расшифровываться;
+2) python -m app.infra.key_rotation --restart
+   перешифровывает их в компактный AES-GCM формат пачками, без долгих блокировок.
+
+ALTER COLUMN TYPE переписывает таблицу под эксклюзивной блокировкой,
+поэтому шаг 1 выполняется в окно обслуживания; шаг 2 можно гонять под нагрузкой.
+"""
+import asyncio
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.models.order import Order
+from app.models.user import User
+
+log = logging.getLogger(__name__)
+
+MIGRATED_MODELS = (User, Order)
+
+
+async def migrate_pii_columns(engine: AsyncEngine) -> list[str]:
+    """Возвращает список переведенных колонок; уже переведенные пропускаются"""
+    async with engine.begin() as conn:
+        return await convert_pii_columns(conn)
+
+
+async def convert_pii_columns(conn: AsyncConnection) -> list[str]:
+    """То же в транзакции вызывающего; используется и базовой миграцией схемы"""
+    migrated = []
+    for model in MIGRATED_MODELS:
+        table = model.__table__.name
+        columns = model.__encrypted_columns__
+        result = await conn.execute(
+            text(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :table "
+                "AND data_type <> 'bytea' AND column_name = ANY(:columns)"
+            ),
+            {"table": table, "columns": list(columns)},
+        )
+        pending = [row[0] for row in result]
+        if not pending:
+            continue
+
+        clauses = ", ".join(
+            f'ALTER COLUMN "{name}" TYPE bytea USING convert_to("{name}", \'UTF8\')' for name in pending
+        )
+        await conn.execute(text(f'ALTER TABLE "{table}" {clauses}'))
+        migrated += [f"{table}.{name}" for name in pending]
+        log.info("Колонки %s.%s переведены в bytea", table, ", ".join(pending))
+    return migrated
+
+
+if __name__ == "__main__":
+    from app.infra.db import engine
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate_pii_columns(engine))
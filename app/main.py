@@ -1,20 +1,49 @@
+import asyncio
+import contextlib
+import hmac
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
 
-from fastapi import FastAPI, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Depends, Header, HTTPException
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.infra.db import get_db
+from app.infra.db import get_db, engine, SessionLocal
 from app.core.settings import settings
+from app.core.security import set_auth_cookie, set_refresh_cookie
 from app.features.auth.dependencies import get_optional_user
 from app.models.user import User
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.features.auth.revocation import revocation_list
+    from app.features.cart.reservations import stock_reservations
+    from app.features.orders.idempotency import idempotency_keys
+    from app.infra.outbox import outbox_dispatcher
+
+    tasks = [
+        asyncio.create_task(revocation_list.run(SessionLocal, settings.REVOCATION_SYNC_SECONDS)),
+        asyncio.create_task(stock_reservations.run(
+            SessionLocal, settings.RESERVATION_SWEEP_SECONDS, settings.RESERVATION_SWEEP_BATCH_SIZE
+        )),
+        asyncio.create_task(idempotency_keys.run(SessionLocal, 60 * 60)),
+        asyncio.create_task(outbox_dispatcher.run(SessionLocal, settings.OUTBOX_POLL_SECONDS)),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await engine.dispose()
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="Online Building Materials Store")
+    app = FastAPI(title="Online Building Materials Store", lifespan=lifespan)
 
     static_dir = Path(settings.STATIC_ROOT)
     if static_dir.exists():
@@ -27,10 +56,35 @@ def create_app() -> FastAPI:
     templates_dir = Path(__file__).parent.parent / "web" / "templates"
     templates = Jinja2Templates(directory=str(templates_dir))
 
+    @app.middleware("http")
+    async def reissue_auth_cookies(request: Request, call_next):
+        # зависимости авторизации кладут сюда токены, перевыпущенные по refresh-cookie
+        response = await call_next(request)
+        reissued = getattr(request.state, "reissued_tokens", None)
+        if reissued:
+            access_token, refresh_token = reissued
+            set_auth_cookie(response, access_token)
+            set_refresh_cookie(response, refresh_token)
+        return response
+
     @app.get("/health")
     async def health():
         return {"status": "ok"}
 
+    @app.get("/internal/metrics", include_in_schema=False)
+    async def internal_metrics(authorization: Optional[str] = Header(None)):
+        # метрики пула этого процесса для Prometheus; без METRICS_TOKEN эндпоинта нет
+        from app.infra.db_pool import pool_metrics
+
+        if not settings.METRICS_TOKEN:
+            raise HTTPException(status_code=404)
+        expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+        if not hmac.compare_digest((authorization or "").encode(), expected):
+            raise HTTPException(status_code=401, detail="Нужен токен метрик")
+        return PlainTextResponse(
+            pool_metrics.render(engine.sync_engine.pool), media_type="text/plain; version=0.0.4"
+        )
+
     # routers
     from app.features.auth.router import router as auth_router
     from app.features.auth.form_router import router as auth_form_router
@@ -39,6 +93,7 @@ def create_app() -> FastAPI:
     from app.features.products.router import router as products_router
     from app.features.products.form_router import router as products_form_router
     from app.features.users.router import router as users_router
+    from app.features.staff.router import router as staff_router
 
     app.include_router(auth_router)
     app.include_router(auth_form_router)
@@ -47,6 +102,7 @@ def create_app() -> FastAPI:
     app.include_router(products_form_router)
     app.include_router(cart_router)
     app.include_router(orders_router)
+    app.include_router(staff_router)
 
     return app
 
@@ -5,5 +5,12 @@ from app.models.cart import Cart
 from app.models.cart_item import CartItem
 from app.models.order import Order
 from app.models.order_item import OrderItem
+from app.models.order_status_change import OrderStatusChange
+from app.models.refresh_token import RefreshToken
+from app.models.revoked_token import RevokedToken
+from app.models.encryption_rotation import EncryptionRotationCheckpoint
+from app.models.stock_reservation import StockReservation
+from app.models.idempotency_key import IdempotencyKey
+from app.models.outbox_message import OutboxMessage
 
-__all__ = ["Cart", "CartItem", "Order", "OrderItem", "Product", "User"]
+__all__ = ["Cart", "CartItem", "EncryptionRotationCheckpoint", "IdempotencyKey", "Order", "OrderItem", "OrderStatusChange", "OutboxMessage", "Product", "RefreshToken", "RevokedToken", "StockReservation", "User"]
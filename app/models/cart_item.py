@@ -26,7 +26,9 @@ class CartItem(Base):
 
     cart_item_id: Mapped[int] = mapped_column(primary_key=True)
     cart_id: Mapped[int] = mapped_column(ForeignKey("carts.cart_id", ondelete="CASCADE"), nullable=False)
-    product_id: Mapped[int] = mapped_column(ForeignKey("products.product_id", ondelete="RESTRICT"), nullable=False)
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.product_id", ondelete="RESTRICT"), nullable=False, index=True
+    )
 
     quantity: Mapped[int] = mapped_column(Integer, nullable=False)
 
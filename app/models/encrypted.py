@@ -0,0 +1,97 @@
+from typing import Optional, Sequence
+
+from sqlalchemy import LargeBinary, event
+from sqlalchemy.types import TypeDecorator
+
+from app.core import encryption
+
+_CACHE_ATTR = "_decrypted_cache"
+
+
+class EncryptedBytes(TypeDecorator):
+    """
+    Шифротекст ПД в BYTEA. Принимает bytes (AES-GCM) и str (Fernet-токены,
+    записанные до перехода на бинарный формат), наружу отдает bytes.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            return value.encode()
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return bytes(value)
+
+
+class EncryptedFieldsMixin:
+    """
+    Расшифровка ПД с кешем на экземпляре: шифр вызывается один раз на поле,
+    повторные обращения (шаблоны, сериализация) берут открытый текст из кеша.
+    Кеш сбрасывается при записи в зашифрованную колонку, refresh и expire.
+    """
+
+    __encrypted_columns__: tuple[str, ...] = ()
+
+    def _decrypt_field(self, column: str) -> Optional[str]:
+        cache = self.__dict__.get(_CACHE_ATTR)
+        if cache is None:
+            cache = self.__dict__[_CACHE_ATTR] = {}
+        if column in cache:
+            return cache[column]
+        ciphertext = getattr(self, column)
+        value = encryption.encryption_service.decrypt(ciphertext) if ciphertext else None
+        cache[column] = value
+        return value
+
+    def _reset_decrypted(self, column: Optional[str] = None) -> None:
+        cache = self.__dict__.get(_CACHE_ATTR)
+        if not cache:
+            return
+        if column is None:
+            cache.clear()
+        else:
+            cache.pop(column, None)
+
+
+async def decrypt_instances(instances: Sequence[EncryptedFieldsMixin]) -> None:
+    """
+    Расшифровывает все ПД выборки одним заходом в пул потоков и заполняет
+    кеш экземпляров, чтобы сериализация списка не вызывала Fernet построчно.
+    """
+    pending = []
+    for instance in instances:
+        cache = instance.__dict__.get(_CACHE_ATTR)
+        if cache is None:
+            cache = instance.__dict__[_CACHE_ATTR] = {}
+        for column in instance.__encrypted_columns__:
+            if column not in cache:
+                pending.append((cache, column, getattr(instance, column)))
+
+    values = await encryption.encryption_service.decrypt_many_async(
+        [ciphertext for _, _, ciphertext in pending]
+    )
+    for (cache, column, _), value in zip(pending, values):
+        cache[column] = value
+
+
+def track_encrypted_columns(cls, *columns: str) -> None:
+    """Вешает сброс кеша расшифровки на изменения зашифрованных колонок модели"""
+    cls.__encrypted_columns__ = columns
+    for column in columns:
+        def on_set(target, value, oldvalue, initiator, column=column):
+            target._reset_decrypted(column)
+
+        event.listen(getattr(cls, column), "set", on_set)
+
+    def on_refresh(target, context, attrs):
+        target._reset_decrypted()
+
+    def on_expire(target, attrs):
+        target._reset_decrypted()
+
+    event.listen(cls, "refresh", on_refresh)
+    event.listen(cls, "expire", on_expire)
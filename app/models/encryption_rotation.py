@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    Integer,
+    String,
+    func,
+)
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+)
+
+from app.models.base import Base
+
+
+class EncryptionRotationCheckpoint(Base):
+    """Позиция фоновой перешифровки по каждой таблице, чтобы задачу можно было продолжить"""
+    __tablename__ = "encryption_rotation_checkpoints"
+
+    table_name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rows_scanned: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    rows_updated: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
+import enum
 from datetime import datetime
 from decimal import Decimal
 from typing import TYPE_CHECKING
 
 from sqlalchemy import (
     DateTime,
+    Enum,
     ForeignKey,
+    Index,
     Numeric,
-    String,
-    Text,
     func,
+    text,
 )
 from sqlalchemy.orm import (
     Mapped,
@@ -19,22 +21,52 @@ from sqlalchemy.orm import (
 )
 
 from app.models.base import Base
+from app.models.encrypted import EncryptedBytes, EncryptedFieldsMixin, track_encrypted_columns
 
 if TYPE_CHECKING:
     from app.models.order_item import OrderItem
+    from app.models.order_status_change import OrderStatusChange
     from app.models.user import User
 
 
-class Order(Base):
+class OrderStatus(str, enum.Enum):
+    NEW = "NEW"
+    PAID = "PAID"
+    SHIPPED = "SHIPPED"
+    DELIVERED = "DELIVERED"
+    CANCELLED = "CANCELLED"
+
+
+# заказы в работе: их постоянно смотрят сотрудники, завершенные копятся в архиве
+ACTIVE_ORDER_STATUSES = (OrderStatus.NEW, OrderStatus.PAID, OrderStatus.SHIPPED)
+
+
+class Order(EncryptedFieldsMixin, Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # история заказов в профиле: страница читается по индексу без сортировки
+        Index("ix_orders_user_id_created_at", "user_id", text("created_at DESC"), text("order_id DESC")),
+        # общий список заказов у сотрудников, с фильтром по датам или без
+        Index("ix_orders_created_at", text("created_at DESC"), text("order_id DESC")),
+        # частичный индекс только по активным заказам: маленький и не растет с архивом
+        Index(
+            "ix_orders_active_status",
+            "status", text("created_at DESC"), text("order_id DESC"),
+            postgresql_where=text("status IN ('NEW', 'PAID', 'SHIPPED')"),
+        ),
+    )
 
     order_id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id", ondelete="RESTRICT"), nullable=False)
 
-    encrypted_order_email: Mapped[str] = mapped_column(String(255), nullable=False)
+    encrypted_order_email: Mapped[bytes] = mapped_column(EncryptedBytes, nullable=False)
     total_price: Mapped[Decimal] = mapped_column(Numeric(12, 2), nullable=False, default=0)
+    status: Mapped[OrderStatus] = mapped_column(
+        Enum(OrderStatus, name="order_status"), nullable=False,
+        default=OrderStatus.NEW, server_default=OrderStatus.NEW.value
+    )
 
-    encrypted_address: Mapped[str] = mapped_column(Text, nullable=False)
+    encrypted_address: Mapped[bytes] = mapped_column(EncryptedBytes, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
@@ -42,18 +74,20 @@ class Order(Base):
 
     user: Mapped[User] = relationship(back_populates="orders")
     items: Mapped[list[OrderItem]] = relationship(back_populates="order", cascade="all, delete-orphan")
+    status_history: Mapped[list[OrderStatusChange]] = relationship(
+        back_populates="order", cascade="all, delete-orphan", passive_deletes=True,
+        order_by="OrderStatusChange.order_status_change_id"
+    )
 
     @property
     def order_email(self) -> str:
         """Расшифрованный email"""
-        from app.core.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_order_email)
+        return self._decrypt_field("encrypted_order_email")
 
     @property
     def address(self) -> str:
         """Расшифрованный адрес доставки"""
-        from app.core.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_address)
+        return self._decrypt_field("encrypted_address")
 
     @classmethod
     def create_with_encryption(
@@ -72,3 +106,6 @@ class Order(Base):
             total_price=total_price,
             encrypted_address=encryption_service.encrypt(address)
         )
+
+
+track_encrypted_columns(Order, "encrypted_order_email", "encrypted_address")
@@ -25,8 +25,12 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     order_item_id: Mapped[int] = mapped_column(primary_key=True)
-    order_id: Mapped[int] = mapped_column(ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False)
-    product_id: Mapped[int] = mapped_column(ForeignKey("products.product_id", ondelete="RESTRICT"), nullable=False)
+    order_id: Mapped[int] = mapped_column(
+        ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.product_id", ondelete="RESTRICT"), nullable=False, index=True
+    )
 
     quantity: Mapped[int] = mapped_column(Integer, nullable=False)
     price_per_unit: Mapped[Decimal] = mapped_column(Numeric(12, 2), nullable=False)
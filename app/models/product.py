@@ -37,6 +37,8 @@ class Product(Base):
     price: Mapped[int] = mapped_column(Numeric(12, 2), nullable=False)
 
     quantity_available: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # сумма активных резервов (stock_reservations), поддерживается при резервировании и снятии
+    quantity_reserved: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     image_path: Mapped[str | None] = mapped_column(String(500))
 
@@ -47,3 +49,7 @@ class Product(Base):
 
     order_items: Mapped[list[OrderItem]] = relationship(back_populates="product")
     cart_items: Mapped[list[CartItem]] = relationship(back_populates="product")
+
+    @property
+    def quantity_free(self) -> int:
+        return self.quantity_available - (self.quantity_reserved or 0)
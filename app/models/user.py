@@ -6,7 +6,6 @@ from sqlalchemy import (
     DateTime,
     Enum,
     String,
-    Text,
     func,
 )
 from sqlalchemy.orm import (
@@ -15,10 +14,12 @@ from sqlalchemy.orm import (
     relationship,
 )
 from app.models.base import Base
+from app.models.encrypted import EncryptedBytes, EncryptedFieldsMixin, track_encrypted_columns
 
 if TYPE_CHECKING:
     from app.models.cart import Cart
     from app.models.order import Order
+    from app.models.refresh_token import RefreshToken
 
 
 class UserRole(str, enum.Enum):
@@ -26,19 +27,20 @@ class UserRole(str, enum.Enum):
     STAFF = "STAFF"
 
 
-class User(Base):
+class User(EncryptedFieldsMixin, Base):
     __tablename__ = "users"
 
     user_id: Mapped[int] = mapped_column(primary_key=True)
     role: Mapped[UserRole] = mapped_column(Enum(UserRole, name="user_role"), nullable=False, default=UserRole.CLIENT)
 
-    encrypted_first_name: Mapped[str] = mapped_column(Text, nullable=False)
-    encrypted_patronymic: Mapped[Optional[str]] = mapped_column(Text)
-    encrypted_last_name: Mapped[str] = mapped_column(Text, nullable=False)
-    encrypted_phone: Mapped[str] = mapped_column(Text, nullable=False)
-    encrypted_email: Mapped[str] = mapped_column(Text, nullable=False, unique=True)
+    encrypted_first_name: Mapped[bytes] = mapped_column(EncryptedBytes, nullable=False)
+    encrypted_patronymic: Mapped[Optional[bytes]] = mapped_column(EncryptedBytes)
+    encrypted_last_name: Mapped[bytes] = mapped_column(EncryptedBytes, nullable=False)
+    encrypted_phone: Mapped[bytes] = mapped_column(EncryptedBytes, nullable=False)
+    encrypted_email: Mapped[bytes] = mapped_column(EncryptedBytes, nullable=False, unique=True)
 
     email_hash: Mapped[str] = mapped_column(String(64), nullable=False, unique=True, index=True)
+    phone_hash: Mapped[Optional[str]] = mapped_column(String(64), index=True)
 
     password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
 
@@ -49,38 +51,34 @@ class User(Base):
 
     orders: Mapped[list[Order]] = relationship(back_populates="user")
     cart: Mapped[Cart | None] = relationship(back_populates="user", uselist=False)
+    refresh_tokens: Mapped[list[RefreshToken]] = relationship(
+        back_populates="user", cascade="all, delete-orphan", passive_deletes=True
+    )
 
     @property
     def first_name(self) -> str:
         """Расшифрованное имя"""
-        from app.core.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_first_name)
+        return self._decrypt_field("encrypted_first_name")
 
     @property
     def patronymic(self) -> Optional[str]:
         """Расшифрованное отчество"""
-        if not self.encrypted_patronymic:
-            return None
-        from app.core.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_patronymic)
+        return self._decrypt_field("encrypted_patronymic")
 
     @property
     def last_name(self) -> str:
         """Расшифрованная фамилия"""
-        from app.core.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_last_name)
+        return self._decrypt_field("encrypted_last_name")
 
     @property
     def phone(self) -> str:
         """Расшифрованный телефон"""
-        from app.core.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_phone)
+        return self._decrypt_field("encrypted_phone")
 
     @property
     def email(self) -> str:
         """Расшифрованный email"""
-        from app.core.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_email)
+        return self._decrypt_field("encrypted_email")
 
     @classmethod
     def create_with_encryption(
@@ -103,6 +101,7 @@ class User(Base):
             encrypted_email=encryption_service.encrypt(email),
             encrypted_patronymic=encryption_service.encrypt(patronymic) if patronymic else None,
             email_hash=encryption_service.hash_email(email),
+            phone_hash=encryption_service.hash_phone(phone),
             password_hash=password_hash,
             role=role
         )
@@ -126,6 +125,7 @@ class User(Base):
 
         if phone is not None:
             self.encrypted_phone = encryption_service.encrypt(phone)
+            self.phone_hash = encryption_service.hash_phone(phone)
 
         if email is not None:
             self.encrypted_email = encryption_service.encrypt(email)
@@ -133,3 +133,13 @@ class User(Base):
 
         if patronymic is not None:
             self.encrypted_patronymic = encryption_service.encrypt(patronymic) if patronymic else None
+
+
+track_encrypted_columns(
+    User,
+    "encrypted_first_name",
+    "encrypted_patronymic",
+    "encrypted_last_name",
+    "encrypted_phone",
+    "encrypted_email",
+)
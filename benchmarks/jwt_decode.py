@@ -0,0 +1,41 @@
+"""
+Микробенчмарк проверки access-токена: jwt.decode на каждый вызов против
+кеша декодированных токенов (app.core.security.decoded_token_cache).
+
+Запуск (нужны переменные окружения из .env):
+    python -m benchmarks.jwt_decode
+"""
+import timeit
+
+from jose import jwt
+
+from app.core.security import create_access_token, decode_access_token, decoded_token_cache
+from app.core.settings import settings
+
+# get_current_user + get_optional_user на одном запросе
+DECODES_PER_REQUEST = 2
+
+
+def main(number: int = 20000) -> None:
+    token = create_access_token(user_id=1, role="CLIENT")
+
+    def uncached():
+        jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+
+    def cached():
+        decode_access_token(token)
+
+    decoded_token_cache.clear()
+    decode_access_token(token)
+
+    uncached_us = timeit.timeit(uncached, number=number) / number * 1e6
+    cached_us = timeit.timeit(cached, number=number) / number * 1e6
+
+    print(f"jwt.decode:           {uncached_us:8.2f} мкс/вызов")
+    print(f"decode_access_token:  {cached_us:8.2f} мкс/вызов (попадание в кеш)")
+    print(f"экономия на запрос:   {(uncached_us - cached_us) * DECODES_PER_REQUEST:8.2f} мкс "
+          f"({DECODES_PER_REQUEST} проверки токена), ускорение x{uncached_us / cached_us:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Бенчмарк расшифровки ПД: рендер users/profile.html и сериализация списка
+UserPublic (как в GET /profile/users) без кеша расшифровки и с ним.
+
+Запуск (нужны переменные окружения из .env):
+    python -m benchmarks.pii_decryption
+"""
+import time
+from unittest.mock import patch
+
+from app.core.encryption import encryption_service
+from app.features.users.schemas import UserPublic
+from app.infra.templates import templates
+from app.models.encrypted import EncryptedFieldsMixin
+from app.models.user import User, UserRole
+
+
+def uncached_decrypt_field(self, column):
+    # поведение до кеширования: Fernet на каждое обращение к свойству
+    ciphertext = getattr(self, column)
+    return encryption_service.decrypt(ciphertext) if ciphertext else None
+
+
+def make_users(count: int) -> list[User]:
+    return [
+        User.create_with_encryption(
+            first_name=f"Имя{i}",
+            last_name=f"Фамилия{i}",
+            patronymic=f"Отчество{i}",
+            phone="+7 999 111-22-33",
+            email=f"user{i}@example.com",
+            password_hash="hash",
+            role=UserRole.CLIENT,
+        )
+        for i in range(count)
+    ]
+
+
+def render_profiles(users: list[User]) -> None:
+    template = templates.get_template("users/profile.html")
+    for user in users:
+        template.render(request=None, user=user)
+
+
+def serialize_users(users: list[User]) -> None:
+    for user in users:
+        UserPublic(
+            user_id=0,
+            email=user.email,
+            first_name=user.first_name,
+            patronymic=user.patronymic,
+            last_name=user.last_name,
+            phone=user.phone,
+            role=user.role.value,
+        )
+
+
+def measure(fn, users) -> float:
+    start = time.perf_counter()
+    fn(users)
+    return (time.perf_counter() - start) * 1000
+
+
+def main(profiles: int = 500, users_in_list: int = 1000) -> None:
+    for title, fn, count in (
+        ("рендер профиля", render_profiles, profiles),
+        ("список пользователей", serialize_users, users_in_list),
+    ):
+        with patch.object(EncryptedFieldsMixin, "_decrypt_field", uncached_decrypt_field):
+            before = measure(fn, make_users(count))
+        after = measure(fn, make_users(count))
+        print(f"{title} x{count}: без кеша {before:8.1f} мс, с кешем {after:8.1f} мс, x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Бенчмарк хранения ПД: base64 Fernet в text против AES-GCM в bytea.
+
+Создает две временные таблицы с пятью зашифрованными колонками (как users),
+заполняет их одинаковыми данными и сравнивает размер строки, размер таблицы
+и время полного чтения.
+
+Запуск (нужен DATABASE_URL):
+    python -m benchmarks.pii_storage
+"""
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.encryption import encryption_service
+from app.core.settings import settings
+
+COLUMNS = ("first_name", "patronymic", "last_name", "phone", "email")
+
+
+def sample_row(i: int) -> dict:
+    return {
+        "first_name": f"Александр{i % 97}",
+        "patronymic": "Сергеевич",
+        "last_name": f"Константинопольский{i % 89}",
+        "phone": "+7 999 111-22-33",
+        "email": f"contractor{i}@stroimag.example.com",
+    }
+
+
+async def fill(conn, table: str, column_type: str, rows: list[dict]) -> None:
+    columns = ", ".join(f"{name} {column_type}" for name in COLUMNS)
+    await conn.execute(text(f"CREATE TEMP TABLE {table} (id serial PRIMARY KEY, {columns})"))
+    names = ", ".join(COLUMNS)
+    params = ", ".join(f":{name}" for name in COLUMNS)
+    await conn.execute(text(f"INSERT INTO {table} ({names}) VALUES ({params})"), rows)
+    await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def measure(conn, table: str) -> tuple[float, int, float]:
+    avg_row = (await conn.execute(text(f"SELECT avg(pg_column_size(t.*)) FROM {table} t"))).scalar()
+    total = (await conn.execute(text(f"SELECT pg_total_relation_size('{table}')"))).scalar()
+    start = time.perf_counter()
+    (await conn.execute(text(f"SELECT * FROM {table}"))).all()
+    return float(avg_row), total, (time.perf_counter() - start) * 1000
+
+
+async def main(count: int = 50000) -> None:
+    plain = [sample_row(i) for i in range(count)]
+    fernet_rows = [
+        {name: encryption_service.fernet.encrypt(value.encode()).decode() for name, value in row.items()}
+        for row in plain
+    ]
+    gcm_rows = [{name: encryption_service.encrypt(value) for name, value in row.items()} for row in plain]
+
+    engine = create_async_engine(settings.DATABASE_URL)
+    async with engine.connect() as conn:
+        await fill(conn, "bench_pii_fernet", "text", fernet_rows)
+        await fill(conn, "bench_pii_gcm", "bytea", gcm_rows)
+        fernet = await measure(conn, "bench_pii_fernet")
+        gcm = await measure(conn, "bench_pii_gcm")
+    await engine.dispose()
+
+    print(f"{count} строк, {len(COLUMNS)} зашифрованных колонок")
+    print(f"{'':18}{'строка, байт':>14}{'таблица, КБ':>14}{'чтение, мс':>14}")
+    for title, (avg_row, total, read_ms) in (("Fernet / text", fernet), ("AES-GCM / bytea", gcm)):
+        print(f"{title:18}{avg_row:14.0f}{total / 1024:14.0f}{read_ms:14.1f}")
+    print(f"размер строки: -{(1 - gcm[0] / fernet[0]) * 100:.0f}%, таблицы: -{(1 - gcm[1] / fernet[1]) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""
+Бенчмарк списка заказов сотрудников на миллионе заказов.
+
+В одной транзакции заполняет users/orders/order_items синтетическими
+данными (generate_series на стороне БД), прогоняет запросы списка из
+app.features.staff.orders и откатывает все изменения. Сравнивает
+пагинацию по ключу с OFFSET на глубокой странице и показывает план
+первой страницы.
+
+Запуск (нужен DATABASE_URL):
+    python -m benchmarks.staff_orders [число заказов]
+"""
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.encryption import encryption_service
+from app.core.settings import settings
+from app.features.staff.orders import list_orders
+from app.models import Base
+from app.models.order import Order, OrderStatus
+
+USERS = 10000
+PAGE_SIZE = 50
+DEEP_PAGE = 1000
+TARGET_EMAIL = "contractor@stroimag.example.com"
+
+
+async def fill(conn, orders: int) -> None:
+    email = encryption_service.encrypt(TARGET_EMAIL)
+    address = encryption_service.encrypt("г. Москва, ул. Строителей, д. 1, склад 4")
+    await conn.execute(text("""
+        INSERT INTO users (role, encrypted_first_name, encrypted_last_name, encrypted_phone,
+                           encrypted_email, email_hash, password_hash)
+        SELECT 'CLIENT', :blob, :blob, :blob, :blob || int4send(i),
+               CASE WHEN i = 1 THEN :target ELSE md5(i::text) || md5((-i)::text) END, 'bench'
+        FROM generate_series(1, :users) AS i
+    """), {"blob": email, "users": USERS, "target": encryption_service.hash_email(TARGET_EMAIL)})
+    await conn.execute(text("""
+        INSERT INTO products (manufacturer, name, unit, price, quantity_available)
+        VALUES ('М', 'Кирпич', 'шт', 25, 0)
+    """))
+    # первый пользователь - крупный подрядчик с каждым сотым заказом;
+    # свежие заказы новые, из старых каждый пятидесятый завис оплаченным, остальные доставлены
+    await conn.execute(text("""
+        INSERT INTO orders (user_id, encrypted_order_email, total_price, status, encrypted_address,
+                            created_at, updated_at)
+        SELECT u.user_id, :email, 250,
+               (CASE WHEN i <= 20000 THEN 'NEW' WHEN i % 50 = 0 THEN 'PAID' ELSE 'DELIVERED' END)::order_status,
+               :address, now() - make_interval(secs => i * 30), now()
+        FROM generate_series(1, :orders) AS i
+        JOIN (
+            SELECT user_id, row_number() OVER (ORDER BY user_id) - 1 AS n FROM users WHERE password_hash = 'bench'
+        ) AS u ON u.n = CASE WHEN i % 100 = 0 THEN 0 ELSE i % :users END
+    """), {"email": email, "address": address, "orders": orders, "users": USERS})
+    await conn.execute(text("""
+        INSERT INTO order_items (order_id, product_id, quantity, price_per_unit, total)
+        SELECT o.order_id, p.product_id, 10, 25, 250
+        FROM orders o, (SELECT max(product_id) AS product_id FROM products) AS p
+        WHERE o.encrypted_order_email = :email
+    """), {"email": email})
+    for table in ("users", "orders", "order_items"):
+        await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def timed(coro, repeat: int = 5) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await coro()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+async def main(orders: int = 1_000_000) -> None:
+    engine = create_async_engine(settings.DATABASE_URL)
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.run_sync(Base.metadata.create_all)
+            start = time.perf_counter()
+            await fill(conn, orders)
+            print(f"{orders} заказов, {USERS} клиентов, заполнение {time.perf_counter() - start:.1f} с\n")
+
+            db = AsyncSession(bind=conn)
+            today = date.today()
+
+            newest_first = select(Order.created_at, Order.order_id).order_by(
+                Order.created_at.desc(), Order.order_id.desc()
+            )
+            # курсор глубокой страницы - последняя строка предыдущей
+            cursor = tuple((await db.execute(newest_first.offset((DEEP_PAGE - 1) * PAGE_SIZE - 1).limit(1))).one())
+            offset_stmt = newest_first.add_columns(
+                Order.total_price, Order.encrypted_order_email
+            ).offset((DEEP_PAGE - 1) * PAGE_SIZE).limit(PAGE_SIZE)
+            cases = {
+                "первая страница": lambda: list_orders(db, limit=PAGE_SIZE),
+                f"страница {DEEP_PAGE}, по ключу": lambda: list_orders(db, cursor=cursor, limit=PAGE_SIZE),
+                f"страница {DEEP_PAGE}, OFFSET": lambda: db.execute(offset_stmt),
+                "диапазон дат (неделя)": lambda: list_orders(
+                    db, date_from=today - timedelta(days=7), date_to=today, limit=PAGE_SIZE
+                ),
+                "клиент по email": lambda: list_orders(db, customer_email=TARGET_EMAIL, limit=PAGE_SIZE),
+                "оплаченные": lambda: list_orders(db, status=OrderStatus.PAID, limit=PAGE_SIZE),
+                "клиент + даты": lambda: list_orders(
+                    db, customer_email=TARGET_EMAIL, date_from=today - timedelta(days=30), date_to=today,
+                    limit=PAGE_SIZE,
+                ),
+            }
+            print(f"{'запрос':32}{'мс':>10}")
+            for title, case in cases.items():
+                elapsed, _ = await timed(case)
+                print(f"{title:32}{elapsed:10.2f}")
+
+            for title, where in (("первой страницы", ""), ("оплаченных", "WHERE status = 'PAID'")):
+                plan = await conn.execute(text(f"""
+                    EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+                    SELECT order_id, created_at FROM orders {where}
+                    ORDER BY created_at DESC, order_id DESC LIMIT 51
+                """))
+                print(f"\nплан {title}:")
+                for (line,) in plan:
+                    print("  " + line)
+            await db.close()
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
@@ -1,21 +1,25 @@
+import itertools
 import os
 from unittest.mock import MagicMock, patch
 import pytest
 from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
     AsyncSession
 )
 from sqlalchemy import text
+from app.core.security import hash_password
 from app.main import create_app
 from app.infra.db import get_db
 from app.models.base import Base
 import app.models
 import pytest
 from unittest.mock import patch
+from app.models.product import Product
 from app.models.user import User, UserRole
-from app.features.auth.dependencies import get_current_user
+from app.features.auth.dependencies import get_current_user, get_optional_user
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -59,6 +63,83 @@ def client(db):
     app.dependency_overrides[get_db] = override_get_db
     return TestClient(app)
 
+@pytest.fixture
+async def async_app_client(engine, db):
+    # TestClient крутит приложение в своем event loop, а asyncpg-соединения
+    # привязаны к loop теста, поэтому для запросов с реальной БД нужен AsyncClient
+    SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    app_instance = create_app()
+
+    async def override_get_db():
+        async with SessionLocal() as session:
+            yield session
+
+    app_instance.dependency_overrides[get_db] = override_get_db
+    transport = ASGITransport(app=app_instance)
+    async with AsyncClient(transport=transport, base_url="http://test") as test_client:
+        yield test_client, SessionLocal
+    app_instance.dependency_overrides.clear()
+
+
+class ModelFactory:
+    """
+    Пользователи и товары в тестовой БД. Email и телефоны по умолчанию
+    уникальны в пределах теста; password задается только тем, кто входит
+    через форму или API - bcrypt медленный.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.counter = itertools.count()
+
+    async def users(self, count: int = 1, role: UserRole = UserRole.CLIENT, password: str = None, **fields):
+        password_hash = hash_password(password) if password else "hash"
+        users = []
+        for _ in range(count):
+            number = next(self.counter)
+            values = {
+                "first_name": "Иван",
+                "last_name": "Петров",
+                "email": f"user{number}@example.com",
+                "phone": f"+7 999 000-{number // 100 % 100:02d}-{number % 100:02d}",
+                **fields,
+            }
+            users.append(User.create_with_encryption(password_hash=password_hash, role=role, **values))
+        self.db.add_all(users)
+        await self.db.commit()
+        return users
+
+    async def user(self, **fields) -> User:
+        (user,) = await self.users(1, **fields)
+        return user
+
+    async def products(self, *quantities: int, price: int = 100, name: str = "Товар {i}", **fields):
+        """По товару на каждое количество; цена i-го товара - price * (i + 1)"""
+        products = [
+            Product(
+                manufacturer="М",
+                unit="шт",
+                name=name.format(i=i),
+                price=price * (i + 1),
+                quantity_available=quantity,
+                **fields,
+            )
+            for i, quantity in enumerate(quantities)
+        ]
+        self.db.add_all(products)
+        await self.db.commit()
+        return products
+
+    async def product(self, quantity_available: int = 10, **fields) -> Product:
+        (product,) = await self.products(quantity_available, **fields)
+        return product
+
+
+@pytest.fixture
+def factory(db):
+    return ModelFactory(db)
+
+
 @pytest.fixture
 def auth_client(db):
     app_instance = create_app()
@@ -71,6 +152,7 @@ def auth_client(db):
     async def override_get_db():
         yield db
     app_instance.dependency_overrides[get_current_user] = mock_get_current_user
+    app_instance.dependency_overrides[get_optional_user] = mock_get_current_user
     app_instance.dependency_overrides[get_db] = override_get_db
     with TestClient(app_instance) as test_client:
         yield test_client
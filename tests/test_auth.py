@@ -222,45 +222,33 @@ class TestRegistrationAPI:
         """Проверяет что регистрация отклоняет пользователя с существующим email"""
         from app.features.auth.router import register
         from app.features.users.schemas import UserCreate
-        from app.models.user import User
 
         mock_session = AsyncMock()
 
-        mock_existing_user = MagicMock(spec=User)
-        mock_existing_user.email = "existing@example.com"
-
         mock_result = MagicMock()
-        mock_result.scalar_one_or_none.return_value = mock_existing_user
+        mock_result.scalar_one_or_none.return_value = None
         mock_session.execute.return_value = mock_result
 
-        with patch('app.features.auth.router.select') as mock_select:
-            mock_where = MagicMock()
-            mock_where.where.return_value = mock_where
-
-            mock_select_obj = MagicMock()
-            mock_select_obj.where.return_value = mock_where
-            mock_select.return_value = mock_select_obj
-
-            user_data = UserCreate(
-                email="existing@example.com",
-                first_name="Новый",
-                last_name="Пользователь",
-                phone="+7 999 222-33-44",
-                password="TestPassword123",
-                password_confirm="TestPassword123"
-            )
+        user_data = UserCreate(
+            email="existing@example.com",
+            first_name="Новый",
+            last_name="Пользователь",
+            phone="+7 999 222-33-44",
+            password="TestPassword123",
+            password_confirm="TestPassword123"
+        )
 
-            with patch('app.features.auth.router.hash_password') as mock_hash:
-                mock_hash.return_value = "$2b$12$hashedpassword"
+        with patch('app.features.auth.router.hash_password') as mock_hash:
+            mock_hash.return_value = "$2b$12$hashedpassword"
 
-                with pytest.raises(HTTPException) as exc_info:
-                    await register(user_data, mock_session)
+            with pytest.raises(HTTPException) as exc_info:
+                await register(user_data, mock_session)
 
-                assert exc_info.value.status_code == 400
-                assert "уже существует" in str(exc_info.value.detail)
+            assert exc_info.value.status_code == 400
+            assert "уже существует" in str(exc_info.value.detail)
 
-                mock_session.add.assert_not_called()
-                mock_session.commit.assert_not_called()
+            mock_session.add.assert_not_called()
+            mock_session.commit.assert_not_called()
 
 
 class TestPasswordSecurity:
@@ -481,3 +469,46 @@ async def test_simple_auth_flow_simulation(client):
 
         assert response.status_code != 500
         assert "detail" in response.json()
+
+
+class TestDecodedTokenCache:
+    def test_decode_access_token_uses_cache(self):
+        """Проверяет что повторная проверка токена не вызывает jwt.decode"""
+        from app.core.security import create_access_token, decode_access_token, decoded_token_cache
+
+        decoded_token_cache.clear()
+        token = create_access_token(user_id=7, role="CLIENT")
+
+        first = decode_access_token(token)
+        with patch('app.core.security.jwt.decode') as mock_decode:
+            second = decode_access_token(token)
+            mock_decode.assert_not_called()
+
+        assert first == second
+        assert second["sub"] == "7"
+
+    def test_cache_drops_expired_tokens(self):
+        """Проверяет что токен с истекшим exp не отдается из кеша"""
+        import time
+        from app.core.security import DecodedTokenCache
+
+        cache = DecodedTokenCache(maxsize=10)
+        cache.put("expired", {"sub": "1", "exp": time.time() - 1})
+        assert cache.get("expired") is None
+        assert len(cache) == 0
+
+    def test_cache_is_bounded(self):
+        """Проверяет что кеш вытесняет самые старые токены"""
+        import time
+        from app.core.security import DecodedTokenCache
+
+        cache = DecodedTokenCache(maxsize=2)
+        exp = time.time() + 60
+        cache.put("a", {"sub": "1", "exp": exp})
+        cache.put("b", {"sub": "2", "exp": exp})
+        cache.get("a")
+        cache.put("c", {"sub": "3", "exp": exp})
+
+        assert len(cache) == 2
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
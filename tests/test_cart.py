@@ -1,10 +1,14 @@
+import asyncio
+
 import pytest
 from fastapi import HTTPException
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
-from sqlalchemy import select
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from pydantic import ValidationError
 from types import SimpleNamespace
-from app.features.cart.schemas import CartItemCreate, CartItemUpdate
+from app.core.security import create_access_token
+from app.features.cart.schemas import CartBatchOperation, CartBatchRequest, CartItemCreate, CartItemUpdate
 from app.features.cart.crud import CartCRUD
 from app.models.cart import Cart
 from app.models.cart_item import CartItem
@@ -19,6 +23,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             
             user = User.create_with_encryption(
                 first_name="Test",
@@ -48,6 +53,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             
             user = User.create_with_encryption(
                 first_name="Test",
@@ -72,6 +78,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             user = User.create_with_encryption(
                 first_name="Test",
                 last_name="User",
@@ -110,6 +117,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             
             user = User.create_with_encryption(
                 first_name="Test",
@@ -148,12 +156,60 @@ class TestCartCRUD:
         assert cart_item1.cart_item_id == cart_item2.cart_item_id
         assert cart_item2.quantity == 5  # 2 + 3
 
+    @pytest.mark.asyncio
+    async def test_add_to_cart_round_trips(self, db, engine, factory):
+        user = await factory.user()
+        product = await factory.product(name="Test Product", price=10000)
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            row = await CartCRUD.add_to_cart(db, user.user_id, CartItemCreate(product_id=product.product_id, quantity=2))
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+        assert row.name == "Test Product"
+        assert row.quantity == 2
+        # upsert позиции, блокировка товара и установка резерва
+        assert len(statements) == 3
+
+    @pytest.mark.asyncio
+    async def test_add_to_cart_insufficient_stock(self, db, factory):
+        user = await factory.user()
+        product = await factory.product(name="Test Product", price=10000, quantity_available=1)
+        user_id = user.user_id
+        row = await CartCRUD.add_to_cart(db, user_id, CartItemCreate(product_id=product.product_id, quantity=5))
+        assert row is None
+        assert await CartCRUD.get_cart_items(db, user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_add_to_cart_concurrent_clicks_are_not_lost(self, db, engine, factory):
+        user = await factory.user()
+        product = await factory.product(name="Test Product", price=10000)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def click():
+            async with session_factory() as session:
+                return await CartCRUD.add_to_cart(
+                    session, user.user_id, CartItemCreate(product_id=product.product_id, quantity=1)
+                )
+
+        await asyncio.gather(*(click() for _ in range(10)))
+
+        cart_items = await CartCRUD.get_cart_items(db, user.user_id)
+        assert len(cart_items) == 1
+        assert cart_items[0].quantity == 10
+
     @pytest.mark.asyncio
     async def test_get_cart_items(self, db):
         with patch('app.core.encryption.encryption_service') as mock_encryption:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             
             user = User.create_with_encryption(
                 first_name="Test",
@@ -205,6 +261,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             
             user = User.create_with_encryption(
                 first_name="Test",
@@ -241,6 +298,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             user = User.create_with_encryption(
                 first_name="Test",
                 last_name="User",
@@ -276,6 +334,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             user = User.create_with_encryption(
                 first_name="Test",
                 last_name="User",
@@ -311,6 +370,7 @@ class TestCartCRUD:
             mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
             mock_encryption.decrypt.side_effect = lambda x: x.replace("encrypted_", "")
             mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
             
             user = User.create_with_encryption(
                 first_name="Test",
@@ -352,6 +412,238 @@ class TestCartCRUD:
         assert len(cart_items) == 0
 
 
+class TestCartStatementCount:
+    # каждая операция - один запрос к корзине и два к резерву (блокировка и установка),
+    # независимо от размера корзины
+    @pytest.fixture
+    def statements(self, engine):
+        captured = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            captured.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        yield captured
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    async def _fill_cart(self, db, user, size):
+        products = [
+            Product(manufacturer="M", name=f"Product {i}", unit="шт", price=1000, quantity_available=10)
+            for i in range(size)
+        ]
+        db.add_all(products)
+        await db.commit()
+        return [
+            await CartCRUD.add_to_cart(db, user.user_id, CartItemCreate(product_id=product.product_id, quantity=1))
+            for product in products
+        ]
+
+    @pytest.mark.asyncio
+    async def test_clear_cart_round_trips(self, db, statements, factory):
+        user = await factory.user()
+        await self._fill_cart(db, user, 20)
+        statements.clear()
+
+        assert await CartCRUD.clear_cart(db, user.user_id) is True
+
+        assert len(statements) == 3
+        assert statements[0].startswith("DELETE FROM cart_items")
+        assert await CartCRUD.get_cart_items(db, user.user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_remove_from_cart_round_trips(self, db, statements, factory):
+        user = await factory.user()
+        items = await self._fill_cart(db, user, 3)
+        statements.clear()
+
+        assert await CartCRUD.remove_from_cart(db, user.user_id, items[0].cart_item_id) is True
+
+        assert len(statements) == 3
+        assert len(await CartCRUD.get_cart_items(db, user.user_id)) == 2
+
+    @pytest.mark.asyncio
+    async def test_update_cart_item_round_trips(self, db, statements, factory):
+        user = await factory.user()
+        items = await self._fill_cart(db, user, 3)
+        statements.clear()
+
+        updated = await CartCRUD.update_cart_item(db, user.user_id, items[1].cart_item_id, 4)
+
+        assert updated.quantity == 4
+        assert len(statements) == 3
+        assert statements[0].startswith("UPDATE cart_items")
+
+    @pytest.mark.asyncio
+    async def test_update_cart_item_rejects_insufficient_stock(self, db, factory):
+        user = await factory.user()
+        user_id = user.user_id
+        items = await self._fill_cart(db, user, 1)
+
+        assert await CartCRUD.update_cart_item(db, user_id, items[0].cart_item_id, 11) is None
+        cart_items = await CartCRUD.get_cart_items(db, user_id)
+        assert cart_items[0].quantity == 1
+
+    @pytest.mark.asyncio
+    async def test_operations_are_scoped_to_own_cart(self, db, factory):
+        owner = await factory.user()
+        items = await self._fill_cart(db, owner, 1)
+        with patch('app.core.encryption.encryption_service') as mock_encryption:
+            mock_encryption.encrypt.side_effect = lambda x: f"encrypted_{x}"
+            mock_encryption.hash_email.side_effect = lambda x: f"hash_{x}"
+            mock_encryption.hash_phone.side_effect = lambda x: f"hash_{x}"
+            stranger = User.create_with_encryption(
+                first_name="Other",
+                last_name="User",
+                phone="+79990000000",
+                email="other@example.com",
+                password_hash="$2b$12$testhash",
+                role=UserRole.CLIENT
+            )
+        db.add(stranger)
+        await db.commit()
+        owner_id, stranger_id = owner.user_id, stranger.user_id
+        await CartCRUD.add_to_cart(db, stranger_id, CartItemCreate(product_id=items[0].product_id, quantity=1))
+
+        assert await CartCRUD.remove_from_cart(db, stranger_id, items[0].cart_item_id) is False
+        assert await CartCRUD.update_cart_item(db, stranger_id, items[0].cart_item_id, 2) is None
+        await CartCRUD.clear_cart(db, stranger_id)
+
+        cart_items = await CartCRUD.get_cart_items(db, owner_id)
+        assert len(cart_items) == 1
+        assert cart_items[0].quantity == 1
+
+
+class TestCartSummary:
+    @pytest.mark.asyncio
+    async def test_summary_is_single_query_without_creating_cart(self, db, engine, factory):
+        user = await factory.user()
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            rows, total_price = await CartCRUD.get_cart_summary(db, user.user_id)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+        assert rows == []
+        assert total_price == 0
+        assert len(statements) == 1
+        carts = await db.execute(select(Cart).where(Cart.user_id == user.user_id))
+        assert carts.scalar_one_or_none() is None
+
+    @pytest.mark.asyncio
+    async def test_cart_endpoint_prices_match_item_endpoints(self, async_app_client, factory):
+        client, _ = async_app_client
+        user = await factory.user()
+        product = await factory.product(name="Test Product", price=10000)
+        client.cookies.set("access_token", create_access_token(user_id=user.user_id, role=user.role.value))
+
+        added = (await client.post("/cart/items/", json={"product_id": product.product_id, "quantity": 2})).json()
+        updated = (await client.put(f"/cart/items/{added['cart_item_id']}", json={"quantity": 3})).json()
+        cart = (await client.get("/cart/api")).json()
+
+        assert added["price"] == cart["items"][0]["price"] == 10000
+        assert added["total"] == 20000
+        assert updated["total"] == cart["items"][0]["total"] == cart["total_price"] == 30000
+
+
+class TestCartBatch:
+    def test_plan_batch_folds_operations_per_product(self):
+        plan = CartCRUD.plan_batch([
+            CartBatchOperation(op="add", product_id=1, quantity=2),
+            CartBatchOperation(op="add", product_id=1, quantity=3),
+            CartBatchOperation(op="set", product_id=2, quantity=4),
+            CartBatchOperation(op="add", product_id=2, quantity=1),
+            CartBatchOperation(op="remove", product_id=3),
+            CartBatchOperation(op="add", product_id=3, quantity=2),
+            CartBatchOperation(op="set", product_id=4, quantity=0),
+        ])
+        assert plan == {1: ("add", 5), 2: ("set", 5), 3: ("set", 2), 4: ("remove", 0)}
+
+    def test_batch_request_validation(self):
+        with pytest.raises(ValidationError):
+            CartBatchRequest(operations=[])
+        with pytest.raises(ValidationError):
+            CartBatchOperation(op="add", product_id=1, quantity=0)
+        with pytest.raises(ValidationError):
+            CartBatchOperation(op="replace", product_id=1)
+
+    async def _login(self, async_app_client, factory, products=3):
+        client, _ = async_app_client
+        user = await factory.user()
+        items = await factory.products(*[50] * products, name="Позиция {i}", price=1000)
+        client.cookies.set("access_token", create_access_token(user_id=user.user_id, role=user.role.value))
+        return client, user, items
+
+    @pytest.mark.asyncio
+    async def test_batch_endpoint_applies_operations(self, async_app_client, db, engine, factory):
+        client, user, products = await self._login(async_app_client, factory, products=40)
+        await CartCRUD.add_to_cart(db, user.user_id, CartItemCreate(product_id=products[0].product_id, quantity=1))
+        await CartCRUD.add_to_cart(db, user.user_id, CartItemCreate(product_id=products[1].product_id, quantity=1))
+
+        operations = [{"op": "add", "product_id": product.product_id, "quantity": 2} for product in products[2:]]
+        operations += [
+            {"op": "add", "product_id": products[0].product_id, "quantity": 4},
+            {"op": "remove", "product_id": products[1].product_id},
+        ]
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith(("INSERT", "UPDATE", "DELETE")):
+                statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            response = await client.post("/cart/items/batch", json={"operations": operations})
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+        assert response.status_code == 200
+        quantities = {item["product_id"]: item["quantity"] for item in response.json()["items"]}
+        assert len(quantities) == 39
+        assert quantities[products[0].product_id] == 5
+        assert products[1].product_id not in quantities
+        assert len(statements) == 3
+
+    @pytest.mark.asyncio
+    async def test_batch_endpoint_is_all_or_nothing(self, async_app_client, db, factory):
+        client, user, products = await self._login(async_app_client, factory)
+
+        response = await client.post("/cart/items/batch", json={"operations": [
+            {"op": "add", "product_id": products[0].product_id, "quantity": 1},
+            {"op": "set", "product_id": products[1].product_id, "quantity": 51},
+        ]})
+        assert response.status_code == 400
+        assert "Позиция 1" in response.json()["detail"]
+
+        response = await client.post("/cart/items/batch", json={"operations": [
+            {"op": "add", "product_id": products[0].product_id, "quantity": 1},
+            {"op": "add", "product_id": 999999, "quantity": 1},
+        ]})
+        assert response.status_code == 404
+        assert await CartCRUD.get_cart_items(db, user.user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_batch_endpoint_counts_own_reservation_as_available(self, async_app_client, db, factory):
+        client, user, products = await self._login(async_app_client, factory)
+        product_id = products[0].product_id
+        await CartCRUD.add_to_cart(db, user.user_id, CartItemCreate(product_id=product_id, quantity=50))
+
+        # весь остаток уже в резерве этого пользователя: set на те же 50 проходит
+        response = await client.post("/cart/items/batch", json={"operations": [
+            {"op": "set", "product_id": product_id, "quantity": 50},
+        ]})
+        assert response.status_code == 200
+        response = await client.post("/cart/items/batch", json={"operations": [
+            {"op": "add", "product_id": product_id, "quantity": 1},
+        ]})
+        assert response.status_code == 400
+        assert "Позиция 0" in response.json()["detail"]
+
+
 class TestCartSchemas:
     def test_cart_item_create_schema(self):
         data = {
@@ -370,22 +662,23 @@ class TestCartSchemas:
 
 class TestCartAPIEndpoints:
     @pytest.mark.asyncio
-    async def test_get_cart_endpoint_requires_auth(self, client):
+    async def test_get_cart_endpoint_anonymous_gets_guest_cart(self, client):
         response = client.get("/cart/api")
-        assert response.status_code == 401
+        assert response.status_code == 200
+        assert response.json() == {"items": [], "total_price": 0}
 
     @pytest.mark.asyncio
     async def test_get_cart_endpoint_returns_cart(self, auth_client):
-        with patch('app.features.cart.crud.CartCRUD.get_cart_items') as mock_get:
-            mock_item = MagicMock()
-            mock_item.cart_item_id = 1
-            mock_item.quantity = 2
-            mock_item.product = MagicMock(
+        with patch('app.features.cart.crud.CartCRUD.get_cart_summary') as mock_get:
+            row = SimpleNamespace(
+                cart_item_id=1,
                 product_id=1,
                 name="Test Product",
-                price=10000
+                price=10000,
+                quantity=2,
+                total=20000
             )
-            mock_get.return_value = [mock_item]
+            mock_get.return_value = ([row], 20000)
             response = auth_client.get("/cart/api")
             assert response.status_code == 200
             data = response.json()
@@ -395,58 +688,76 @@ class TestCartAPIEndpoints:
 
     @pytest.mark.asyncio
     async def test_add_to_cart_endpoint(self, auth_client):
-        with patch('app.features.cart.router.check_product_availability') as mock_check:
-            product = SimpleNamespace(product_id=1, name="Test Product", price=10000)
-            mock_check.return_value = product
-            
-            with patch('app.features.cart.crud.CartCRUD.add_to_cart') as mock_add:
-                mock_add.return_value = SimpleNamespace(cart_item_id=1)
-                
-                with patch('app.features.cart.crud.CartCRUD.get_cart_item') as mock_get_item:
-                    cart_item_with_product = SimpleNamespace(
-                        cart_item_id=1,
-                        product=product,
-                        quantity=2
-                    )
-                    mock_get_item.return_value = cart_item_with_product
-                    
-                    response = auth_client.post(
-                        "/cart/items/",
-                        json={"product_id": 1, "quantity": 2}
-                    )
-                    
-                    assert response.status_code == 200
-                    data = response.json()
-                    print(f"Ответ от сервера: {data}")
-                    assert data["cart_item_id"] == 1
-                    assert data["name"] == "Test Product"
-                    assert data["price"] == 100.0
-                    assert data["quantity"] == 2
-                    assert data["total"] == 200.0
+        with patch('app.features.cart.crud.CartCRUD.add_to_cart') as mock_add:
+            mock_add.return_value = SimpleNamespace(
+                cart_item_id=1,
+                product_id=1,
+                name="Test Product",
+                price=10000,
+                quantity=2
+            )
+
+            response = auth_client.post(
+                "/cart/items/",
+                json={"product_id": 1, "quantity": 2}
+            )
+
+            assert response.status_code == 200
+            data = response.json()
+            assert data["cart_item_id"] == 1
+            assert data["name"] == "Test Product"
+            assert data["price"] == 10000
+            assert data["quantity"] == 2
+            assert data["total"] == 20000
+
+    @pytest.mark.asyncio
+    async def test_add_to_cart_endpoint_reports_missing_product(self, auth_client):
+        with patch('app.features.cart.crud.CartCRUD.add_to_cart') as mock_add:
+            mock_add.return_value = None
+            with patch('app.features.cart.router.check_product_availability') as mock_check:
+                mock_check.side_effect = HTTPException(status_code=404, detail="Товар не найден")
+
+                response = auth_client.post(
+                    "/cart/items/",
+                    json={"product_id": 999, "quantity": 1}
+                )
+
+                assert response.status_code == 404
 
     @pytest.mark.asyncio
     async def test_update_cart_item_endpoint(self, auth_client):
-        with patch('app.features.cart.crud.CartCRUD.get_cart_item') as mock_get_item:
-            mock_get_item.return_value = MagicMock(
+        with patch('app.features.cart.crud.CartCRUD.update_cart_item') as mock_update:
+            mock_update.return_value = SimpleNamespace(
                 cart_item_id=1,
-                product_id=1
+                product_id=1,
+                quantity=3,
+                price=10000
             )
-            
-            with patch('app.features.cart.router.check_product_availability') as mock_check:
-                mock_check.return_value = MagicMock(product_id=1, price=10000)
-                
-                with patch('app.features.cart.crud.CartCRUD.update_cart_item') as mock_update:
-                    mock_update.return_value = MagicMock()
-                    
-                    response = auth_client.put(
-                        "/cart/items/1",
-                        json={"quantity": 3}
-                    )
-                    
-                    assert response.status_code == 200
-                    data = response.json()
-                    assert data["cart_item_id"] == 1
-                    assert data["quantity"] == 3
+
+            response = auth_client.put(
+                "/cart/items/1",
+                json={"quantity": 3}
+            )
+
+            assert response.status_code == 200
+            data = response.json()
+            assert data["cart_item_id"] == 1
+            assert data["quantity"] == 3
+            assert data["total"] == 30000
+
+    @pytest.mark.asyncio
+    async def test_update_cart_item_endpoint_missing_item(self, auth_client):
+        with patch('app.features.cart.crud.CartCRUD.update_cart_item') as mock_update:
+            mock_update.return_value = None
+            with patch('app.features.cart.crud.CartCRUD.get_cart_item') as mock_get_item:
+                mock_get_item.return_value = None
+
+                response = auth_client.put(
+                    "/cart/items/1",
+                    json={"quantity": 3}
+                )
+
+                assert response.status_code == 404
 
     @pytest.mark.asyncio
     async def test_remove_from_cart_endpoint(self, auth_client):
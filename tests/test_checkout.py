@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.security import create_access_token
+from app.features.orders.idempotency import idempotency_keys
+from app.features.orders.service import create_simple_order
+from app.models.cart import Cart
+from app.models.cart_item import CartItem
+from app.models.order import Order
+from app.models.order_item import OrderItem
+from app.models.product import Product
+from app.models.user import User
+
+
+async def fill_cart(db, user_id, lines):
+    # корзина кладется напрямую, без резерва: проверяется именно списание на оформлении
+    cart = Cart(user_id=user_id)
+    db.add(cart)
+    await db.flush()
+    db.add_all([CartItem(cart_id=cart.cart_id, product_id=product_id, quantity=quantity)
+                for product_id, quantity in lines.items()])
+    await db.commit()
+
+
+async def checkout(session_factory, user_id, idempotency_key=None):
+    async with session_factory() as session:
+        user = await session.get(User, user_id)
+        try:
+            order = await create_simple_order(session, f"buyer{user_id}@example.com", None, "Москва", user,
+                                              idempotency_key=idempotency_key)
+            return order.order_id if idempotency_key else True
+        except ValueError:
+            return False
+
+
+@pytest.mark.asyncio
+async def test_checkout_is_all_or_nothing(db, engine, factory):
+    user_id = (await factory.user()).user_id
+    plenty, scarce = [product.product_id for product in await factory.products(10, 1)]
+    await fill_cart(db, user_id, {plenty: 3, scarce: 2})
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    assert await checkout(session_factory, user_id) is False
+
+    stock = await db.execute(select(Product.product_id, Product.quantity_available).order_by(Product.product_id))
+    assert stock.all() == [(plenty, 10), (scarce, 1)]
+    assert (await db.execute(select(func.count()).select_from(Order))).scalar_one() == 0
+    assert (await db.execute(select(func.count()).select_from(CartItem))).scalar_one() == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checkouts_do_not_oversell(db, engine, factory):
+    buyers = [user.user_id for user in await factory.users(40)]
+    product_id = (await factory.product(quantity_available=10)).product_id
+    for user_id in buyers:
+        await fill_cart(db, user_id, {product_id: 1})
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    results = await asyncio.gather(*(checkout(session_factory, user_id) for user_id in buyers))
+
+    assert results.count(True) == 10
+    remaining = await db.execute(select(Product.quantity_available).where(Product.product_id == product_id))
+    assert remaining.scalar_one() == 0
+    assert (await db.execute(select(func.count()).select_from(Order))).scalar_one() == 10
+
+
+@pytest.mark.asyncio
+async def test_checkouts_with_reversed_product_order_do_not_deadlock(db, engine, factory):
+    buyers = [user.user_id for user in await factory.users(30)]
+    product_ids = [product.product_id for product in await factory.products(*[100] * 100)]
+    for i, user_id in enumerate(buyers):
+        # у половины покупателей строки корзины лежат в обратном порядке
+        ordered = product_ids if i % 2 else product_ids[::-1]
+        await fill_cart(db, user_id, {product_id: 1 for product_id in ordered})
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    results = await asyncio.gather(*(checkout(session_factory, user_id) for user_id in buyers))
+
+    assert results.count(True) == len(buyers)
+    stock = await db.execute(select(Product.quantity_available).distinct())
+    assert stock.scalars().all() == [100 - len(buyers)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("line_count", [3, 60])
+async def test_checkout_statement_count_is_independent_of_lines(db, engine, line_count, factory):
+    user_id = (await factory.user()).user_id
+    product_ids = [product.product_id for product in await factory.products(*[5] * line_count)]
+    await fill_cart(db, user_id, {product_id: 2 for product_id in product_ids})
+    user = await db.get(User, user_id)
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        order = await create_simple_order(db, "buyer@example.com", None, "Москва", user)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    # блокировка товаров, снятие резерва (блокировка и удаление), списание, заказ,
+    # перенос строк с удалением корзины
+    assert len(statements) == 6
+    expected_total = sum(100 * (i + 1) * 2 for i in range(line_count))
+    assert order.total_price == expected_total
+
+    items = (await db.execute(select(OrderItem).where(OrderItem.order_id == order.order_id))).scalars().all()
+    assert len(items) == line_count
+    assert sum(item.total for item in items) == expected_total
+    assert (await db.execute(select(func.count()).select_from(Cart))).scalar_one() == 0
+    assert (await db.execute(select(func.count()).select_from(CartItem))).scalar_one() == 0
+
+
+@pytest.mark.asyncio
+async def test_repeated_key_returns_original_order(db, engine, factory):
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=10)).product_id
+    await fill_cart(db, user_id, {product_id: 3})
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    results = await asyncio.gather(*(checkout(session_factory, user_id, "double-click") for _ in range(10)))
+
+    assert len(set(results)) == 1 and results[0]
+    assert (await db.execute(select(func.count()).select_from(Order))).scalar_one() == 1
+    remaining = await db.execute(select(Product.quantity_available).where(Product.product_id == product_id))
+    assert remaining.scalar_one() == 7
+
+
+@pytest.mark.asyncio
+async def test_failed_checkout_releases_key(db, engine, factory):
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=1)).product_id
+    await fill_cart(db, user_id, {product_id: 2})
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    assert await checkout(session_factory, user_id, "retry-me") is False
+
+    await db.execute(update(Product).values(quantity_available=5))
+    await db.commit()
+    assert await checkout(session_factory, user_id, "retry-me")
+
+
+@pytest.mark.asyncio
+async def test_checkout_form_resubmission_redirects_to_same_order(async_app_client, db, factory):
+    client, _ = async_app_client
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=10)).product_id
+    await fill_cart(db, user_id, {product_id: 1})
+    client.cookies.set("access_token", create_access_token(user_id=user_id, role="CLIENT"))
+    idempotency_keys.clear()
+
+    page = await client.get("/orders/checkout")
+    key = page.text.split('name="idempotency_key" value="')[1].split('"')[0]
+    form = {"order_email": "buyer@example.com", "address": "Москва", "idempotency_key": key}
+
+    first = await client.post("/orders/checkout", data=form, follow_redirects=False)
+    second = await client.post("/orders/checkout", data=form, follow_redirects=False)
+
+    assert first.headers["location"].startswith("/orders/success/")
+    assert second.headers["location"] == first.headers["location"]
+    assert (await db.execute(select(func.count()).select_from(Order))).scalar_one() == 1
+
+
+@pytest.mark.asyncio
+async def test_checkout_accepts_idempotency_header(async_app_client, db, factory):
+    client, _ = async_app_client
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=10)).product_id
+    await fill_cart(db, user_id, {product_id: 1})
+    client.cookies.set("access_token", create_access_token(user_id=user_id, role="CLIENT"))
+    idempotency_keys.clear()
+
+    form = {"order_email": "buyer@example.com", "address": "Москва"}
+    headers = {"Idempotency-Key": "json-client-1"}
+    first = await client.post("/orders/checkout", data=form, headers=headers, follow_redirects=False)
+    idempotency_keys.clear()
+    second = await client.post("/orders/checkout", data=form, headers=headers, follow_redirects=False)
+
+    assert second.headers["location"] == first.headers["location"]
+    assert (await db.execute(select(func.count()).select_from(Order))).scalar_one() == 1
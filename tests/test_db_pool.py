@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.settings import settings
+from app.infra.db_pool import Histogram, InstrumentedPool, install_idle_pre_ping, pool_metrics
+from tests.conftest import DATABASE_URL
+
+
+@pytest.fixture
+async def pool_engine():
+    engine = create_async_engine(
+        DATABASE_URL, poolclass=InstrumentedPool, pool_size=2, max_overflow=0, pool_timeout=0.2
+    )
+    yield engine
+    await engine.dispose()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram([0.01, 0.1])
+    for value in (0.005, 0.01, 0.05, 3):
+        histogram.observe(value)
+    assert histogram.cumulative() == [2, 3, 4]
+    assert histogram.count == 4
+
+
+@pytest.mark.asyncio
+async def test_pool_reports_checkouts_and_timeouts(pool_engine):
+    waits_before = pool_metrics.checkout_wait.count
+    timeouts_before = pool_metrics.checkout_timeouts
+
+    async with pool_engine.connect() as first, pool_engine.connect() as second:
+        await first.execute(text("SELECT 1"))
+        await second.execute(text("SELECT 1"))
+        report = pool_metrics.render(pool_engine.sync_engine.pool)
+        assert "db_pool_size{" in report
+        assert [line.split()[-1] for line in report.splitlines() if line.startswith("db_pool_checked_out{")] == ["2"]
+
+        with pytest.raises(PoolTimeoutError):
+            async with pool_engine.connect():
+                pass
+
+    assert pool_metrics.checkout_timeouts == timeouts_before + 1
+    assert pool_metrics.checkout_wait.count == waits_before + 3
+    # ожидание до таймаута попадает в корзины от 0.25 с
+    assert pool_metrics.checkout_wait.sum >= 0.2
+    report = pool_metrics.render(pool_engine.sync_engine.pool)
+    assert [line.split()[-1] for line in report.splitlines() if line.startswith("db_pool_idle{")] == ["2"]
+
+
+@pytest.mark.asyncio
+async def test_idle_pre_ping_replaces_dead_connection(pool_engine, engine):
+    install_idle_pre_ping(pool_engine, idle_seconds=0)
+    pings_before = pool_metrics.pings
+    failures_before = pool_metrics.ping_failures
+
+    async with pool_engine.connect() as conn:
+        backend_pid = (await conn.execute(text("SELECT pg_backend_pid()"))).scalar_one()
+    # соединение ждет в пуле, а сервер его закрывает
+    async with engine.connect() as admin:
+        await admin.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": backend_pid})
+
+    async with pool_engine.connect() as conn:
+        assert (await conn.execute(text("SELECT pg_backend_pid()"))).scalar_one() != backend_pid
+
+    assert pool_metrics.pings == pings_before + 1
+    assert pool_metrics.ping_failures == failures_before + 1
+
+
+@pytest.mark.asyncio
+async def test_recently_used_connection_is_not_pinged(pool_engine):
+    install_idle_pre_ping(pool_engine, idle_seconds=60)
+    pings_before = pool_metrics.pings
+    for _ in range(3):
+        async with pool_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    assert pool_metrics.pings == pings_before
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_requires_token(async_app_client, monkeypatch):
+    client, _ = async_app_client
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    assert (await client.get("/internal/metrics")).status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "secret")
+    assert (await client.get("/internal/metrics")).status_code == 401
+    response = await client.get("/internal/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'db_pool_checkout_wait_seconds_bucket{pid="' in response.text
+    assert "db_pool_checked_out{" in response.text
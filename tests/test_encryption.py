@@ -0,0 +1,135 @@
+import pytest
+from unittest.mock import patch
+
+from app.core.encryption import DataEncryption, encryption_service
+from app.models.order import Order
+from app.models.user import User, UserRole
+
+
+def make_user():
+    return User.create_with_encryption(
+        first_name="Иван",
+        last_name="Петров",
+        phone="+7 999 111-22-33",
+        email="ivan@example.com",
+        password_hash="hash",
+        role=UserRole.CLIENT,
+    )
+
+
+def test_user_fields_are_decrypted_once():
+    user = make_user()
+    with patch.object(encryption_service, "decrypt", wraps=encryption_service.decrypt) as mock_decrypt:
+        assert user.first_name == "Иван"
+        assert user.first_name == "Иван"
+        assert user.email == "ivan@example.com"
+        assert user.email == "ivan@example.com"
+        assert mock_decrypt.call_count == 2
+
+
+def test_update_encrypted_data_invalidates_cache():
+    user = make_user()
+    assert user.first_name == "Иван"
+    assert user.phone == "+7 999 111-22-33"
+
+    user.update_encrypted_data(first_name="Пётр")
+
+    assert user.first_name == "Пётр"
+    assert user.phone == "+7 999 111-22-33"
+
+
+def test_empty_patronymic_is_none():
+    user = make_user()
+    assert user.patronymic is None
+    user.update_encrypted_data(patronymic="Иванович")
+    assert user.patronymic == "Иванович"
+
+
+def test_order_fields_are_cached_and_invalidated():
+    order = Order.create_with_encryption(
+        user_id=1, order_email="a@example.com", total_price=100, address="ул. Ленина, 1"
+    )
+    assert order.address == "ул. Ленина, 1"
+    order.encrypted_address = encryption_service.encrypt("ул. Мира, 2")
+    assert order.address == "ул. Мира, 2"
+    assert order.order_email == "a@example.com"
+
+
+@pytest.mark.asyncio
+async def test_refresh_resets_decrypted_cache(db):
+    user = make_user()
+    db.add(user)
+    await db.commit()
+    assert user.first_name == "Иван"
+
+    from sqlalchemy import update
+    await db.execute(
+        update(User)
+        .where(User.user_id == user.user_id)
+        .values(encrypted_first_name=encryption_service.encrypt("Сидор"))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await db.refresh(user)
+
+    assert user.first_name == "Сидор"
+
+
+def test_blind_index_key_is_required_and_survives_key_rotation(monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", "key-1")
+    monkeypatch.setenv("BLIND_INDEX_KEY", "")
+    with pytest.raises(RuntimeError):
+        DataEncryption()
+
+    monkeypatch.setenv("BLIND_INDEX_KEY", "index-key")
+    before = DataEncryption().hash_email("ivan@example.com")
+    monkeypatch.setenv("ENCRYPTION_KEY", "key-2")
+    monkeypatch.setenv("ENCRYPTION_OLD_KEYS", "key-1")
+    assert DataEncryption().hash_email("ivan@example.com") == before
+
+
+def test_decrypt_many_keeps_order_and_none():
+    values = [encryption_service.encrypt(f"value{i}") for i in range(5)] + [None]
+    assert encryption_service.decrypt_many(values) == [f"value{i}" for i in range(5)] + [None]
+
+
+@pytest.mark.asyncio
+async def test_decrypt_many_async_chunks_results_in_order():
+    values = [encryption_service.encrypt(f"value{i}") for i in range(10)]
+    result = await encryption_service.decrypt_many_async(values, chunk_size=3)
+    assert result == [f"value{i}" for i in range(10)]
+
+
+@pytest.mark.asyncio
+async def test_decrypt_instances_fills_cache():
+    from app.models.encrypted import decrypt_instances
+
+    users = [make_user() for _ in range(3)]
+    await decrypt_instances(users)
+
+    with patch.object(encryption_service, "decrypt") as mock_decrypt:
+        assert [user.first_name for user in users] == ["Иван"] * 3
+        assert all(user.patronymic is None for user in users)
+        mock_decrypt.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_users_list_endpoint_returns_decrypted_fields(async_app_client, db):
+    client, _ = async_app_client
+    for i in range(3):
+        user = User.create_with_encryption(
+            first_name=f"Имя{i}",
+            last_name="Петров",
+            phone="+7 999 111-22-33",
+            email=f"user{i}@example.com",
+            password_hash="hash",
+            role=UserRole.CLIENT,
+        )
+        db.add(user)
+    await db.commit()
+
+    response = await client.get("/profile/users")
+    assert response.status_code == 200
+    data = response.json()
+    assert sorted(item["email"] for item in data) == [f"user{i}@example.com" for i in range(3)]
+    assert {item["first_name"] for item in data} == {"Имя0", "Имя1", "Имя2"}
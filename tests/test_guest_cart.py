@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.core.settings import settings
+from app.features.cart.crud import CartCRUD
+from app.features.cart.schemas import CartItemCreate
+from app.features.cart.guest import apply_plan, decode_guest_cart, encode_guest_cart
+from app.models.cart import Cart
+
+
+def test_guest_cookie_round_trip_is_compact():
+    items = {product_id: product_id % 7 + 1 for product_id in range(1000, 1000 + settings.GUEST_CART_MAX_ITEMS)}
+    value = encode_guest_cart(items)
+    assert decode_guest_cart(value) == items
+    assert len(value) < 1024
+
+
+def test_guest_cookie_rejects_tampering():
+    value = encode_guest_cart({1: 2})
+    forged = value[:-2] + ("AA" if value[-2:] != "AA" else "BB")
+    assert decode_guest_cart(forged) == {}
+    assert decode_guest_cart("garbage") == {}
+    assert decode_guest_cart(None) == {}
+
+
+def test_apply_plan_to_guest_items():
+    items = apply_plan({1: 2, 2: 1}, {1: ("add", 3), 2: ("remove", 0), 3: ("set", 4)})
+    assert items == {1: 5, 3: 4}
+
+
+@pytest.mark.asyncio
+async def test_guest_cart_needs_no_db_writes(async_app_client, db, factory):
+    client, _ = async_app_client
+    products = await factory.products(20, 20, 20)
+
+    response = await client.post("/cart/items/", json={"product_id": products[0].product_id, "quantity": 2})
+    assert response.status_code == 200
+    response = await client.post("/cart/items/", json={"product_id": products[1].product_id, "quantity": 1})
+    assert response.status_code == 200
+    response = await client.put(f"/cart/items/{products[1].product_id}", json={"quantity": 5})
+    assert response.json()["total"] == products[1].price * 5
+
+    cart = (await client.get("/cart/api")).json()
+    assert [item["quantity"] for item in cart["items"]] == [2, 5]
+    assert cart["total_price"] == products[0].price * 2 + products[1].price * 5
+
+    response = await client.delete(f"/cart/items/{products[0].product_id}")
+    assert response.status_code == 200
+    assert len((await client.get("/cart/api")).json()["items"]) == 1
+
+    carts = await db.execute(select(func.count()).select_from(Cart))
+    assert carts.scalar_one() == 0
+
+
+@pytest.mark.asyncio
+async def test_guest_cart_checks_stock(async_app_client, factory):
+    client, _ = async_app_client
+    products = await factory.products(1, 1, 1)
+
+    response = await client.post("/cart/items/", json={"product_id": products[0].product_id, "quantity": 3})
+    assert response.status_code == 400
+    response = await client.post("/cart/items/", json={"product_id": 999999, "quantity": 1})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_guest_cart_checks_free_stock_of_resulting_quantity(async_app_client, db, factory):
+    client, _ = async_app_client
+    (product,) = await factory.products(5)
+    user = await factory.user()
+    await CartCRUD.add_to_cart(db, user.user_id, CartItemCreate(product_id=product.product_id, quantity=3))
+
+    # свободно 2: резерв другого покупателя гостю недоступен
+    response = await client.post("/cart/items/batch", json={"operations": [
+        {"op": "set", "product_id": product.product_id, "quantity": 3},
+    ]})
+    assert response.status_code == 400
+    response = await client.post("/cart/items/", json={"product_id": product.product_id, "quantity": 2})
+    assert response.status_code == 200
+
+    # прибавка проверяется вместе с тем, что уже лежит в cookie
+    response = await client.post("/cart/items/batch", json={"operations": [
+        {"op": "add", "product_id": product.product_id, "quantity": 1},
+    ]})
+    assert response.status_code == 400
+    response = await client.post("/cart/items/", json={"product_id": product.product_id, "quantity": 1})
+    assert response.status_code == 400
+    cart = (await client.get("/cart/api")).json()
+    assert [item["quantity"] for item in cart["items"]] == [2]
+
+
+@pytest.mark.asyncio
+async def test_merge_items_adds_quantities_and_skips_missing_products(db, factory):
+    user = await factory.user()
+    products = await factory.products(20, 20, 20)
+    await CartCRUD.add_to_cart(db, user.user_id, CartItemCreate(product_id=products[0].product_id, quantity=1))
+
+    await CartCRUD.merge_items(db, user.user_id, {
+        products[0].product_id: 2,
+        products[1].product_id: 3,
+        999999: 1,
+    })
+
+    quantities = {item.product_id: item.quantity for item in await CartCRUD.get_cart_items(db, user.user_id)}
+    assert quantities == {products[0].product_id: 3, products[1].product_id: 3}
+
+
+@pytest.mark.asyncio
+async def test_guest_cart_merged_on_login(async_app_client, db, factory):
+    client, _ = async_app_client
+    user = await factory.user(email="guest@example.com", password="StrongPass123")
+    products = await factory.products(20, 20, 20)
+    client.cookies.set(settings.GUEST_CART_COOKIE_NAME, encode_guest_cart({products[2].product_id: 4}))
+
+    response = await client.post(
+        "/auth/login/redirect",
+        data={"email": "guest@example.com", "password": "StrongPass123"},
+        follow_redirects=False,
+    )
+
+    assert response.status_code == 303
+    assert 'guest_cart=""' in response.headers.get("set-cookie", "")
+    items = await CartCRUD.get_cart_items(db, user.user_id)
+    assert [(item.product_id, item.quantity) for item in items] == [(products[2].product_id, 4)]
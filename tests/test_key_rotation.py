@@ -0,0 +1,205 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from unittest.mock import patch
+
+from app.core.encryption import DataEncryption
+from app.infra.key_rotation import rotate_encryption_keys
+from app.models.encryption_rotation import EncryptionRotationCheckpoint
+from app.models.order import Order
+from app.models.user import User, UserRole
+
+
+@pytest.fixture
+def session_factory(engine, db):
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def make_service(monkeypatch, key, old_keys=""):
+    monkeypatch.setenv("ENCRYPTION_KEY", key)
+    monkeypatch.setenv("ENCRYPTION_OLD_KEYS", old_keys)
+    return DataEncryption()
+
+
+async def create_users_and_orders(db, count):
+    for i in range(count):
+        user = User.create_with_encryption(
+            first_name=f"Имя{i}",
+            last_name="Петров",
+            phone="+7 999 111-22-33",
+            email=f"user{i}@example.com",
+            password_hash="hash",
+            role=UserRole.CLIENT,
+        )
+        db.add(user)
+        await db.flush()
+        db.add(Order.create_with_encryption(
+            user_id=user.user_id, order_email=f"user{i}@example.com", total_price=100, address=f"Адрес {i}"
+        ))
+    await db.commit()
+
+
+def test_old_key_still_decrypts_after_rotation(monkeypatch):
+    old_service = make_service(monkeypatch, "old-key")
+    ciphertext = old_service.encrypt("секрет")
+
+    new_service = make_service(monkeypatch, "new-key", "old-key")
+    assert new_service.decrypt(ciphertext) == "секрет"
+    assert new_service.needs_rotation(ciphertext)
+
+    rotated = new_service.rotate(ciphertext)
+    assert not new_service.needs_rotation(rotated)
+    assert make_service(monkeypatch, "new-key").decrypt(rotated) == "секрет"
+
+
+@pytest.mark.asyncio
+async def test_rotation_job_reencrypts_all_rows(monkeypatch, db, session_factory):
+    with patch("app.core.encryption.encryption_service", make_service(monkeypatch, "old-key")):
+        await create_users_and_orders(db, 7)
+
+    new_service = make_service(monkeypatch, "new-key", "old-key")
+    progress = []
+    with patch("app.core.encryption.encryption_service", new_service):
+        result = await rotate_encryption_keys(
+            session_factory, batch_size=3, rows_per_second=0, on_progress=progress.append
+        )
+
+    users, orders = result
+    assert users.rows_scanned == 7 and orders.rows_scanned == 7
+    assert users.rows_updated == 7 and orders.rows_updated == 7
+    assert len(progress) == 6
+
+    only_new_key = make_service(monkeypatch, "new-key")
+    async with session_factory() as session:
+        for user in (await session.execute(select(User))).scalars():
+            assert not only_new_key.needs_rotation(user.encrypted_email)
+            assert only_new_key.decrypt(user.encrypted_first_name).startswith("Имя")
+        for order in (await session.execute(select(Order))).scalars():
+            assert only_new_key.decrypt(order.encrypted_address).startswith("Адрес")
+
+
+@pytest.mark.asyncio
+async def test_rotation_job_resumes_from_checkpoint(monkeypatch, db, session_factory):
+    with patch("app.core.encryption.encryption_service", make_service(monkeypatch, "old-key")):
+        await create_users_and_orders(db, 4)
+
+    def interrupt(progress):
+        raise RuntimeError("остановка")
+
+    new_service = make_service(monkeypatch, "new-key", "old-key")
+    with patch("app.core.encryption.encryption_service", new_service):
+        with pytest.raises(RuntimeError):
+            await rotate_encryption_keys(session_factory, batch_size=2, rows_per_second=0, on_progress=interrupt)
+        checkpoint = await db.get(EncryptionRotationCheckpoint, "users")
+        assert checkpoint.last_id == 2
+
+        users, orders = await rotate_encryption_keys(session_factory, batch_size=2, rows_per_second=0)
+
+    assert users.rows_scanned == 4
+    assert users.rows_updated == 4
+    assert orders.rows_updated == 4
+    db.expire_all()
+    # после полного прохода позиция удалена
+    assert await db.get(EncryptionRotationCheckpoint, "users") is None
+
+
+@pytest.mark.asyncio
+async def test_consecutive_rotations_reencrypt_all_rows(monkeypatch, db, session_factory):
+    with patch("app.core.encryption.encryption_service", make_service(monkeypatch, "key-1")):
+        await create_users_and_orders(db, 3)
+
+    with patch("app.core.encryption.encryption_service", make_service(monkeypatch, "key-2", "key-1")):
+        users, orders = await rotate_encryption_keys(session_factory, batch_size=2, rows_per_second=0)
+    assert (users.rows_updated, orders.rows_updated) == (3, 3)
+
+    with patch("app.core.encryption.encryption_service", make_service(monkeypatch, "key-3", "key-2")):
+        users, orders = await rotate_encryption_keys(session_factory, batch_size=2, rows_per_second=0)
+    assert (users.rows_scanned, users.rows_updated) == (3, 3)
+    assert (orders.rows_scanned, orders.rows_updated) == (3, 3)
+
+    only_last_key = make_service(monkeypatch, "key-3")
+    async with session_factory() as session:
+        for user in (await session.execute(select(User))).scalars():
+            assert only_last_key.decrypt(user.encrypted_first_name).startswith("Имя")
+
+
+def test_keys_with_same_id_are_rejected(monkeypatch):
+    keys_by_id = {}
+    for i in range(1000):
+        key = f"key-{i}"
+        key_id, _ = DataEncryption._make_aead_key(key)
+        if key_id in keys_by_id:
+            break
+        keys_by_id[key_id] = key
+
+    with pytest.raises(RuntimeError, match="один id"):
+        make_service(monkeypatch, key, keys_by_id[key_id])
+    # один и тот же ключ, указанный дважды, - не конфликт
+    make_service(monkeypatch, key, key)
+
+
+def test_new_ciphertexts_are_compact_and_versioned(monkeypatch):
+    service = make_service(monkeypatch, "key")
+    legacy = service.fernet.encrypt("Иван".encode())
+    ciphertext = service.encrypt("Иван")
+
+    assert isinstance(ciphertext, bytes)
+    assert ciphertext[0] == 0x01
+    assert len(ciphertext) < len(legacy) / 2
+    assert service.decrypt(ciphertext) == "Иван"
+    assert service.decrypt(legacy.decode()) == "Иван"
+    assert service.needs_rotation(legacy)
+    assert not service.needs_rotation(ciphertext)
+
+
+@pytest.mark.asyncio
+async def test_migration_converts_legacy_text_columns(monkeypatch, engine, db, session_factory):
+    from sqlalchemy import text
+    from app.infra.pii_binary_migration import migrate_pii_columns
+
+    service = make_service(monkeypatch, "key")
+    legacy = lambda value: service.fernet.encrypt(value.encode()).decode()
+
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "ALTER TABLE users "
+            "ALTER COLUMN encrypted_first_name TYPE text USING convert_from(encrypted_first_name, 'UTF8'), "
+            "ALTER COLUMN encrypted_last_name TYPE text USING convert_from(encrypted_last_name, 'UTF8'), "
+            "ALTER COLUMN encrypted_phone TYPE text USING convert_from(encrypted_phone, 'UTF8'), "
+            "ALTER COLUMN encrypted_email TYPE text USING convert_from(encrypted_email, 'UTF8')"
+        ))
+        await conn.execute(
+            text(
+                "INSERT INTO users (role, encrypted_first_name, encrypted_last_name, encrypted_phone, "
+                "encrypted_email, email_hash, password_hash) "
+                "VALUES ('CLIENT', :first_name, :last_name, :phone, :email, 'hash', 'hash')"
+            ),
+            {
+                "first_name": legacy("Иван"),
+                "last_name": legacy("Петров"),
+                "phone": legacy("+7 999 111-22-33"),
+                "email": legacy("ivan@example.com"),
+            },
+        )
+
+    assert await migrate_pii_columns(engine) == [
+        "users.encrypted_first_name",
+        "users.encrypted_last_name",
+        "users.encrypted_phone",
+        "users.encrypted_email",
+    ]
+    assert await migrate_pii_columns(engine) == []
+
+    with patch("app.core.encryption.encryption_service", service):
+        async with session_factory() as session:
+            user = (await session.execute(select(User))).scalar_one()
+            assert user.first_name == "Иван"
+            assert service.needs_rotation(user.encrypted_email)
+
+        users, _ = await rotate_encryption_keys(session_factory, batch_size=10, rows_per_second=0, restart=True)
+        assert users.rows_updated == 1
+
+        async with session_factory() as session:
+            user = (await session.execute(select(User))).scalar_one()
+            assert not service.needs_rotation(user.encrypted_email)
+            assert user.email == "ivan@example.com"
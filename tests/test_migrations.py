@@ -0,0 +1,240 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.infra.index_audit import find_seq_scan_heavy_tables, find_unindexed_foreign_keys
+from app.infra.migrations import (
+    Backfill,
+    CreateIndex,
+    Migration,
+    describe_plan,
+    load_migrations,
+    pending_migrations,
+    upgrade,
+)
+from app.models.base import Base
+from tests.conftest import DATABASE_URL
+
+SCHEMAS = ("migrations_test", "models_test")
+
+
+@pytest.fixture
+async def schema_engines(engine):
+    """Два движка с пустыми схемами: под миграции и под create_all моделей"""
+    async with engine.begin() as conn:
+        for schema in SCHEMAS:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engines = [
+        create_async_engine(DATABASE_URL, connect_args={"server_settings": {"search_path": schema}})
+        for schema in SCHEMAS
+    ]
+    yield engines
+    for schema_engine in engines:
+        await schema_engine.dispose()
+    async with engine.begin() as conn:
+        for schema in SCHEMAS:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+
+async def describe_schema(engine):
+    async with engine.connect() as conn:
+        schema = (await conn.execute(text("SELECT current_schema()"))).scalar_one()
+        columns = (await conn.execute(text(
+            "SELECT table_name, column_name, data_type, is_nullable, column_default "
+            "FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name NOT LIKE 'schema_migration%' ORDER BY 1, 2"
+        ))).all()
+        indexes = (await conn.execute(text(
+            "SELECT tablename, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename NOT LIKE 'schema_migration%' ORDER BY 1, 2"
+        ))).all()
+        constraints = (await conn.execute(text(
+            "SELECT conrelid::regclass::text, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE connamespace = current_schema()::regnamespace "
+            "AND conrelid::regclass::text NOT LIKE 'schema_migration%' ORDER BY 1, 2, 3"
+        ))).all()
+    indexes = [(table, definition.replace(f"{schema}.", "")) for table, definition in indexes]
+    return columns, indexes, constraints
+
+
+async def create_models(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+@pytest.mark.asyncio
+async def test_migrations_build_model_schema(schema_engines):
+    migrated, models = schema_engines
+    versions = [migration.version for migration in load_migrations()]
+
+    assert await upgrade(migrated) == versions
+    assert await upgrade(migrated) == []
+    assert await pending_migrations(migrated) == []
+
+    await create_models(models)
+    assert await describe_schema(migrated) == await describe_schema(models)
+
+
+@pytest.mark.asyncio
+async def test_baseline_catches_up_create_all_database(schema_engines):
+    migrated, models = schema_engines
+    await create_models(migrated)
+    # БД, созданная одним из прежних create_all: без поздних колонок и индексов,
+    # ПД еще в текстовых колонках
+    async with migrated.begin() as conn:
+        for statement in (
+            "ALTER TABLE products DROP COLUMN quantity_reserved",
+            "ALTER TABLE users DROP COLUMN phone_hash",
+            "ALTER TABLE orders DROP COLUMN status",
+            "DROP INDEX ix_cart_items_product_id",
+            "DROP INDEX ix_order_items_product_id",
+            "ALTER TABLE users ALTER COLUMN encrypted_email TYPE text USING convert_from(encrypted_email, 'UTF8')",
+        ):
+            await conn.execute(text(statement))
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (role, encrypted_first_name, encrypted_last_name, encrypted_phone, "
+            "encrypted_email, email_hash, password_hash) "
+            "VALUES ('CLIENT', 'x', 'x', 'x', 'old@example.com', 'hash', 'pw') RETURNING user_id"
+        ))).scalar_one()
+        await conn.execute(text(
+            "INSERT INTO orders (user_id, encrypted_order_email, total_price, encrypted_address) "
+            "VALUES (:user_id, 'x', 100, 'x')"
+        ), {"user_id": user_id})
+
+    await upgrade(migrated)
+    await create_models(models)
+    assert await describe_schema(migrated) == await describe_schema(models)
+
+    async with migrated.begin() as conn:
+        # старые заказы считаются выполненными, новые создаются со статусом NEW
+        assert (await conn.execute(text("SELECT status FROM orders"))).scalar_one() == "DELIVERED"
+        status = (await conn.execute(text(
+            "INSERT INTO orders (user_id, encrypted_order_email, total_price, encrypted_address) "
+            "VALUES (:user_id, 'x', 100, 'x') RETURNING status"
+        ), {"user_id": user_id})).scalar_one()
+        assert status == "NEW"
+
+
+@pytest.mark.asyncio
+async def test_dry_run_shows_lock_levels_and_changes_nothing(schema_engines):
+    migrated, _ = schema_engines
+    plan = describe_plan(await pending_migrations(migrated))
+
+    assert "  [без блокировки таблиц; в транзакции] DO $$ BEGIN CREATE TYPE user_role" in "\n".join(plan)
+    assert (
+        "  [ACCESS EXCLUSIVE; в транзакции] "
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS status order_status DEFAULT 'DELIVERED' NOT NULL"
+    ) in plan
+    assert (
+        "  [SHARE UPDATE EXCLUSIVE; без общей транзакции] "
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_product_id ON order_items (product_id)"
+    ) in plan
+    # ни один индекс не строится под SHARE, останавливающей запись в таблицу
+    assert not [line for line in plan if line.startswith("  [SHARE;")]
+    async with migrated.connect() as conn:
+        tables = await conn.execute(text("SELECT count(*) FROM pg_tables WHERE schemaname = current_schema()"))
+        assert tables.scalar_one() == 0
+
+
+async def seed_products(engine, quantities):
+    async with engine.begin() as conn:
+        for quantity in quantities:
+            await conn.execute(text(
+                "INSERT INTO products (manufacturer, name, unit, price, quantity_available) "
+                "VALUES ('М', 'Кирпич', 'шт', 10, :quantity)"
+            ), {"quantity": quantity})
+
+
+@pytest.mark.asyncio
+async def test_create_index_concurrently_rebuilds_invalid_index(schema_engines):
+    migrated, _ = schema_engines
+    await create_models(migrated)
+    await seed_products(migrated, [5, 5, 7])
+    async with migrated.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        with pytest.raises(DBAPIError):
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX CONCURRENTLY ix_products_quantity ON products (quantity_available)"
+            ))
+        await conn.execute(text("UPDATE products SET quantity_available = product_id"))
+
+    migration = Migration("0100", "Уникальный остаток", (
+        CreateIndex("ix_products_quantity", "products", "quantity_available", unique=True),
+    ))
+    assert await upgrade(migrated, [migration]) == ["0100"]
+
+    async with migrated.connect() as conn:
+        valid = await conn.execute(text(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = 'ix_products_quantity'::regclass"
+        ))
+        assert valid.scalar_one() is True
+
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_after_failure(schema_engines):
+    migrated, _ = schema_engines
+    await create_models(migrated)
+    await seed_products(migrated, [1, 2, 3, 4, 5, 6, 7, 0, 9, 10])
+    migration = Migration("0100", "Заполнение резерва", (
+        Backfill("products", "product_id", "quantity_reserved = 100 / quantity_available", batch_size=3),
+    ))
+
+    # третья пачка (7, 8, 9) падает на делении на ноль, первые две уже закоммичены
+    with pytest.raises(DBAPIError):
+        await upgrade(migrated, [migration])
+
+    async with migrated.begin() as conn:
+        reserved = await conn.execute(text("SELECT quantity_reserved FROM products ORDER BY product_id"))
+        assert reserved.scalars().all() == [100, 50, 33, 25, 20, 16, 0, 0, 0, 0]
+        await conn.execute(text("UPDATE products SET quantity_available = 8 WHERE product_id = 8"))
+        # по первой пачке шаг уже прошел и не должен ее пересчитывать
+        await conn.execute(text("UPDATE products SET quantity_available = 50 WHERE product_id = 1"))
+
+    assert await upgrade(migrated, [migration]) == ["0100"]
+    async with migrated.connect() as conn:
+        reserved = await conn.execute(text("SELECT quantity_reserved FROM products ORDER BY product_id"))
+        assert reserved.scalars().all() == [100, 50, 33, 25, 20, 16, 14, 12, 11, 10]
+        checkpoint = await conn.execute(text("SELECT last_key, rows_updated FROM schema_migration_checkpoints"))
+        assert checkpoint.one() == (10, 10)
+
+
+@pytest.mark.asyncio
+async def test_index_audit_reports_unindexed_foreign_keys(schema_engines):
+    migrated, _ = schema_engines
+    await upgrade(migrated)
+
+    async with migrated.connect() as conn:
+        assert await find_unindexed_foreign_keys(conn) == []
+
+        await conn.execute(text("DROP INDEX ix_order_items_product_id"))
+        await conn.execute(text("DROP INDEX ix_orders_user_id_created_at"))
+        rows = await find_unindexed_foreign_keys(conn)
+        assert [(row.table_name, row.columns) for row in rows] == [
+            ("order_items", ["product_id"]),
+            ("orders", ["user_id"]),
+        ]
+        await conn.rollback()
+
+
+@pytest.mark.asyncio
+async def test_index_audit_reports_seq_scan_heavy_tables(schema_engines):
+    migrated, _ = schema_engines
+    await upgrade(migrated)
+
+    async with migrated.connect() as conn:
+        await conn.execute(text(
+            "INSERT INTO products (manufacturer, name, unit, price, quantity_available) "
+            "SELECT 'М', 'Кирпич ' || i, 'шт', 10, 1 FROM generate_series(1, 100) AS i"
+        ))
+        await conn.commit()
+        for _ in range(3):
+            await conn.execute(text("SELECT count(*) FROM products WHERE name = 'Кирпич 7'"))
+        await conn.execute(text("SELECT pg_stat_force_next_flush()"))
+        await conn.commit()
+
+        rows = await find_seq_scan_heavy_tables(conn, min_rows=50)
+        assert [row.table_name for row in rows] == ["products"]
+        assert rows[0].seq_scan >= 3
+        assert await find_seq_scan_heavy_tables(conn, min_rows=1000) == []
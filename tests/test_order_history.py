@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core import encryption
+from app.core.security import create_access_token
+from app.features.orders.history import decode_cursor, encode_cursor
+from app.models.order import Order
+from app.models.order_item import OrderItem
+from app.models.product import Product
+
+
+async def create_orders(db, user_id, count, base=datetime(2026, 1, 1, tzinfo=timezone.utc)):
+    product = Product(manufacturer="М", name="Цемент", unit="шт", price=100, quantity_available=0)
+    db.add(product)
+    await db.flush()
+    orders = []
+    for i in range(count):
+        order = Order.create_with_encryption(
+            user_id=user_id, order_email=f"o{i}@example.com", total_price=100 * (i + 1), address=f"Адрес {i}"
+        )
+        # пары заказов с одинаковым временем проверяют разрешение ничьих по order_id
+        order.created_at = base + timedelta(minutes=i // 2)
+        orders.append(order)
+    db.add_all(orders)
+    await db.flush()
+    db.add_all([
+        OrderItem(order_id=order.order_id, product_id=product.product_id, quantity=i + 1,
+                  price_per_unit=100, total=100 * (i + 1))
+        for i, order in enumerate(orders)
+    ])
+    await db.commit()
+    return [order.order_id for order in orders]
+
+
+def login(client, user_id):
+    client.cookies.set("access_token", create_access_token(user_id=user_id, role="client"))
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("не курсор")
+
+
+@pytest.mark.asyncio
+async def test_history_pages_by_keyset(async_app_client, db, factory):
+    client, _ = async_app_client
+    owner, other = [user.user_id for user in await factory.users(2)]
+    order_ids = await create_orders(db, owner, 7)
+    await create_orders(db, other, 3)
+    login(client, owner)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3} | ({"cursor": cursor} if cursor else {})
+        response = await client.get("/profile/orders/api", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(page["orders"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    # от новых к старым, при равном времени - по убыванию id, без пропусков и повторов
+    assert [order["order_id"] for order in seen] == sorted(order_ids, reverse=True)
+    newest = seen[0]
+    assert newest["items_count"] == 1
+    assert newest["items_quantity"] == 7
+    assert newest["address"] == "Адрес 6"
+    assert newest["order_email"] == "o6@example.com"
+
+
+@pytest.mark.asyncio
+async def test_history_decrypts_only_visible_page(async_app_client, db, monkeypatch, factory):
+    client, _ = async_app_client
+    owner = (await factory.user()).user_id
+    await create_orders(db, owner, 10)
+    login(client, owner)
+
+    decrypted = []
+    original = encryption.encryption_service.decrypt_many_async
+
+    async def counting(values):
+        decrypted.extend(values)
+        return await original(values)
+
+    monkeypatch.setattr(encryption.encryption_service, "decrypt_many_async", counting)
+    response = await client.get("/profile/orders/api", params={"limit": 4})
+    assert response.status_code == 200
+    assert len(response.json()["orders"]) == 4
+    # email и адрес для четырех заказов, строка-признак следующей страницы не трогается
+    assert len(decrypted) == 8
+
+
+@pytest.mark.asyncio
+async def test_history_rejects_bad_cursor(async_app_client, factory):
+    client, _ = async_app_client
+    owner = (await factory.user()).user_id
+    login(client, owner)
+
+    response = await client.get("/profile/orders/api", params={"cursor": "мусор"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_history_html_page(async_app_client, db, factory):
+    client, _ = async_app_client
+    owner = (await factory.user()).user_id
+    order_ids = await create_orders(db, owner, 3)
+    login(client, owner)
+
+    response = await client.get("/profile/orders")
+    assert response.status_code == 200
+    for order_id in order_ids:
+        assert f"Заказ #{order_id}" in response.text
+    assert "Показать более ранние" not in response.text
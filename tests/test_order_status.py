@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.features.orders.status import TRANSITIONS, can_transition, transition_orders
+from app.models.order import Order, OrderStatus
+from app.models.order_status_change import OrderStatusChange
+from app.models.product import Product
+from tests.test_staff import staff_client
+from tests.test_staff_orders import create_orders
+
+
+async def set_status(db, order_ids, status):
+    for order_id in order_ids:
+        (await db.get(Order, order_id)).status = status
+    await db.commit()
+
+
+def test_transition_table():
+    assert can_transition(OrderStatus.NEW, OrderStatus.PAID)
+    assert can_transition(OrderStatus.PAID, OrderStatus.CANCELLED)
+    assert not can_transition(OrderStatus.NEW, OrderStatus.SHIPPED)
+    assert not can_transition(OrderStatus.SHIPPED, OrderStatus.CANCELLED)
+    # из завершенных статусов выхода нет
+    assert TRANSITIONS[OrderStatus.DELIVERED] == frozenset()
+    assert TRANSITIONS[OrderStatus.CANCELLED] == frozenset()
+
+
+@pytest.mark.asyncio
+async def test_new_orders_start_as_new(db, factory):
+    products = await factory.products(0)
+    customer = await factory.user()
+    (order_id,) = await create_orders(db, customer, [1], products)
+    db.expunge_all()
+    assert (await db.get(Order, order_id)).status == OrderStatus.NEW
+
+
+@pytest.mark.asyncio
+async def test_bulk_transition_is_one_statement(db, engine, factory):
+    products = await factory.products(0)
+    customer = await factory.user()
+    order_ids = await create_orders(db, customer, list(range(1, 21)), products)
+    staff = await factory.user()
+    await set_status(db, order_ids[:5], OrderStatus.DELIVERED)
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        updated, rejected = await transition_orders(db, order_ids + [999999], OrderStatus.PAID, staff.user_id)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    assert len(statements) == 1
+    assert updated == order_ids[5:]
+    assert rejected == order_ids[:5] + [999999]
+
+    history = (await db.execute(
+        select(OrderStatusChange.order_id, OrderStatusChange.from_status, OrderStatusChange.to_status,
+               OrderStatusChange.changed_by)
+        .order_by(OrderStatusChange.order_id)
+    )).all()
+    assert history == [(order_id, OrderStatus.NEW, OrderStatus.PAID, staff.user_id) for order_id in order_ids[5:]]
+
+
+@pytest.mark.asyncio
+async def test_cancel_returns_stock(db, factory):
+    products = await factory.products(0, 0)
+    customer = await factory.user()
+    order_ids = await create_orders(db, customer, [1, 2, 3], products)
+    await set_status(db, order_ids[2:], OrderStatus.SHIPPED)
+
+    updated, rejected = await transition_orders(db, order_ids, OrderStatus.CANCELLED, None)
+    assert updated == order_ids[:2]
+    assert rejected == order_ids[2:]
+
+    db.expunge_all()
+    stock = await db.execute(select(Product.quantity_available).order_by(Product.product_id))
+    # в каждом заказе по 2 шт каждого товара, отгруженный заказ не возвращается
+    assert stock.scalars().all() == [4, 4]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_transitions_follow_state_machine(db, engine, factory):
+    products = await factory.products(0)
+    customer = await factory.user()
+    (order_id,) = await create_orders(db, customer, [1], products)
+    await set_status(db, [order_id], OrderStatus.PAID)
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def move(to_status):
+        async with session_factory() as session:
+            updated, _ = await transition_orders(session, [order_id], to_status, None)
+            return bool(updated)
+
+    results = await asyncio.gather(move(OrderStatus.SHIPPED), move(OrderStatus.CANCELLED))
+    assert sorted(results) == [False, True]
+    history = (await db.execute(select(OrderStatusChange.from_status))).scalars().all()
+    assert history == [OrderStatus.PAID]
+
+
+@pytest.mark.asyncio
+async def test_staff_status_endpoints(async_app_client, db, factory):
+    client = await staff_client(async_app_client, factory)
+    products = await factory.products(0)
+    customer = await factory.user()
+    order_ids = await create_orders(db, customer, [1, 2, 3], products)
+
+    response = await client.post("/staff/orders/status/bulk",
+                                 json={"order_ids": order_ids[:2], "status": "PAID"})
+    assert response.json() == {"updated": order_ids[:2], "rejected": []}
+
+    response = await client.get("/staff/orders/api", params={"status": "PAID"})
+    assert [order["order_id"] for order in response.json()["orders"]] == order_ids[1::-1]
+
+    response = await client.post(f"/staff/orders/{order_ids[2]}/status", data={"status": "DELIVERED"})
+    assert response.status_code == 303
+    assert "error" in response.headers["location"]
+
+    response = await client.post(f"/staff/orders/{order_ids[0]}/status", data={"status": "SHIPPED"})
+    assert "message" in response.headers["location"]
+    detail = (await client.get(f"/staff/orders/{order_ids[0]}/api")).json()
+    assert detail["status"] == "SHIPPED"
+    assert detail["allowed_statuses"] == ["DELIVERED"]
+    assert [change["to_status"] for change in detail["status_history"]] == ["PAID", "SHIPPED"]
+
+    response = await client.get(f"/staff/orders/{order_ids[0]}")
+    assert "Сменить статус" in response.text
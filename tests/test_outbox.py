@@ -0,0 +1,139 @@
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.settings import settings
+from app.infra.email import EmailSender
+from app.infra.outbox import OutboxDispatcher
+from app.models.outbox_message import OutboxMessage
+from tests.test_checkout import checkout, fill_cart
+
+
+class CollectingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.fail_for = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.fail_for:
+            return "550 mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append((envelope.rcpt_tos[0], envelope.content.decode("utf-8", "replace")))
+        return "250 Message accepted"
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = CollectingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", port)
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(settings, "SMTP_USER", None)
+    monkeypatch.setattr(settings, "SMTP_PASSWORD", None)
+    yield handler
+    controller.stop()
+
+
+async def place_orders(db, engine, factory, count):
+    user_ids = [user.user_id for user in await factory.users(count)]
+    product_id = (await factory.product(quantity_available=count)).product_id
+    for user_id in user_ids:
+        await fill_cart(db, user_id, {product_id: 1})
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    for user_id in user_ids:
+        assert await checkout(session_factory, user_id) is True
+    return session_factory, user_ids
+
+
+@pytest.mark.asyncio
+async def test_checkout_enqueues_confirmation(db, engine, factory):
+    _, (user_id,) = await place_orders(db, engine, factory, 1)
+
+    message = (await db.execute(select(OutboxMessage))).scalar_one()
+    assert message.kind == "order_confirmation"
+    assert message.sent_at is None
+    assert message.attempts == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_checkout_enqueues_nothing(db, engine, factory):
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=1)).product_id
+    await fill_cart(db, user_id, {product_id: 5})
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    assert await checkout(session_factory, user_id) is False
+    assert (await db.execute(select(func.count()).select_from(OutboxMessage))).scalar_one() == 0
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_sends_batches_over_one_connection(db, engine, smtp, monkeypatch, factory):
+    monkeypatch.setattr(settings, "OUTBOX_BATCH_SIZE", 2)
+    session_factory, user_ids = await place_orders(db, engine, factory, 5)
+
+    sender = EmailSender()
+    dispatcher = OutboxDispatcher(sender)
+    try:
+        assert await dispatcher.dispatch_pending(session_factory) == 5
+    finally:
+        await sender.close()
+
+    assert sorted(to for to, _ in smtp.messages) == sorted(f"buyer{user_id}@example.com" for user_id in user_ids)
+    assert len(smtp.sessions) == 1
+    pending = await db.execute(select(func.count()).select_from(OutboxMessage).where(OutboxMessage.sent_at.is_(None)))
+    assert pending.scalar_one() == 0
+
+    # отправленное не уходит повторно
+    assert await dispatcher.dispatch_pending(session_factory) == 0
+    assert len(smtp.messages) == 5
+
+
+@pytest.mark.asyncio
+async def test_failed_message_is_retried_later(db, engine, smtp, factory):
+    session_factory, (ok_user, bad_user) = await place_orders(db, engine, factory, 2)
+    smtp.fail_for.add(f"buyer{bad_user}@example.com")
+
+    sender = EmailSender()
+    dispatcher = OutboxDispatcher(sender)
+    try:
+        assert await dispatcher.dispatch_pending(session_factory) == 2
+    finally:
+        await sender.close()
+
+    assert [to for to, _ in smtp.messages] == [f"buyer{ok_user}@example.com"]
+    rows = (await db.execute(
+        select(OutboxMessage.sent_at, OutboxMessage.attempts, OutboxMessage.last_error,
+               OutboxMessage.next_attempt_at > func.now())
+        .order_by(OutboxMessage.outbox_message_id)
+    )).all()
+    assert rows[0].sent_at is not None
+    failed = rows[1]
+    assert failed.sent_at is None
+    assert failed.attempts == 1
+    assert "550" in failed.last_error
+    assert failed[3] is True
+
+    # до наступления next_attempt_at сообщение не берется
+    assert await dispatcher.dispatch_pending(session_factory) == 0
+
+    smtp.fail_for.clear()
+    await db.execute(update(OutboxMessage).values(next_attempt_at=func.now()))
+    await db.commit()
+    try:
+        assert await dispatcher.dispatch_pending(session_factory) == 1
+    finally:
+        await sender.close()
+    assert len(smtp.messages) == 2
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app.core.security import hash_refresh_token
+from app.core.settings import settings
+from app.features.auth.service import auth_service
+from app.models.refresh_token import RefreshToken
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_is_stored_hashed(db, factory):
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+
+    result = await db.execute(select(RefreshToken).where(RefreshToken.user_id == user.user_id))
+    stored = result.scalar_one()
+    assert stored.token_hash == hash_refresh_token(token)
+    assert stored.token_hash != token
+
+
+@pytest.mark.asyncio
+async def test_rotate_refresh_token_is_single_use(db, factory):
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+
+    rotated = await auth_service.rotate_refresh_token(db, token)
+    assert rotated is not None
+    rotated_user, new_token = rotated
+    assert rotated_user.user_id == user.user_id
+    assert new_token != token
+
+    # повтор сразу после ротации получает того же преемника
+    assert await auth_service.rotate_refresh_token(db, token) == (rotated_user, new_token)
+    assert await auth_service.rotate_refresh_token(db, new_token) is not None
+    # преемник уже погашен - старый токен больше не действует
+    assert await auth_service.rotate_refresh_token(db, token) is None
+
+
+@pytest.mark.asyncio
+async def test_rotated_token_is_rejected_after_grace_window(db, factory):
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+    assert await auth_service.rotate_refresh_token(db, token) is not None
+
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == hash_refresh_token(token))
+        .values(revoked_at=func.now() - timedelta(seconds=settings.REFRESH_TOKEN_REUSE_GRACE_SECONDS + 1))
+    )
+    await db.commit()
+    assert await auth_service.rotate_refresh_token(db, token) is None
+
+
+@pytest.mark.asyncio
+async def test_revoked_refresh_token_cannot_be_rotated(db, factory):
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+
+    await auth_service.revoke_refresh_token(db, token)
+    assert await auth_service.rotate_refresh_token(db, token) is None
+
+
+@pytest.mark.asyncio
+async def test_login_form_sets_refresh_cookie(async_app_client, factory, monkeypatch):
+    client, _ = async_app_client
+    monkeypatch.setattr(settings, "ACCESS_TOKEN_EXPIRE_MINUTES", 15)
+    await factory.user(email="refresh@example.com", password="StrongPass123")
+    response = await client.post(
+        "/auth/login/redirect",
+        data={"email": "refresh@example.com", "password": "StrongPass123"},
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+    assert "access_token" in response.cookies
+    assert "refresh_token" in response.cookies
+    access_cookie = next(
+        header for header in response.headers.get_list("set-cookie") if header.startswith("access_token=")
+    )
+    assert "Max-Age=900" in access_cookie
+
+
+@pytest.mark.asyncio
+async def test_access_token_silently_reissued_from_refresh_cookie(async_app_client, db, factory):
+    client, _ = async_app_client
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+
+    client.cookies.set("refresh_token", token)
+    response = await client.get("/profile/me/api")
+    assert response.status_code == 200
+    assert response.json()["user_id"] == user.user_id
+    assert "access_token" in response.cookies
+    assert response.cookies["refresh_token"] != token
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_endpoint_uses_cookie(async_app_client, db, factory):
+    client, _ = async_app_client
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+
+    client.cookies.set("refresh_token", token)
+    response = await client.post("/auth/refresh-token")
+    assert response.status_code == 200
+    assert response.json()["user_id"] == user.user_id
+
+    client.cookies.clear()
+    client.cookies.set("refresh_token", "unknown")
+    response = await client.post("/auth/refresh-token")
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_with_same_cookie_get_same_token(async_app_client, db, factory):
+    client, _ = async_app_client
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+
+    # несколько API-вызовов страницы сразу после истечения access-токена
+    client.cookies.set("refresh_token", token)
+    responses = await asyncio.gather(*(client.post("/auth/refresh-token") for _ in range(5)))
+
+    assert [response.status_code for response in responses] == [200] * 5
+    new_tokens = {response.cookies["refresh_token"] for response in responses}
+    assert len(new_tokens) == 1 and token not in new_tokens
+    active = await db.execute(
+        select(func.count()).select_from(RefreshToken)
+        .where(RefreshToken.user_id == user.user_id, RefreshToken.revoked_at.is_(None))
+    )
+    assert active.scalar_one() == 1
+
+
+@pytest.mark.asyncio
+async def test_logout_revokes_refresh_token(async_app_client, db, factory):
+    client, _ = async_app_client
+    user = await factory.user()
+    token = await auth_service.issue_refresh_token(db, user.user_id)
+
+    client.cookies.set("refresh_token", token)
+    response = await client.post("/profile/logout", follow_redirects=False)
+    assert response.status_code == 303
+
+    assert await auth_service.rotate_refresh_token(db, token) is None
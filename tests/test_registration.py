@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from unittest.mock import patch
+
+from app.core.encryption import encryption_service
+from app.features.auth.router import register
+from app.features.users.schemas import UserCreate
+from app.models.user import User
+
+
+def make_user_data(email="race@example.com"):
+    return UserCreate(
+        email=email,
+        first_name="Гонка",
+        last_name="Тестов",
+        phone="+7 999 222-33-44",
+        password="TestPassword123",
+        password_confirm="TestPassword123",
+    )
+
+
+@pytest.fixture
+def fast_hash():
+    with patch("app.features.auth.router.hash_password", return_value="$2b$12$hashedpassword"):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_register_is_single_statement(engine, db, fast_hash):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        profile = await register(make_user_data(), db)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    assert profile.email == "race@example.com"
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT INTO users")
+    assert "ON CONFLICT (email_hash) DO NOTHING" in statements[0]
+
+
+@pytest.mark.asyncio
+async def test_register_rejects_email_with_legacy_hash(db, fast_hash):
+    await register(make_user_data("legacy@example.com"), db)
+    # пользователь, которого еще не пересчитал blind_index_backfill
+    await db.execute(
+        update(User).values(email_hash=encryption_service.legacy_hash_email("legacy@example.com"))
+    )
+    await db.commit()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await register(make_user_data("Legacy@example.com"), db)
+    assert exc_info.value.status_code == 400
+    count = await db.execute(select(func.count()).select_from(User))
+    assert count.scalar_one() == 1
+
+
+@pytest.mark.asyncio
+async def test_register_rejects_case_insensitive_duplicate(db, fast_hash):
+    await register(make_user_data("dup@example.com"), db)
+    with pytest.raises(HTTPException) as exc_info:
+        await register(make_user_data("DUP@example.com"), db)
+    assert exc_info.value.status_code == 400
+    assert "уже существует" in exc_info.value.detail
+
+
+@pytest.mark.asyncio
+async def test_concurrent_registrations_create_one_user(engine, db, fast_hash):
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    attempts = 20
+
+    async def attempt():
+        async with session_factory() as session:
+            try:
+                await register(make_user_data(), session)
+                return 201
+            except HTTPException as exc:
+                return exc.status_code
+
+    results = await asyncio.gather(*(attempt() for _ in range(attempts)))
+
+    assert results.count(201) == 1
+    assert results.count(400) == attempts - 1
+    count = await db.execute(select(func.count()).select_from(User))
+    assert count.scalar_one() == 1
@@ -0,0 +1,163 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.features.cart.crud import CartCRUD
+from app.features.cart.reservations import stock_reservations
+from app.features.cart.schemas import CartItemCreate
+from app.features.orders.service import create_simple_order
+from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+from app.models.user import User
+
+
+async def stock(db, product_id):
+    row = (await db.execute(
+        select(Product.quantity_available, Product.quantity_reserved).where(Product.product_id == product_id)
+    )).one()
+    return tuple(row)
+
+
+@pytest.mark.asyncio
+async def test_last_units_cannot_be_held_twice(db, factory):
+    first, second = [user.user_id for user in await factory.users(2)]
+    product_id = (await factory.product(quantity_available=3)).product_id
+
+    assert await CartCRUD.add_to_cart(db, first, CartItemCreate(product_id=product_id, quantity=2)) is not None
+    assert await CartCRUD.add_to_cart(db, second, CartItemCreate(product_id=product_id, quantity=2)) is None
+    assert await CartCRUD.add_to_cart(db, second, CartItemCreate(product_id=product_id, quantity=1)) is not None
+
+    assert await stock(db, product_id) == (3, 3)
+
+
+@pytest.mark.asyncio
+async def test_reservation_follows_cart_quantity(db, factory):
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=10)).product_id
+
+    row = await CartCRUD.add_to_cart(db, user_id, CartItemCreate(product_id=product_id, quantity=2))
+    await CartCRUD.add_to_cart(db, user_id, CartItemCreate(product_id=product_id, quantity=3))
+    assert await stock(db, product_id) == (10, 5)
+
+    await CartCRUD.update_cart_item(db, user_id, row.cart_item_id, 4)
+    assert await stock(db, product_id) == (10, 4)
+
+    await CartCRUD.remove_from_cart(db, user_id, row.cart_item_id)
+    assert await stock(db, product_id) == (10, 0)
+    reservations = await db.execute(select(func.count()).select_from(StockReservation))
+    assert reservations.scalar_one() == 0
+
+
+@pytest.mark.asyncio
+async def test_sweeper_expires_holds_in_batches(db, engine, factory):
+    user_ids = [user.user_id for user in await factory.users(5)]
+    product_id = (await factory.product(quantity_available=10)).product_id
+    for user_id in user_ids:
+        assert await stock_reservations.hold(db, user_id, {product_id: 2}) == {product_id}
+    await db.execute(
+        update(StockReservation)
+        .where(StockReservation.user_id.in_(user_ids[:4]))
+        .values(expires_at=func.now() - timedelta(minutes=1))
+    )
+    await db.commit()
+    assert await stock(db, product_id) == (10, 10)
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    assert await stock_reservations.sweep(session_factory, batch_size=3) == 4
+
+    assert await stock(db, product_id) == (10, 2)
+    remaining = await db.execute(select(StockReservation.user_id))
+    assert remaining.scalars().all() == [user_ids[4]]
+
+
+@pytest.mark.asyncio
+async def test_checkout_turns_reservation_into_sale(db, factory):
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=5)).product_id
+    await CartCRUD.add_to_cart(db, user_id, CartItemCreate(product_id=product_id, quantity=5))
+    assert await stock(db, product_id) == (5, 5)
+
+    user = await db.get(User, user_id)
+    order = await create_simple_order(db, "buyer0@example.com", None, "Москва", user)
+
+    assert order.order_id is not None
+    assert await stock(db, product_id) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_hold_waits_for_concurrent_expiry(db, engine, factory):
+    user_id = (await factory.user()).user_id
+    product_id = (await factory.product(quantity_available=10)).product_id
+    await stock_reservations.hold(db, user_id, {product_id: 3})
+    await db.execute(update(StockReservation).values(expires_at=func.now() - timedelta(minutes=1)))
+    await db.commit()
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    deleted, release = asyncio.Event(), asyncio.Event()
+
+    async def expire():
+        async with session_factory() as session:
+            commit = session.commit
+
+            async def delayed_commit():
+                # резерв уже удален и вычтен, но транзакция еще открыта
+                deleted.set()
+                await release.wait()
+                await commit()
+
+            session.commit = delayed_commit
+            return await stock_reservations.expire(session, 100)
+
+    async def hold():
+        async with session_factory() as session:
+            held = await stock_reservations.hold(session, user_id, {product_id: 5})
+            await session.commit()
+            return held
+
+    expiring = asyncio.create_task(expire())
+    await deleted.wait()
+    holding = asyncio.create_task(hold())
+    await asyncio.sleep(0.2)
+    release.set()
+
+    assert await expiring == 1
+    assert await holding == {product_id}
+    db.expire_all()
+    assert await stock(db, product_id) == (10, 5)
+    reserved = await db.execute(select(StockReservation.quantity))
+    assert reserved.scalars().all() == [5]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_holds_and_sweep_do_not_deadlock(db, engine, factory):
+    user_ids = [user.user_id for user in await factory.users(30)]
+    product_ids = [product.product_id for product in await factory.products(*[1000] * 60)]
+    sweeper_victims, buyers = user_ids[:10], user_ids[10:]
+    for user_id in sweeper_victims:
+        await stock_reservations.hold(db, user_id, {product_id: 1 for product_id in product_ids[::-1]})
+    await db.execute(update(StockReservation).values(expires_at=func.now() - timedelta(minutes=1)))
+    await db.commit()
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def hold(i, user_id):
+        # у половины покупателей товары идут в обратном порядке
+        ordered = product_ids if i % 2 else product_ids[::-1]
+        async with session_factory() as session:
+            held = await stock_reservations.hold(session, user_id, {product_id: 2 for product_id in ordered})
+            await session.commit()
+            return len(held)
+
+    results = await asyncio.gather(
+        stock_reservations.sweep(session_factory, batch_size=50),
+        *(hold(i, user_id) for i, user_id in enumerate(buyers)),
+    )
+
+    assert results[1:] == [len(product_ids)] * len(buyers)
+    # резервы, пропущенные занятой чисткой, снимаются следующим проходом
+    await stock_reservations.sweep(session_factory, batch_size=50)
+    reserved = await db.execute(select(Product.quantity_reserved).distinct())
+    assert reserved.scalars().all() == [2 * len(buyers)]
@@ -0,0 +1,107 @@
+import hashlib
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.encryption import encryption_service
+from app.core.security import create_access_token
+from app.models.user import User, UserRole
+
+
+async def staff_client(async_app_client, factory):
+    client, _ = async_app_client
+    staff = await factory.user(email="staff@example.com", role=UserRole.STAFF)
+    client.cookies.set("access_token", create_access_token(user_id=staff.user_id, role=staff.role.value))
+    return client
+
+
+def test_email_hash_is_keyed():
+    email = "ivan@example.com"
+    assert encryption_service.hash_email(email) != hashlib.sha256(email.encode()).hexdigest()
+    assert encryption_service.hash_email(" IVAN@example.com ") == encryption_service.hash_email(email)
+
+
+def test_phone_hash_uses_normalized_phone():
+    expected = encryption_service.hash_phone("+7 999 111-22-33")
+    assert encryption_service.hash_phone("89991112233") == expected
+    assert encryption_service.hash_phone("9991112233") == expected
+    assert encryption_service.hash_phone("") is None
+
+
+@pytest.mark.asyncio
+async def test_update_encrypted_data_maintains_phone_hash(factory):
+    user = await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    user.update_encrypted_data(phone="+7 999 444-55-66")
+    assert user.phone_hash == encryption_service.hash_phone("89994445566")
+
+
+@pytest.mark.asyncio
+async def test_staff_search_by_phone(async_app_client, factory):
+    client = await staff_client(async_app_client, factory)
+    await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    await factory.user(email="petr@example.com", phone="+7 999 444-55-66")
+
+    response = await client.get("/staff/customers/search", params={"phone": "8 (999) 111-22-33"})
+    assert response.status_code == 200
+    assert [item["email"] for item in response.json()] == ["ivan@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_staff_search_by_email(async_app_client, factory):
+    client = await staff_client(async_app_client, factory)
+    await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+
+    response = await client.get("/staff/customers/search", params={"email": "Ivan@Example.com"})
+    assert response.status_code == 200
+    assert [item["phone"] for item in response.json()] == ["+7 999 111-22-33"]
+
+
+@pytest.mark.asyncio
+async def test_staff_search_requires_query(async_app_client, factory):
+    client = await staff_client(async_app_client, factory)
+    response = await client.get("/staff/customers/search")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_staff_search_forbidden_for_clients(async_app_client, factory):
+    client, _ = async_app_client
+    user = await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    client.cookies.set("access_token", create_access_token(user_id=user.user_id, role=user.role.value))
+
+    response = await client.get("/staff/customers/search", params={"email": "ivan@example.com"})
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_backfill_replaces_legacy_hashes(engine, db, factory):
+    from app.infra.blind_index_backfill import backfill_blind_indexes
+
+    user = await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    user.email_hash = encryption_service.legacy_hash_email("ivan@example.com")
+    user.phone_hash = None
+    await db.commit()
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    assert await backfill_blind_indexes(session_factory, batch_size=10, rows_per_second=0) == 1
+    assert await backfill_blind_indexes(session_factory, batch_size=10, rows_per_second=0) == 0
+
+    await db.refresh(user)
+    assert user.email_hash == encryption_service.hash_email("ivan@example.com")
+    assert user.phone_hash == encryption_service.hash_phone("+7 999 111-22-33")
+
+
+@pytest.mark.asyncio
+async def test_login_upgrades_legacy_email_hash(db, factory):
+    from app.features.auth.service import auth_service
+
+    user = await factory.user(email="ivan@example.com", password="StrongPass123")
+    user.email_hash = encryption_service.legacy_hash_email("ivan@example.com")
+    await db.commit()
+
+    authenticated = await auth_service.authenticate_user(db, "ivan@example.com", "StrongPass123")
+    assert authenticated.user_id == user.user_id
+
+    result = await db.execute(select(User.email_hash).where(User.user_id == user.user_id))
+    assert result.scalar_one() == encryption_service.hash_email("ivan@example.com")
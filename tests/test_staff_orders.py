@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+
+from app.core.security import create_access_token
+from app.features.staff.orders import get_order_detail
+from app.models.order import Order
+from app.models.order_item import OrderItem
+from tests.test_staff import staff_client
+
+
+async def create_orders(db, user, days, products):
+    orders = []
+    for i, day in enumerate(days):
+        order = Order.create_with_encryption(
+            user_id=user.user_id, order_email=user.email, total_price=0, address=f"Склад {i}"
+        )
+        order.created_at = datetime(2026, 5, day, 12, tzinfo=timezone.utc)
+        orders.append(order)
+    db.add_all(orders)
+    await db.flush()
+    for order in orders:
+        for product in products:
+            db.add(OrderItem(order_id=order.order_id, product_id=product.product_id, quantity=2,
+                             price_per_unit=product.price, total=product.price * 2))
+        order.total_price = sum(product.price * 2 for product in products)
+    await db.commit()
+    return [order.order_id for order in orders]
+
+
+@pytest.mark.asyncio
+async def test_staff_orders_filter_and_paginate(async_app_client, db, factory):
+    client = await staff_client(async_app_client, factory)
+    products = await factory.products(0, 0)
+    ivan = await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    olga = await factory.user(email="olga@example.com", phone="+7 999 444-55-66")
+    ivan_orders = await create_orders(db, ivan, [1, 2, 3, 10], products)
+    olga_orders = await create_orders(db, olga, [2, 5], products)
+
+    response = await client.get("/staff/orders/api", params={"email": "Ivan@Example.com"})
+    assert response.status_code == 200
+    page = response.json()
+    assert [order["order_id"] for order in page["orders"]] == ivan_orders[::-1]
+    assert page["orders"][0]["items_count"] == 2
+    assert page["orders"][0]["order_email"] == "ivan@example.com"
+
+    response = await client.get("/staff/orders/api", params={"date_from": "2026-05-02", "date_to": "2026-05-05"})
+    assert [order["order_id"] for order in response.json()["orders"]] == [
+        olga_orders[1], ivan_orders[2], olga_orders[0], ivan_orders[1]
+    ]
+
+    response = await client.get("/staff/orders/api", params={"email": "nobody@example.com"})
+    assert response.json() == {"orders": [], "next_cursor": None}
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 4, "phone": "8 999 111 22 33"} | ({"cursor": cursor} if cursor else {})
+        page = (await client.get("/staff/orders/api", params=params)).json()
+        seen.extend(order["order_id"] for order in page["orders"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ivan_orders[::-1]
+
+
+@pytest.mark.asyncio
+async def test_staff_order_detail_loads_in_fixed_queries(db, engine, factory):
+    products = await factory.products(*[0] * 5)
+    customer = await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    (order_id,) = await create_orders(db, customer, [1], products)
+    db.expunge_all()
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        order = await get_order_detail(db, order_id)
+        names = [item.product.name for item in order.items]
+        customer_email = order.user.email
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    # заказ с клиентом, позиции, товары, история - без запроса на каждую позицию
+    assert len(statements) == 4
+    assert sorted(names) == [f"Товар {i}" for i in range(5)]
+    assert customer_email == "ivan@example.com"
+
+
+@pytest.mark.asyncio
+async def test_staff_order_pages_render(async_app_client, db, factory):
+    client = await staff_client(async_app_client, factory)
+    products = await factory.products(0, 0)
+    customer = await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    (order_id,) = await create_orders(db, customer, [1], products)
+
+    response = await client.get("/staff/orders")
+    assert response.status_code == 200
+    assert f"Заказ #{order_id}" in response.text
+
+    response = await client.get(f"/staff/orders/{order_id}")
+    assert response.status_code == 200
+    assert "Товар 1 × 2" in response.text
+    assert "Склад 0" in response.text
+
+    response = await client.get(f"/staff/orders/{order_id}/api")
+    assert response.json()["customer_phone"] == "+7 999 111-22-33"
+
+    assert (await client.get("/staff/orders/999999")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_staff_orders_forbidden_for_clients(async_app_client, factory):
+    client, _ = async_app_client
+    customer = await factory.user(email="ivan@example.com", phone="+7 999 111-22-33")
+    client.cookies.set("access_token", create_access_token(user_id=customer.user_id, role=customer.role.value))
+
+    assert (await client.get("/staff/orders/api")).status_code == 403
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.security import create_access_token, decode_access_token
+from app.features.auth.revocation import TokenRevocationList, revocation_list
+
+
+def test_access_token_has_unique_jti():
+    first = decode_access_token(create_access_token(user_id=1, role="CLIENT"))
+    second = decode_access_token(create_access_token(user_id=1, role="CLIENT"))
+    assert first["jti"] and second["jti"]
+    assert first["jti"] != second["jti"]
+
+
+@pytest.mark.asyncio
+async def test_revoked_jti_is_visible_to_other_workers_after_sync(db):
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    local = TokenRevocationList()
+    await local.revoke(db, "jti-1", expires_at)
+    assert local.is_revoked("jti-1")
+
+    other_worker = TokenRevocationList()
+    assert not other_worker.is_revoked("jti-1")
+    assert await other_worker.sync(db) == 1
+    assert other_worker.is_revoked("jti-1")
+
+    await local.revoke(db, "jti-2", expires_at)
+    await other_worker.sync(db)
+    assert other_worker.is_revoked("jti-2")
+
+
+@pytest.mark.asyncio
+async def test_expired_revocations_are_not_loaded(db):
+    local = TokenRevocationList()
+    await local.revoke(db, "old-jti", datetime.now(timezone.utc) - timedelta(minutes=1))
+
+    other_worker = TokenRevocationList()
+    await other_worker.sync(db)
+    assert not other_worker.is_revoked("old-jti")
+    assert len(other_worker) == 0
+
+
+@pytest.mark.asyncio
+async def test_logout_revokes_access_token(async_app_client, factory):
+    client, _ = async_app_client
+    user = await factory.user()
+    token = create_access_token(user_id=user.user_id, role=user.role.value)
+
+    client.cookies.set("access_token", token)
+    assert (await client.get("/profile/me/api")).status_code == 200
+
+    response = await client.post("/profile/logout", follow_redirects=False)
+    assert response.status_code == 303
+
+    client.cookies.clear()
+    client.cookies.set("access_token", token)
+    assert (await client.get("/profile/me/api")).status_code == 401
+
+    verify = await client.post("/auth/verify-token", headers={"Authorization": f"Bearer {token}"})
+    assert verify.json()["valid"] is False
+    revocation_list.clear()